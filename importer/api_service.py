@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    from .config import CONFIG
+    from .db import ConnectionPool
+    from .export_service import export_items_file, export_partners_file
+    from .import_service import import_items_file, import_partners_file
+except ImportError:
+    from config import CONFIG
+    from db import ConnectionPool
+    from export_service import export_items_file, export_partners_file
+    from import_service import import_items_file, import_partners_file
+
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+JOB_LOG_LINES = 50
+PRUNE_INTERVAL = 60
+
+# File signatures: .xls is an OLE2 compound document, .xlsx a zip archive.
+UPLOAD_SIGNATURES = {b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1': '.xls', b'PK\x03\x04': '.xlsx'}
+UPLOAD_SUFFIXES = ('.xlsx', '.xls')
+
+# (kind, operation) -> (callable, writes to the database)
+JOB_OPERATIONS = {
+    ('import', 'items'): (import_items_file, True),
+    ('import', 'partners'): (import_partners_file, True),
+    ('export', 'items'): (export_items_file, False),
+    ('export', 'partners'): (export_partners_file, False),
+}
+
+HTTP_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _upload_suffix(body, query):
+    requested = (query.get('ext') or [''])[0].strip().lower()
+    if requested:
+        suffix = requested if requested.startswith('.') else f'.{requested}'
+        if suffix not in UPLOAD_SUFFIXES:
+            raise HttpError(400, f"Невалиден параметър ext={requested} (допустими: {', '.join(UPLOAD_SUFFIXES)})")
+        return suffix
+    return next((suffix for signature, suffix in UPLOAD_SIGNATURES.items() if body.startswith(signature)), '.xlsx')
+
+
+def _write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _public_job(job):
+    public = {key: value for key, value in job.items() if key not in ('log', 'source_file', 'finished')}
+    public['log'] = list(job['log'])
+    return public
+
+
+async def _read_request(reader, max_body):
+    request_line = (await reader.readline()).decode('latin-1').strip()
+    if not request_line:
+        raise HttpError(400, 'Празна заявка')
+    try:
+        method, target, _ = request_line.split(' ', 2)
+    except ValueError:
+        raise HttpError(400, 'Невалидна заявка')
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line in ('\r\n', '\n', ''):
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length') or 0)
+    if length > max_body:
+        raise HttpError(413, 'Файлът е твърде голям')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, body
+
+
+def _response(status, body, content_type='application/json; charset=utf-8', extra_headers=None):
+    headers = [
+        f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}',
+        f'Content-Type: {content_type}',
+        f'Content-Length: {len(body)}',
+        'Connection: close',
+    ] + list(extra_headers or [])
+    return ('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body
+
+
+def _json_response(status, data):
+    return _response(status, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+class JobServer:
+    def __init__(self, log, config=CONFIG):
+        self.log = log
+        self.config = config
+        self.jobs = {}
+        # The event loop keeps only weak references to tasks, so running jobs are held here until they finish.
+        self.tasks = set()
+        self.write_locks = {}
+        self.pool = ConnectionPool(config, max_size=config['api_workers'])
+        self.executor = ThreadPoolExecutor(max_workers=config['api_workers'])
+        self.work_dir = config['api_dir']
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def _database_lock(self, database):
+        if database not in self.write_locks:
+            self.write_locks[database] = asyncio.Lock()
+        return self.write_locks[database]
+
+    def prune_jobs(self):
+        # Finished jobs and their export files are kept for API_JOB_TTL seconds, so a long-running
+        # server does not grow without limit in memory or in API_DIR.
+        ttl = self.config['api_job_ttl']
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        for job_id, job in list(self.jobs.items()):
+            if job['finished'] is not None and now - job['finished'] > ttl:
+                if job['result_file'] and os.path.exists(job['result_file']):
+                    os.remove(job['result_file'])
+                del self.jobs[job_id]
+
+        # Files left behind by a previous run of the server.
+        active = {os.path.basename(job[name]) for job in self.jobs.values() for name in ('source_file', 'result_file') if job[name]}
+        for entry in os.scandir(self.work_dir):
+            if entry.is_file() and entry.name not in active and time.time() - entry.stat().st_mtime > ttl:
+                os.remove(entry.path)
+
+    async def _prune_loop(self):
+        while True:
+            await asyncio.sleep(PRUNE_INTERVAL)
+            try:
+                self.prune_jobs()
+            except OSError as e:
+                self.log(f'⚠ Изчистване на стари задачи: {e}')
+
+    async def create_job(self, kind, operation, database, body, suffix='.xlsx'):
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'operation': operation,
+            'database': database,
+            'status': 'queued',
+            'created_at': _now(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None,
+            'log': deque(maxlen=JOB_LOG_LINES),
+            'source_file': None,
+            'result_file': None,
+            'finished': None,
+        }
+        loop = asyncio.get_running_loop()
+        if kind == 'import':
+            job['source_file'] = os.path.join(self.work_dir, f'{job_id}_upload{suffix}')
+            # File I/O goes to the default executor, so it neither blocks the loop nor waits behind running jobs.
+            await loop.run_in_executor(None, _write_file, job['source_file'], body)
+        else:
+            job['result_file'] = os.path.join(self.work_dir, f'{job_id}_{operation}.xlsx')
+        self.jobs[job_id] = job
+        task = loop.create_task(self.run_job(job))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    def _run_blocking(self, job):
+        func, _ = JOB_OPERATIONS[(job['kind'], job['operation'])]
+        db_config = dict(self.config, database=job['database'])
+
+        def job_log(message):
+            job['log'].append(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+            self.log(f"[job {job['id']}] {message}")
+
+        path = job['source_file'] if job['kind'] == 'import' else job['result_file']
+        with self.pool.connection(job['database']) as conn:
+            return func(path, job_log, db_config, conn=conn)
+
+    async def run_job(self, job):
+        _, writes = JOB_OPERATIONS[(job['kind'], job['operation'])]
+        loop = asyncio.get_running_loop()
+        try:
+            if writes:
+                async with self._database_lock(job['database']):
+                    job['status'] = 'running'
+                    job['started_at'] = _now()
+                    job['result'] = await loop.run_in_executor(self.executor, self._run_blocking, job)
+            else:
+                job['status'] = 'running'
+                job['started_at'] = _now()
+                job['result'] = await loop.run_in_executor(self.executor, self._run_blocking, job)
+            job['status'] = 'done'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            self.log(f"✗ [job {job['id']}] {e}")
+        finally:
+            job['finished_at'] = _now()
+            job['finished'] = time.monotonic()
+            if job['source_file'] and os.path.exists(job['source_file']):
+                os.remove(job['source_file'])
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+
+        if parts == ['jobs'] and method == 'GET':
+            return _json_response(200, [_public_job(job) for job in self.jobs.values()])
+
+        if len(parts) == 3 and parts[0] == 'jobs' and (parts[1], parts[2]) in JOB_OPERATIONS:
+            if method != 'POST':
+                raise HttpError(405, 'Използвайте POST')
+            database = (query.get('database') or [self.config['database']])[0]
+            if not database:
+                raise HttpError(400, 'Липсва параметър database')
+            if parts[1] == 'import' and not body:
+                raise HttpError(400, 'Липсва Excel файл в тялото на заявката')
+            suffix = _upload_suffix(body, query) if parts[1] == 'import' else '.xlsx'
+            job = await self.create_job(parts[1], parts[2], database, body, suffix)
+            return _json_response(202, _public_job(job))
+
+        if len(parts) >= 2 and parts[0] == 'jobs' and method == 'GET':
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, 'Няма такава задача')
+            if len(parts) == 2:
+                return _json_response(200, _public_job(job))
+            if parts[2] == 'result' and len(parts) == 3:
+                if job['status'] != 'done' or not job['result_file'] or not os.path.exists(job['result_file']):
+                    raise HttpError(404, 'Няма готов файл за тази задача')
+                content = await asyncio.get_running_loop().run_in_executor(None, _read_file, job['result_file'])
+                filename = os.path.basename(job['result_file'])
+                return _response(200, content, XLSX_CONTENT_TYPE, [f'Content-Disposition: attachment; filename="{filename}"'])
+
+        raise HttpError(404, 'Непознат адрес')
+
+    async def handle(self, reader, writer):
+        try:
+            method, target, body = await _read_request(reader, self.config['api_max_upload_mb'] * 1024 * 1024)
+            response = await self.route(method, target, body)
+        except HttpError as e:
+            response = _json_response(e.status, {'error': str(e)})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            response = _json_response(400, {'error': str(e)})
+        writer.write(response)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        self.prune_jobs()
+        prune_task = asyncio.get_running_loop().create_task(self._prune_loop())
+        server = await asyncio.start_server(self.handle, host, port)
+        self.log(f'=== HTTP API: http://{host}:{port} ===')
+        self.log('POST /jobs/import/items|partners?database=<база>[&ext=xls] (тяло: .xlsx/.xls), POST /jobs/export/items|partners')
+        self.log('GET /jobs, GET /jobs/<id>, GET /jobs/<id>/result | Ctrl+C за спиране')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            prune_task.cancel()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+
+def run_api_server(log, config=CONFIG, host=None, port=None):
+    server = JobServer(log, config)
+    try:
+        asyncio.run(server.serve(host or config['api_host'], port or config['api_port']))
+    except KeyboardInterrupt:
+        log('Спиране на HTTP API...')
+    finally:
+        server.close()
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    from .config import CONFIG
+    from .state import read_json, write_json
+except ImportError:
+    from config import CONFIG
+    from state import read_json, write_json
+
+
+INDEX_FILE = 'index.jsonl'
+CHUNK_SUFFIX = '.z'
+# A chunk never grows beyond this many times the average size, even without a boundary row.
+MAX_CHUNK_FACTOR = 4
+
+_INDEX_LOCK = threading.Lock()
+
+
+def _archive_paths(config):
+    root = config['archive_dir'] or os.path.join(config['state_dir'], 'archive')
+    paths = {
+        'root': root,
+        'objects': os.path.join(root, 'objects'),
+        'manifests': os.path.join(root, 'manifests'),
+        'index': os.path.join(root, INDEX_FILE),
+    }
+    os.makedirs(paths['objects'], exist_ok=True)
+    os.makedirs(paths['manifests'], exist_ok=True)
+    return paths
+
+
+def _chunk_path(paths, digest):
+    return os.path.join(paths['objects'], digest[:2], f'{digest}{CHUNK_SUFFIX}')
+
+
+def _row_lines(df):
+    values = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+    return [json.dumps(row, ensure_ascii=False, default=str).encode('utf-8') for row in values]
+
+
+def split_chunks(lines, chunk_rows):
+    # Boundaries depend on the row content, not its position: an added or removed row changes
+    # only the chunk that contains it, and every other chunk keeps its hash.
+    chunk_rows = max(1, chunk_rows)
+    chunks = []
+    current = []
+    for line in lines:
+        current.append(line)
+        if zlib.crc32(line) % chunk_rows == 0 or len(current) >= chunk_rows * MAX_CHUNK_FACTOR:
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _store_chunk(paths, lines):
+    data = b'\n'.join(lines)
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(paths, digest)
+    if os.path.exists(path):
+        return digest, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compressed = zlib.compress(data, 6)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, path)
+    return digest, len(compressed)
+
+
+def _load_chunk(paths, digest):
+    with open(_chunk_path(paths, digest), 'rb') as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f'Повреден блок в архива: {digest}')
+    return [json.loads(line) for line in data.split(b'\n')] if data else []
+
+
+def archive_export(kind, sheets, log, config=CONFIG, source_file=None):
+    paths = _archive_paths(config)
+    created = datetime.now()
+    archive_id = f"{created.strftime('%Y%m%d_%H%M%S_%f')}_{kind}"
+    manifest = {'id': archive_id, 'kind': kind, 'server': config['server'], 'database': config['database'], 'sheets': []}
+    stored_chunks = new_chunks = new_bytes = rows = 0
+
+    for name, df in sheets.items():
+        chunks = []
+        for lines in split_chunks(_row_lines(df), config['archive_chunk_rows']):
+            digest, size = _store_chunk(paths, lines)
+            chunks.append(digest)
+            new_chunks += 1 if size else 0
+            new_bytes += size
+        stored_chunks += len(chunks)
+        rows += len(df)
+        manifest['sheets'].append({'name': name, 'columns': list(df.columns), 'rows': len(df), 'chunks': chunks})
+
+    write_json(os.path.join(paths['manifests'], f'{archive_id}.json'), manifest)
+    entry = {
+        'id': archive_id,
+        'kind': kind,
+        'created': created.strftime('%Y-%m-%d %H:%M:%S'),
+        'server': config['server'],
+        'database': config['database'],
+        'rows': rows,
+        'chunks': stored_chunks,
+        'new_chunks': new_chunks,
+        'new_bytes': new_bytes,
+        'source_file': source_file,
+    }
+    with _INDEX_LOCK, open(paths['index'], 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    log(f'✓ Архив {archive_id}: {rows} реда, нови блокове {new_chunks}/{stored_chunks} ({new_bytes // 1024} KB)')
+    return entry
+
+
+def try_archive_export(kind, sheets, log, config=CONFIG, source_file=None):
+    # The export itself is already written; a failing archive only warns.
+    try:
+        return archive_export(kind, sheets, log, config, source_file)
+    except Exception as e:
+        log(f'⚠ Експортът не е архивиран: {e}')
+        return None
+
+
+def read_archive_index(config=CONFIG, database=None, kind=None):
+    paths = _archive_paths(config)
+    if not os.path.exists(paths['index']):
+        return []
+    entries = []
+    with open(paths['index'], 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if database and entry['database'] != database:
+                continue
+            if kind and entry['kind'] != kind:
+                continue
+            entries.append(entry)
+    return entries
+
+
+def print_archive_index(entries):
+    if not entries:
+        print('Архивът е празен.')
+        return
+    frame = pd.DataFrame(entries)
+    frame['new_kb'] = frame['new_bytes'] // 1024
+    frame = frame[['id', 'created', 'database', 'kind', 'rows', 'chunks', 'new_chunks', 'new_kb']]
+    print(frame.to_string(index=False))
+
+
+def load_archived_sheets(archive_id, config=CONFIG):
+    paths = _archive_paths(config)
+    manifest = read_json(os.path.join(paths['manifests'], f'{archive_id}.json'), None)
+    if manifest is None:
+        raise ValueError(f'Няма архив с идентификатор {archive_id}')
+    sheets = {}
+    for sheet in manifest['sheets']:
+        rows = [row for digest in sheet['chunks'] for row in _load_chunk(paths, digest)]
+        if len(rows) != sheet['rows']:
+            raise ValueError(f"Архив {archive_id}, sheet {sheet['name']}: {len(rows)} реда вместо {sheet['rows']}")
+        sheets[sheet['name']] = pd.DataFrame(rows, columns=sheet['columns'])
+    return manifest, sheets
@@ -0,0 +1,77 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+try:
+    from .workbook import apply_dtype_plan, available_excel_engines, parse_excel_sheet
+except ImportError:
+    from workbook import apply_dtype_plan, available_excel_engines, parse_excel_sheet
+
+
+DEFAULT_ROW_COUNTS = [1000, 10000, 50000, 100000]
+
+
+def build_sample_items(rows, seed=42):
+    rng = random.Random(seed)
+    measures = ['бр.', 'кг', 'л', 'м', 'пакет']
+    return pd.DataFrame(
+        {
+            'Код': [f'{i:06d}' for i in range(rows)],
+            'Стока': [f'Стока {i} {rng.choice(measures)}' for i in range(rows)],
+            'Мярка': [rng.choice(measures) for _ in range(rows)],
+            'Цена': [round(rng.uniform(0.1, 500), 2) for _ in range(rows)],
+            'ДДС ID': [f'{rng.randint(1, 4)} - ДДС' for _ in range(rows)],
+            'Група ID': [f'{rng.randint(1, 40)} - Група' for _ in range(rows)],
+            'Статус ID': [3] * rows,
+            'ДДС Срок ID': [7] * rows,
+        }
+    )
+
+
+def time_engine(path, engine, sheet_name='Items', plan='items', repeats=1):
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        with pd.ExcelFile(path, engine=engine) as xls:
+            df = apply_dtype_plan(parse_excel_sheet(xls, sheet_name, plan=plan), plan)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(df)
+
+
+def run_benchmark(files, engines, repeats=1):
+    results = []
+    for label, path in files:
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        for engine in engines:
+            seconds, rows = time_engine(path, engine, repeats=repeats)
+            results.append({'Файл': label, 'MB': round(size_mb, 2), 'Engine': engine, 'Редове': rows, 'Секунди': round(seconds, 3)})
+            print(f'{label:>12} | {size_mb:7.2f} MB | {engine:>9} | {rows:>7} реда | {seconds:8.3f} сек.')
+    return pd.DataFrame(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение на Excel engines за четене на Items.')
+    parser.add_argument('--rows', type=int, nargs='*', default=DEFAULT_ROW_COUNTS)
+    parser.add_argument('--file', action='append', default=[], help='Съществуващ файл със sheet Items')
+    parser.add_argument('--repeats', type=int, default=1)
+    args = parser.parse_args()
+
+    engines = available_excel_engines()
+    print(f"Налични engines: {', '.join(engines)}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        files = [(os.path.basename(path), path) for path in args.file]
+        for rows in args.rows:
+            path = os.path.join(temp_dir, f'items_{rows}.xlsx')
+            build_sample_items(rows).to_excel(path, index=False, sheet_name='Items')
+            files.append((f'{rows} реда', path))
+        run_benchmark(files, engines, repeats=args.repeats)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,8 @@ import os
 
 from dotenv import load_dotenv
 
-ENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_PATH = os.path.join(BASE_DIR, '.env')
 load_dotenv(dotenv_path=ENV_PATH)
 
 
@@ -21,6 +22,49 @@ CONFIG = {
     'skiprows': int(os.getenv('EXCEL_SKIPROWS', '0')),
     'trusted_connection': _to_bool(os.getenv('DB_TRUSTED_CONNECTION', 'True'), default=True),
     'login_timeout': int(os.getenv('DB_TIMEOUT', '15')),
+    'insert_batch_size': int(os.getenv('INSERT_BATCH_SIZE', '1000')),
+    'excel_engine': os.getenv('EXCEL_ENGINE', 'auto'),
+    'excel_cache': _to_bool(os.getenv('EXCEL_CACHE', 'True'), default=True),
+    'cache_dir': os.getenv('CACHE_DIR', '') or os.path.join(BASE_DIR, '.cache'),
+    'cache_max_mb': int(os.getenv('CACHE_MAX_MB', '1024')),
+    'memory_budget_mb': int(os.getenv('MEMORY_BUDGET_MB', '512')),
+    'chunk_rows': int(os.getenv('CHUNK_ROWS', '50000')),
+    'import_item_groups': _to_bool(os.getenv('IMPORT_ITEM_GROUPS', 'False'), default=False),
+    'import_group_scope': os.getenv('IMPORT_GROUP_SCOPE', 'all'),
+    'import_output': os.getenv('IMPORT_OUTPUT', 'database').strip().lower(),
+    'import_preview': _to_bool(os.getenv('IMPORT_PREVIEW', 'True'), default=True),
+    'import_pipeline': _to_bool(os.getenv('IMPORT_PIPELINE', 'True'), default=True),
+    'pipeline_chunk_rows': int(os.getenv('PIPELINE_CHUNK_ROWS', '10000')),
+    'pipeline_queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', '4')),
+    'export_items_usage': _to_bool(os.getenv('EXPORT_ITEMS_USAGE', 'False'), default=False),
+    'export_archive': _to_bool(os.getenv('EXPORT_ARCHIVE', 'False'), default=False),
+    'archive_chunk_rows': int(os.getenv('ARCHIVE_CHUNK_ROWS', '1000')),
+    'shard_rows': int(os.getenv('EXPORT_SHARD_ROWS', '500000')),
+    'export_workers': int(os.getenv('EXPORT_WORKERS', '0')),
+    'import_workers': int(os.getenv('IMPORT_WORKERS', '0')),
+    'multi_import_conflicts': os.getenv('MULTI_IMPORT_CONFLICTS', 'last').strip().lower(),
+    'multi_import_priority': os.getenv('MULTI_IMPORT_PRIORITY', ''),
+    'watch_interval': float(os.getenv('WATCH_INTERVAL', '5')),
+    'api_host': os.getenv('API_HOST', '127.0.0.1'),
+    'api_port': int(os.getenv('API_PORT', '8765')),
+    'api_workers': int(os.getenv('API_WORKERS', '4')),
+    'api_max_upload_mb': int(os.getenv('API_MAX_UPLOAD_MB', '100')),
+    'api_job_ttl': int(os.getenv('API_JOB_TTL', '3600')),
+    'api_dir': os.getenv('API_DIR', '') or os.path.join(BASE_DIR, '.api'),
+    'diff_workers': int(os.getenv('DIFF_WORKERS', '8')),
+    'verify_chunk_rows': int(os.getenv('VERIFY_CHUNK_ROWS', '1000')),
+    'purge_batch_size': int(os.getenv('PURGE_BATCH_SIZE', '500')),
+    'purge_time_budget': int(os.getenv('PURGE_TIME_BUDGET', '0')),
+    'use_replica': _to_bool(os.getenv('USE_REPLICA', 'False'), default=False),
+    'replica_max_age': int(os.getenv('REPLICA_MAX_AGE', '300')),
+    'lock_diagnostics': _to_bool(os.getenv('LOCK_DIAGNOSTICS', 'False'), default=False),
+    'lock_diagnostics_interval': float(os.getenv('LOCK_DIAGNOSTICS_INTERVAL', '0.5')),
+    'diagnostics_dir': os.getenv('DIAGNOSTICS_DIR', ''),
+    'metrics_dir': os.getenv('METRICS_DIR', ''),
+    'import_snapshots': _to_bool(os.getenv('IMPORT_SNAPSHOTS', 'True'), default=True),
+    'snapshot_keep': int(os.getenv('SNAPSHOT_KEEP', '10')),
+    'archive_dir': os.getenv('ARCHIVE_DIR', ''),
+    'state_dir': os.getenv('STATE_DIR', '') or os.path.join(BASE_DIR, '.state'),
 }
 
 EXPECTED_COLUMNS = ['Код', 'Стока', 'Мярка', 'Цена']
@@ -1,3 +1,6 @@
+import threading
+from contextlib import contextmanager
+
 import pyodbc
 
 try:
@@ -143,6 +146,25 @@ def get_connection_string(config):
     )
 
 
+def is_leading_index_column(conn, schema, table, column):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM sys.index_columns ic
+        WHERE ic.object_id = OBJECT_ID(?) AND ic.key_ordinal = 1
+          AND COL_NAME(ic.object_id, ic.column_id) = ?
+        """,
+        (f'{schema}.{table}', column),
+    )
+    indexed = cursor.fetchone()[0] > 0
+    cursor.close()
+    return indexed
+
+
+def connect_database(config):
+    return pyodbc.connect(get_connection_string(config))
+
+
 def connect_with_fallback(config, log):
     if not ensure_database_selected(config, log):
         return None
@@ -168,3 +190,54 @@ def connect_with_fallback(config, log):
         except Exception as e:
             log(f'✗ Неочаквана грешка: {e}')
             return None
+
+
+class ConnectionPool:
+    def __init__(self, config, max_size=4):
+        self.config = config
+        self.max_size = max_size
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, database):
+        with self._lock:
+            if database not in self._slots:
+                self._slots[database] = threading.BoundedSemaphore(self.max_size)
+                self._idle[database] = []
+            return self._slots[database]
+
+    @contextmanager
+    def connection(self, database):
+        slot = self._slot(database)
+        slot.acquire()
+        conn = None
+        try:
+            with self._lock:
+                conn = self._idle[database].pop() if self._idle[database] else None
+            if conn is None:
+                conn = connect_database(dict(self.config, database=database))
+            yield conn
+        except Exception:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                with self._lock:
+                    self._idle[database].append(conn)
+            slot.release()
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._idle = {database: [] for database in self._idle}
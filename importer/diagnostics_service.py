@@ -0,0 +1,290 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    from .config import CONFIG
+    from .db import connect_database
+    from .metrics import listen_stages
+    from .state import database_state_dir
+except ImportError:
+    from config import CONFIG
+    from db import connect_database
+    from metrics import listen_stages
+    from state import database_state_dir
+
+
+TOP_WAITS = 10
+SQL_TEXT_LENGTH = 200
+# Waits every session accumulates while idle or between requests; they say nothing about blocking.
+IGNORED_WAITS = ('SLEEP_', 'LAZYWRITER_SLEEP', 'BROKER_', 'XE_', 'SQLTRACE_', 'WAITFOR', 'CLR_AUTO_EVENT')
+
+REQUESTS_SQL = f"""
+    SELECT r.session_id, r.blocking_session_id, r.status, r.command, r.wait_type, r.wait_time, r.wait_resource,
+           s.program_name, s.host_name, LEFT(t.text, {SQL_TEXT_LENGTH})
+    FROM sys.dm_exec_requests r
+    JOIN sys.dm_exec_sessions s ON s.session_id = r.session_id
+    OUTER APPLY sys.dm_exec_sql_text(r.sql_handle) t
+    WHERE r.session_id <> @@SPID AND (r.database_id = DB_ID() OR r.session_id = ? OR r.blocking_session_id <> 0)
+"""
+IDLE_BLOCKERS_SQL = """
+    SELECT s.session_id, s.status, s.program_name, s.host_name
+    FROM sys.dm_exec_sessions s
+    WHERE s.session_id IN ({ids})
+"""
+LOCKS_SQL = """
+    SELECT resource_type, request_mode, request_status, COUNT(*)
+    FROM sys.dm_tran_locks
+    WHERE request_session_id = ?
+    GROUP BY resource_type, request_mode, request_status
+"""
+SESSION_WAITS_SQL = """
+    SELECT wait_type, waiting_tasks_count, wait_time_ms
+    FROM sys.dm_exec_session_wait_stats
+    WHERE session_id = ?
+"""
+ESCALATIONS_SQL = """
+    SELECT OBJECT_NAME(object_id), SUM(index_lock_promotion_count)
+    FROM sys.dm_db_index_operational_stats(DB_ID(), NULL, NULL, NULL)
+    WHERE object_id IN ({objects})
+    GROUP BY object_id
+"""
+
+
+def _rows(cursor, sql, params=()):
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def build_blocking_chains(requests, sessions):
+    # requests: session_id -> blocking_session_id for every blocked request; each chain ends at a
+    # session that is not blocked itself (the head blocker).
+    chains = []
+    for session_id, blocker in requests.items():
+        chain = [session_id]
+        while blocker and blocker not in chain:
+            chain.append(blocker)
+            blocker = requests.get(blocker)
+        chains.append({
+            'blocked': session_id,
+            'head': chain[-1],
+            'chain': ' ← '.join(f"{sid} ({sessions.get(sid, '?')})" for sid in reversed(chain)),
+        })
+    return chains
+
+
+class LockSampler:
+    def __init__(self, side_conn, session_id, tables, interval):
+        self.conn = side_conn
+        self.session_id = session_id
+        self.tables = tables
+        self.interval = interval
+        self.started = time.monotonic()
+        self.samples = []
+        self.blocking = []
+        self.waits = {}
+        self.stage_seconds = {}
+        self.error = None
+        self._active = {}
+        self._stage_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._last_waits = None
+        self._last_escalations = None
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        with self._stage_lock:
+            self._active[name] = self._active.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._stage_lock:
+                self._active[name] -= 1
+                if not self._active[name]:
+                    del self._active[name]
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.monotonic() - started
+
+    def current_stage(self):
+        # Pipelined imports read, prepare and insert at the same time, so several stages can be active.
+        with self._stage_lock:
+            return '+'.join(sorted(self._active)) or '-'
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('SET LOCK_TIMEOUT 1000')
+            while True:
+                self._sample(cursor)
+                if self._stop.wait(self.interval):
+                    break
+            self._sample(cursor)
+        except Exception as e:
+            self.error = e
+        finally:
+            cursor.close()
+
+    def _sample(self, cursor):
+        stage = self.current_stage()
+        at = round(time.monotonic() - self.started, 2)
+
+        requests = _rows(cursor, REQUESTS_SQL, (self.session_id,))
+        own = next((row for row in requests if row[0] == self.session_id), None)
+        blocked = {row[0]: row[1] for row in requests if row[1]}
+        sessions = {row[0]: row[7] or row[8] or '' for row in requests}
+        idle = {sid for sid in blocked.values() if sid not in sessions}
+        if idle:
+            for sid, status, program, host in _rows(cursor, IDLE_BLOCKERS_SQL.format(ids=', '.join(str(int(sid)) for sid in idle))):
+                sessions[sid] = f'{program or host or ""}, {status}'
+        details = {row[0]: row for row in requests}
+        for chain in build_blocking_chains(blocked, sessions):
+            row = details[chain['blocked']]
+            self.blocking.append({
+                'Сек.': at,
+                'Етап': stage,
+                'Верига': chain['chain'],
+                'Блокираща сесия': chain['head'],
+                'Блокирана сесия': chain['blocked'],
+                'Програма': sessions.get(chain['blocked'], ''),
+                'Изчакване': row[4],
+                'Изчакване (ms)': row[5],
+                'Ресурс': row[6],
+                'Заявка': row[9],
+            })
+
+        locks = {}
+        for resource, mode, status, count in _rows(cursor, LOCKS_SQL, (self.session_id,)):
+            locks[resource] = locks.get(resource, 0) + count
+            if resource == 'OBJECT' and mode in ('X', 'IX', 'SIX') and status == 'GRANT':
+                locks['OBJECT_' + mode] = count
+
+        escalations = 0
+        if self.tables:
+            objects = ', '.join(f"OBJECT_ID('dbo.{table}')" for table in self.tables)
+            current = {name: int(count or 0) for name, count in _rows(cursor, ESCALATIONS_SQL.format(objects=objects))}
+            if self._last_escalations is not None:
+                escalations = sum(count - self._last_escalations.get(name, count) for name, count in current.items())
+            self._last_escalations = current
+
+        current_waits = {
+            wait_type: (int(tasks), int(ms))
+            for wait_type, tasks, ms in _rows(cursor, SESSION_WAITS_SQL, (self.session_id,))
+            if not wait_type.startswith(IGNORED_WAITS)
+        }
+        if self._last_waits is not None:
+            stage_waits = self.waits.setdefault(stage, {})
+            for wait_type, (tasks, ms) in current_waits.items():
+                last_tasks, last_ms = self._last_waits.get(wait_type, (0, 0))
+                if ms > last_ms or tasks > last_tasks:
+                    total_tasks, total_ms = stage_waits.get(wait_type, (0, 0))
+                    stage_waits[wait_type] = (total_tasks + tasks - last_tasks, total_ms + ms - last_ms)
+        self._last_waits = current_waits
+
+        self.samples.append({
+            'Сек.': at,
+            'Етап': stage,
+            'Състояние': own[2] if own else 'неактивна',
+            'Команда': own[3] if own else '',
+            'Изчакване': own[4] if own else '',
+            'Изчакване (ms)': own[5] if own else 0,
+            'Блокирана от': own[1] if own and own[1] else '',
+            'Заключвания': sum(count for resource, count in locks.items() if not resource.startswith('OBJECT_')),
+            'KEY': locks.get('KEY', 0),
+            'PAGE': locks.get('PAGE', 0),
+            'OBJECT X/IX': locks.get('OBJECT_X', 0) + locks.get('OBJECT_IX', 0) + locks.get('OBJECT_SIX', 0),
+            'Ескалации': escalations,
+            'Блокирани от импорта': sum(1 for sid, blocker in blocked.items() if blocker == self.session_id),
+            'Блокирани сесии': len(blocked),
+        })
+
+    def summary(self):
+        timeline = pd.DataFrame(self.samples)
+        stages = []
+        for stage, seconds in self.stage_seconds.items():
+            rows = timeline[timeline['Етап'].str.split('+').apply(lambda names: stage in names)] if not timeline.empty else timeline
+            stages.append({
+                'Етап': stage,
+                'Време (сек.)': round(seconds, 2),
+                'Проби': len(rows),
+                'Макс. заключвания': int(rows['Заключвания'].max()) if len(rows) else 0,
+                'Ескалации': int(rows['Ескалации'].sum()) if len(rows) else 0,
+                'Проби с блокирани от импорта': int((rows['Блокирани от импорта'] > 0).sum()) if len(rows) else 0,
+                'Проби с блокиран импорт': int((rows['Блокирана от'] != '').sum()) if len(rows) else 0,
+            })
+        waits = [
+            {'Етап': stage, 'Изчакване': wait_type, 'Брой': tasks, 'Време (ms)': ms}
+            for stage, stage_waits in self.waits.items()
+            for wait_type, (tasks, ms) in sorted(stage_waits.items(), key=lambda item: -item[1][1])[:TOP_WAITS]
+        ]
+        return {
+            'Етапи': pd.DataFrame(stages),
+            'Хронология': timeline,
+            'Блокировки': pd.DataFrame(self.blocking),
+            'Изчаквания': pd.DataFrame(waits),
+        }
+
+
+def write_diagnostics_report(report_file, sheets):
+    with pd.ExcelWriter(report_file, engine='openpyxl') as writer:
+        for name, frame in sheets.items():
+            (frame if not frame.empty else pd.DataFrame({'': ['Няма данни']})).to_excel(writer, index=False, sheet_name=name)
+    return report_file
+
+
+def _report_file(operation, config):
+    folder = config['diagnostics_dir'] or os.path.join(database_state_dir(config), 'diagnostics')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{operation}_locks.xlsx")
+
+
+@contextmanager
+def capture_lock_diagnostics(conn, operation, log, config=CONFIG, tables=()):
+    if not config['lock_diagnostics']:
+        yield None
+        return
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT @@SPID')
+        session_id = int(cursor.fetchone()[0])
+        cursor.close()
+        side_conn = connect_database(config)
+        side_conn.autocommit = True
+    except Exception as e:
+        log(f'⚠ Диагностиката на заключванията не е стартирана: {e}')
+        yield None
+        return
+
+    sampler = LockSampler(side_conn, session_id, list(tables), config['lock_diagnostics_interval'])
+    sampler.start()
+    try:
+        with listen_stages(sampler):
+            yield sampler
+    finally:
+        sampler.stop()
+        side_conn.close()
+        if sampler.error:
+            log(f'⚠ Диагностика на заключванията: {sampler.error} (нужно е право VIEW SERVER STATE)')
+        if sampler.samples:
+            try:
+                sheets = sampler.summary()
+                report_file = write_diagnostics_report(_report_file(operation, config), sheets)
+                blocked = sheets['Хронология']['Блокирани от импорта'].max()
+                log(
+                    f"ℹ Диагностика на заключванията: {len(sampler.samples)} проби, "
+                    f"макс. блокирани от импорта {blocked}, блокировки {len(sampler.blocking)} → {report_file}"
+                )
+            except Exception as e:
+                log(f'⚠ Отчетът за заключванията не е записан: {e}')
@@ -0,0 +1,233 @@
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .config import CONFIG
+    from .db import connect_database, ensure_database_selected, get_available_databases
+except ImportError:
+    from config import CONFIG
+    from db import connect_database, ensure_database_selected, get_available_databases
+
+
+DIFF_KINDS = ('items', 'partners')
+DIFF_SAMPLE_SIZE = 20
+XLSX_MAX_DATA_ROWS = 1048575
+
+
+def _diff_specs(config):
+    return {
+        'items': {
+            'title': 'Стоки',
+            'table': config['table_name'],
+            'key': 'Code',
+            'label': 'Name',
+            'columns': ['Name', 'Measure', 'SalePrice', 'VatRateID', 'GroupID', 'StatusID', 'VatTermID'],
+            'numeric': ['SalePrice', 'VatRateID', 'GroupID', 'StatusID', 'VatTermID'],
+        },
+        'partners': {
+            'title': 'Партньори',
+            'table': 'Partners',
+            'key': 'Bulstat',
+            'label': 'Name',
+            'columns': [
+                'Name', 'NameEnglish', 'ContactName', 'ContactNameEnglish', 'EMail', 'VatId',
+                'BankName', 'BankCode', 'BankAccount', 'GroupID', 'StatusID', 'CountryID',
+            ],
+            'numeric': ['GroupID', 'StatusID', 'CountryID'],
+        },
+    }
+
+
+def normalize_diff_frame(df, spec):
+    # Canonical values first, so '12.50' vs Decimal('12.5000') or trailing spaces are not reported as differences.
+    frame = pd.DataFrame({spec['key']: df[spec['key']].fillna('').astype(str).str.strip()})
+    for col in spec['columns']:
+        if col in spec['numeric']:
+            frame[col] = pd.to_numeric(df[col], errors='coerce').astype('float64').round(4)
+        else:
+            frame[col] = df[col].fillna('').astype(str).str.strip()
+    frame = frame[frame[spec['key']] != '']
+
+    duplicated = frame[spec['key']].duplicated()
+    frame = frame[~duplicated].reset_index(drop=True)
+    frame['KeyHash'] = pd.util.hash_pandas_object(frame[spec['key']], index=False).to_numpy()
+    frame['RowHash'] = pd.util.hash_pandas_object(frame[spec['columns']], index=False).to_numpy()
+    return frame, int(duplicated.sum())
+
+
+def read_diff_frame(database, kind, config=CONFIG):
+    spec = _diff_specs(config)[kind]
+    columns = ', '.join(f'[{col}]' for col in [spec['key']] + spec['columns'])
+    conn = connect_database(dict(config, database=database))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            df = pd.read_sql(f"SELECT {columns} FROM [dbo].[{spec['table']}] WHERE [Visible] = 1", conn)
+    finally:
+        conn.close()
+    return normalize_diff_frame(df, spec)
+
+
+def compare_diff_frames(master, other, spec, master_index=None):
+    key, label = spec['key'], spec['label']
+    master_index = master_index if master_index is not None else pd.Index(master['KeyHash'])
+    positions = master_index.get_indexer(other['KeyHash'].to_numpy())
+    matched = positions >= 0
+    in_other = np.zeros(len(master), dtype=bool)
+    in_other[positions[matched]] = True
+    missing = master.loc[~in_other, [key, label]]
+    extra = other.loc[~matched, [key, label]]
+
+    master_rows = positions[matched]
+    other_rows = np.flatnonzero(matched)
+    changed = master['RowHash'].to_numpy()[master_rows] != other['RowHash'].to_numpy()[other_rows]
+    master_rows, other_rows = master_rows[changed], other_rows[changed]
+
+    differences = []
+    for col in spec['columns']:
+        master_values = master[col].to_numpy()[master_rows]
+        other_values = other[col].to_numpy()[other_rows]
+        mask = ~((master_values == other_values) | (pd.isna(master_values) & pd.isna(other_values)))
+        if mask.any():
+            differences.append(pd.DataFrame({
+                'Ключ': master[key].to_numpy()[master_rows[mask]],
+                'Поле': col,
+                'Главна база': master_values[mask].astype(object),
+                'Стойност': other_values[mask].astype(object),
+            }))
+    differences = pd.concat(differences, ignore_index=True) if differences else pd.DataFrame(columns=['Ключ', 'Поле', 'Главна база', 'Стойност'])
+    return missing, extra, differences, int(changed.sum())
+
+
+def run_database_diff(kind, master_db, databases, log, config=CONFIG):
+    spec = _diff_specs(config)[kind]
+    databases = [db for db in dict.fromkeys(databases) if db != master_db]
+    workers = max(1, min(config['diff_workers'], len(databases) + 1))
+    started = time.monotonic()
+
+    frames, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(read_diff_frame, db, kind, config): db for db in [master_db] + databases}
+        for future in as_completed(futures):
+            db = futures[future]
+            try:
+                frames[db] = future.result()
+                log(f'  ✓ {db}: {len(frames[db][0])} записа')
+            except Exception as e:
+                errors[db] = str(e)
+                log(f'  ✗ {db}: {e}')
+    log(f'Прочетени {len(frames)} бази за {time.monotonic() - started:.1f} сек.')
+
+    if master_db not in frames:
+        raise ValueError(f"Главната база '{master_db}' не може да бъде прочетена: {errors.get(master_db)}")
+
+    master, master_duplicates = frames[master_db]
+    master_index = pd.Index(master['KeyHash'])
+    summary = [{
+        'База': master_db, 'Записи': len(master), 'Липсващи': 0, 'Излишни': 0, 'Различни': 0,
+        'Повтарящи се ключове': master_duplicates, 'Грешка': '',
+    }]
+    missing_parts, extra_parts, difference_parts = [], [], []
+    for db in databases:
+        if db in errors:
+            summary.append({'База': db, 'Записи': 0, 'Липсващи': 0, 'Излишни': 0, 'Различни': 0, 'Повтарящи се ключове': 0, 'Грешка': errors[db]})
+            continue
+        other, duplicates = frames[db]
+        missing, extra, differences, changed = compare_diff_frames(master, other, spec, master_index)
+        summary.append({
+            'База': db, 'Записи': len(other), 'Липсващи': len(missing), 'Излишни': len(extra), 'Различни': changed,
+            'Повтарящи се ключове': duplicates, 'Грешка': '',
+        })
+        missing_parts.append(missing.assign(База=db))
+        extra_parts.append(extra.assign(База=db))
+        difference_parts.append(differences.assign(База=db))
+
+    def combine(parts, columns):
+        frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+        return frame[['База'] + [col for col in frame.columns if col != 'База']]
+
+    return {
+        'summary': pd.DataFrame(summary),
+        'missing': combine(missing_parts, [spec['key'], spec['label']]),
+        'extra': combine(extra_parts, [spec['key'], spec['label']]),
+        'differences': combine(difference_parts, ['Ключ', 'Поле', 'Главна база', 'Стойност']),
+    }
+
+
+def write_diff_report(report_file, report, log):
+    with pd.ExcelWriter(report_file, engine='openpyxl') as writer:
+        for sheet, name in (('Обобщение', 'summary'), ('Липсващи', 'missing'), ('Излишни', 'extra'), ('Разлики', 'differences')):
+            frame = report[name]
+            if len(frame) > XLSX_MAX_DATA_ROWS:
+                log(f"⚠ Sheet '{sheet}' е съкратен до {XLSX_MAX_DATA_ROWS} от {len(frame)} реда.")
+                frame = frame.head(XLSX_MAX_DATA_ROWS)
+            frame.to_excel(writer, index=False, sheet_name=sheet)
+    return report_file
+
+
+def diff_databases(kind, master_db, databases, log, config=CONFIG, report_file=None):
+    spec = _diff_specs(config)[kind]
+    log(f"=== СРАВНЕНИЕ НА {spec['title'].upper()} МЕЖДУ БАЗИ: {master_db} ↔ {len(databases)} бази ===")
+    started = time.monotonic()
+    report = run_database_diff(kind, master_db, databases, log, config)
+
+    summary = report['summary']
+    print(f'\n{summary.fillna("").to_string(index=False)}')
+    if not report['differences'].empty:
+        print(f'\nРазлики (първи {DIFF_SAMPLE_SIZE}):')
+        print(report['differences'].head(DIFF_SAMPLE_SIZE).to_string(index=False))
+
+    report_file = report_file or os.path.join(
+        os.getcwd(), f"diff_{kind}_{master_db}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    )
+    write_diff_report(report_file, report, log)
+    log(
+        f"✓ Липсващи: {len(report['missing'])} | Излишни: {len(report['extra'])} | "
+        f"Разлики в полета: {len(report['differences'])} | {time.monotonic() - started:.1f} сек."
+    )
+    log(f'✓ Отчет за разликите: {report_file}')
+    return report
+
+
+def diff_databases_interactive(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Сравнението е отменено: няма избрана база данни.')
+        return
+
+    kind_choice = input('Сравнение на: 1 - Стоки, 2 - Партньори, 0 - Отказ: ').strip()
+    if kind_choice not in ('1', '2'):
+        log('Сравнението е отменено от потребителя.')
+        return
+    kind = DIFF_KINDS[int(kind_choice) - 1]
+
+    databases = [db for db in get_available_databases(config, log) if db != config['database']]
+    if not databases:
+        log('✗ Няма други бази данни на сървъра.')
+        return
+
+    print(f"\nГлавна база: {config['database']}")
+    for i, db_name in enumerate(databases, 1):
+        print(f'{i:2}. {db_name}')
+    choice = input('Бази за сравнение (номера, разделени със запетая, * = всички, 0 - Отказ): ').strip()
+    if choice == '*':
+        selected = databases
+    else:
+        try:
+            numbers = [int(part) for part in choice.split(',') if part.strip()]
+            selected = [databases[n - 1] for n in numbers] if all(1 <= n <= len(databases) for n in numbers) else []
+        except ValueError:
+            selected = []
+    if not selected:
+        log('Сравнението е отменено от потребителя.')
+        return
+
+    try:
+        diff_databases(kind, config['database'], selected, log, config)
+    except Exception as e:
+        log(f'✗ Грешка при сравнение: {e}')
@@ -1,30 +1,223 @@
 import os
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 
 import pandas as pd
 import pyodbc
 from tkinter import filedialog, messagebox
 
 try:
+    from .archive_service import load_archived_sheets, try_archive_export
     from .config import CONFIG
-    from .db import check_table_exists, connect_with_fallback, ensure_database_selected
+    from .db import check_table_exists, connect_database, connect_with_fallback, ensure_database_selected
+    from .metrics import log_peak_memory, metric_rows, metric_stage, track_operation
+    from .replica_service import connect_read_source
+    from .state import load_database_state, save_database_state, write_json
+    from .template_service import date_columns, ensure_items_template, stream_items_workbook
+    from .usage_service import items_usage_query
     from .utils import (
-        add_dropdown_validation,
         auto_adjust_column_width,
         format_header_bold,
         get_access_odbc_driver,
         with_tk_dialog,
     )
+    from .workbook import DELTA_CHANGE_COLUMN, MANIFEST_SUFFIX
 except ImportError:
+    from archive_service import load_archived_sheets, try_archive_export
     from config import CONFIG
-    from db import check_table_exists, connect_with_fallback, ensure_database_selected
+    from db import check_table_exists, connect_database, connect_with_fallback, ensure_database_selected
+    from metrics import log_peak_memory, metric_rows, metric_stage, track_operation
+    from replica_service import connect_read_source
+    from state import load_database_state, save_database_state, write_json
+    from template_service import date_columns, ensure_items_template, stream_items_workbook
+    from usage_service import items_usage_query
     from utils import (
-        add_dropdown_validation,
         auto_adjust_column_width,
         format_header_bold,
         get_access_odbc_driver,
         with_tk_dialog,
     )
+    from workbook import DELTA_CHANGE_COLUMN, MANIFEST_SUFFIX
+
+
+ITEMS_SELECT_COLUMNS = """
+    [Code] as 'Код', [Name] as 'Стока', [Measure] as 'Мярка',
+    [SalePrice] as 'Цена', [VatRateID] as 'ДДС ID',
+    [GroupID] as 'Група ID', [StatusID] as 'Статус ID',
+    [VatTermID] as 'ДДС Срок ID'"""
+
+PARTNERS_SELECT_COLUMNS = """
+    [PartnerID] as 'PartnerID',
+    [Name] as 'Име',
+    [NameEnglish] as 'Име (EN)',
+    [ContactName] as 'Лице за контакт',
+    [ContactNameEnglish] as 'Лице за контакт (EN)',
+    [EMail] as 'EMail',
+    [Bulstat] as 'Булстат',
+    [VatId] as 'ДДС Номер',
+    [BankName] as 'Банка',
+    [BankCode] as 'Банков код',
+    [BankAccount] as 'Банкова сметка',
+    [Priority] as 'Priority',
+    [GroupID] as 'GroupID',
+    [Visible] as 'Visible',
+    [MainPartnerID] as 'MainPartnerID',
+    [StatusID] as 'StatusID',
+    [IsExported] as 'IsExported',
+    [IsOSSPartner] as 'IsOSSPartner',
+    [CountryID] as 'CountryID',
+    [DocumentEndDatePeriod] as 'DocumentEndDatePeriod'"""
+
+
+def sort_by_name(df, name_column, tie_column):
+    # SQL Server orders names with the database collation and the SQLite replica with BINARY, so the rows
+    # are ordered here, the same way for both sources.
+    keys = pd.DataFrame({'name': df[name_column].fillna('').astype(str).str.casefold(), 'tie': df[tie_column]})
+    return df.loc[keys.sort_values(['name', 'tie'], kind='stable').index].reset_index(drop=True)
+
+
+def read_items_export_frames(conn, config=CONFIG, usage=False, log=None):
+    query_items = f"""
+    SELECT {ITEMS_SELECT_COLUMNS}
+    FROM [dbo].[{config['table_name']}]
+    WHERE [Visible] = 1
+    """
+    if usage:
+        query_items = items_usage_query(conn, ITEMS_SELECT_COLUMNS, log, config) or query_items
+
+    query_vatrates = """SELECT [VatRateID] as 'ДДС ID', [Code] as 'Код',
+        [Description] as 'Описание', [Rate] as 'Стойност', [TypeIdentifier] as 'Тип'
+        FROM [dbo].[VatRates] ORDER BY [VatRateID]"""
+
+    query_itemgroups = """SELECT [GroupID] as 'Група ID', [Code] as 'Код', [Name] as 'Име'
+        FROM [dbo].[ItemGroups] ORDER BY [GroupID]"""
+
+    query_status = """SELECT [StatusID] as 'Статус ID', [Name] as 'Име'
+        FROM [dbo].[Status] ORDER BY [StatusID]"""
+
+    query_vatterms = """SELECT [VatTermID] as 'ДДС Срок ID', [Description] as 'Описание',
+        [TypeIdentifier] as 'Тип', [VatValue] as 'Стойност'
+        FROM [dbo].[VatTerms] ORDER BY [VatTermID]"""
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df_items = pd.read_sql(query_items, conn)
+        refs = {
+            'VatRates': pd.read_sql(query_vatrates, conn),
+            'ItemGroups': pd.read_sql(query_itemgroups, conn),
+            'Status': pd.read_sql(query_status, conn),
+            'VatTerms': pd.read_sql(query_vatterms, conn),
+        }
+
+    df_items['Код'] = df_items['Код'].astype(str).replace(['nan', 'None', 'null'], '')
+    df_items['Стока'] = df_items['Стока'].astype(str)
+    return normalize_usage_columns(sort_by_name(df_items, 'Стока', 'Код')), refs
+
+
+def normalize_usage_columns(df_items):
+    if 'Последна цена' in df_items.columns:
+        df_items['Последна цена'] = pd.to_numeric(df_items['Последна цена']).astype('float64')
+    # The archive keeps the date as text, so it is parsed again on restore to come back as a date cell.
+    if 'Последна продажба' in df_items.columns:
+        df_items['Последна продажба'] = pd.to_datetime(df_items['Последна продажба'])
+    return df_items
+
+
+def write_items_workbook(export_file, df_items, refs, config=CONFIG):
+    template_file = ensure_items_template(refs, df_items.columns, config, date_columns(df_items))
+    return stream_items_workbook(template_file, export_file, df_items)
+
+
+def archive_items_export(df_items, refs, log, config=CONFIG, export_file=None):
+    if config['export_archive']:
+        try_archive_export('items', {'Items': df_items, **refs}, log, config, export_file)
+
+
+def archive_partners_export(df_partners, log, config=CONFIG, export_file=None):
+    if config['export_archive']:
+        try_archive_export('partners', {'Партньори': df_partners}, log, config, export_file)
+
+
+def restore_archived_export(archive_id, export_file, log, config=CONFIG):
+    manifest, sheets = load_archived_sheets(archive_id, config)
+    if manifest['kind'] == 'items':
+        df_items = normalize_usage_columns(sheets.pop('Items'))
+        rows = write_items_workbook(export_file, df_items, sheets, config)
+    else:
+        rows = write_partners_workbook(export_file, sheets['Партньори'])
+    log(f"✓ Възстановен експорт {archive_id} ({manifest['database']}): {rows} записа в {export_file}")
+    return {'rows': rows, 'file': export_file}
+
+
+def read_partners_export_frame(conn):
+    query_partners = f"""
+    SELECT {PARTNERS_SELECT_COLUMNS}
+    FROM [dbo].[Partners]
+    WHERE [Visible] = 1
+    """
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df_partners = pd.read_sql(query_partners, conn)
+    return sort_by_name(df_partners, 'Име', 'PartnerID')
+
+
+def write_partners_workbook(export_file, df_partners):
+    with pd.ExcelWriter(export_file, engine='openpyxl') as writer:
+        df_partners.to_excel(writer, index=False, sheet_name='Партньори')
+        ws_partners = writer.sheets['Партньори']
+        auto_adjust_column_width(ws_partners)
+        format_header_bold(ws_partners)
+    return len(df_partners)
+
+
+def export_items_file(export_file, log, config=CONFIG, conn=None):
+    with track_operation('export_items', config):
+        own_conn = conn is None
+        with metric_stage('connect'):
+            # Usage figures are aggregated on the server; the local replica has no document tables.
+            if config['export_items_usage']:
+                conn = conn or connect_database(config)
+            else:
+                conn = conn or connect_read_source(config, log, interactive=False)
+        try:
+            with metric_stage('read'):
+                df_items, refs = read_items_export_frames(conn, config, usage=config['export_items_usage'], log=log)
+        finally:
+            if own_conn:
+                conn.close()
+        with metric_stage('write'):
+            rows = write_items_workbook(export_file, df_items, refs, config)
+        metric_rows('exported', rows)
+        with metric_stage('archive'):
+            archive_items_export(df_items, refs, log, config, export_file)
+    log(f'✓ Експортирани {rows} записа в {export_file}')
+    log_peak_memory(log)
+    return {'rows': rows, 'file': export_file}
+
+
+def export_partners_file(export_file, log, config=CONFIG, conn=None):
+    with track_operation('export_partners', config):
+        own_conn = conn is None
+        with metric_stage('connect'):
+            conn = conn or connect_read_source(config, log, interactive=False)
+        try:
+            if not check_table_exists(conn, config, 'Partners'):
+                raise ValueError("Таблица 'Partners' не е намерена в избраната база.")
+            with metric_stage('read'):
+                df_partners = read_partners_export_frame(conn)
+        finally:
+            if own_conn:
+                conn.close()
+        with metric_stage('write'):
+            rows = write_partners_workbook(export_file, df_partners)
+        metric_rows('exported', rows)
+        with metric_stage('archive'):
+            archive_partners_export(df_partners, log, config, export_file)
+    log(f'✓ Експортирани {rows} партньора в {export_file}')
+    log_peak_memory(log)
+    return {'rows': rows, 'file': export_file}
 
 
 def export_items_excel(log, config=CONFIG):
@@ -62,93 +255,34 @@ def export_items_excel(log, config=CONFIG):
             )
             return
 
-    conn = connect_with_fallback(config, log)
+    conn = connect_with_fallback(config, log) if config['export_items_usage'] else connect_read_source(config, log)
     if not conn:
         return
 
     try:
         cursor = conn.cursor()
         try:
-            cursor.execute(f"SELECT TOP 1 * FROM [dbo].[{config['table_name']}]")
+            cursor.execute(f"SELECT * FROM [dbo].[{config['table_name']}] WHERE 1 = 0")
             cursor.fetchone()
         except pyodbc.Error as e:
             log(f'✗ Грешка при достъп до таблица: {e}')
             return
 
-        query_items = f"""
-        SELECT [Code] as 'Код', [Name] as 'Стока', [Measure] as 'Мярка',
-               [SalePrice] as 'Цена', [VatRateID] as 'ДДС ID',
-               [GroupID] as 'Група ID', [StatusID] as 'Статус ID',
-               [VatTermID] as 'ДДС Срок ID'
-        FROM [dbo].[{config['table_name']}]
-        WHERE [Visible] = 1
-        ORDER BY [Name]
-        """
-
-        query_vatrates = """SELECT [VatRateID] as 'ДДС ID', [Code] as 'Код',
-            [Description] as 'Описание', [Rate] as 'Стойност', [TypeIdentifier] as 'Тип'
-            FROM [dbo].[VatRates] ORDER BY [VatRateID]"""
-
-        query_itemgroups = """SELECT [GroupID] as 'Група ID', [Code] as 'Код', [Name] as 'Име'
-            FROM [dbo].[ItemGroups] ORDER BY [GroupID]"""
-
-        query_status = """SELECT [StatusID] as 'Статус ID', [Name] as 'Име'
-            FROM [dbo].[Status] ORDER BY [StatusID]"""
-
-        query_vatterms = """SELECT [VatTermID] as 'ДДС Срок ID', [Description] as 'Описание',
-            [TypeIdentifier] as 'Тип', [VatValue] as 'Стойност'
-            FROM [dbo].[VatTerms] ORDER BY [VatTermID]"""
-
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            df_items = pd.read_sql(query_items, conn)
-            df_vatrates = pd.read_sql(query_vatrates, conn)
-            df_itemgroups = pd.read_sql(query_itemgroups, conn)
-            df_status = pd.read_sql(query_status, conn)
-            df_vatterms = pd.read_sql(query_vatterms, conn)
-
-        if df_items.empty:
-            log("ℹ Няма видими записи в 'Items'. Ще бъде създаден празен sheet 'Items'.")
+        with track_operation('export_items', config):
+            with metric_stage('read'):
+                df_items, refs = read_items_export_frames(conn, config, usage=config['export_items_usage'], log=log)
 
-        df_items['Код'] = df_items['Код'].astype(str).replace(['nan', 'None', 'null'], '')
-        df_items['Стока'] = df_items['Стока'].astype(str)
+            if df_items.empty:
+                log("ℹ Няма видими записи в 'Items'. Ще бъде създаден празен sheet 'Items'.")
 
-        with pd.ExcelWriter(export_file, engine='openpyxl') as writer:
-            df_items.to_excel(writer, index=False, sheet_name='Items')
-            ws_items = writer.sheets['Items']
-            for row in range(2, len(df_items) + 2):
-                ws_items[f'A{row}'].number_format = '@'
-                ws_items[f'C{row}'].number_format = '@'
-                ws_items[f'D{row}'].number_format = '0.00'
-            auto_adjust_column_width(ws_items)
-            format_header_bold(ws_items)
-            items_count = len(df_items)
-
-            if not df_vatrates.empty:
-                df_vatrates['Display'] = df_vatrates['ДДС ID'].astype(str) + ' - ' + df_vatrates['Описание']
-                df_vatrates[['ДДС ID', 'Display', 'Описание', 'Стойност', 'Тип']].to_excel(writer, index=False, sheet_name='VatRates')
-                if items_count > 0:
-                    add_dropdown_validation(ws_items, 'E', 'VatRates', 'B', 2, items_count + 1)
-
-            if not df_itemgroups.empty:
-                df_itemgroups['Display'] = df_itemgroups['Група ID'].astype(str) + ' - ' + df_itemgroups['Име']
-                df_itemgroups[['Група ID', 'Display', 'Име']].to_excel(writer, index=False, sheet_name='ItemGroups')
-                if items_count > 0:
-                    add_dropdown_validation(ws_items, 'F', 'ItemGroups', 'B', 2, items_count + 1)
-
-            if not df_status.empty:
-                df_status['Display'] = df_status['Статус ID'].astype(str) + ' - ' + df_status['Име']
-                df_status[['Статус ID', 'Display', 'Име']].to_excel(writer, index=False, sheet_name='Status')
-                if items_count > 0:
-                    add_dropdown_validation(ws_items, 'G', 'Status', 'B', 2, items_count + 1)
-
-            if not df_vatterms.empty:
-                df_vatterms['Display'] = df_vatterms['ДДС Срок ID'].astype(str) + ' - ' + df_vatterms['Описание']
-                df_vatterms[['ДДС Срок ID', 'Display', 'Описание', 'Тип']].to_excel(writer, index=False, sheet_name='VatTerms')
-                if items_count > 0:
-                    add_dropdown_validation(ws_items, 'H', 'VatTerms', 'B', 2, items_count + 1)
+            with metric_stage('write'):
+                write_items_workbook(export_file, df_items, refs, config)
+            metric_rows('exported', len(df_items))
+            with metric_stage('archive'):
+                archive_items_export(df_items, refs, log, config, export_file)
 
         log(f"✓ Експортирани {len(df_items)} записа")
+        log_peak_memory(log)
         if with_tk_dialog(
             lambda r: messagebox.askyesno('Успех', f"Експортирани са {len(df_items)} записа.\nДа се отвори ли файла?", parent=r)
         ):
@@ -199,7 +333,7 @@ def export_partners_excel(log, config=CONFIG):
             )
             return
 
-    conn = connect_with_fallback(config, log)
+    conn = connect_read_source(config, log)
     if not conn:
         return
 
@@ -211,47 +345,21 @@ def export_partners_excel(log, config=CONFIG):
             )
             return
 
-        query_partners = """
-        SELECT
-            [PartnerID] as 'PartnerID',
-            [Name] as 'Име',
-            [NameEnglish] as 'Име (EN)',
-            [ContactName] as 'Лице за контакт',
-            [ContactNameEnglish] as 'Лице за контакт (EN)',
-            [EMail] as 'EMail',
-            [Bulstat] as 'Булстат',
-            [VatId] as 'ДДС Номер',
-            [BankName] as 'Банка',
-            [BankCode] as 'Банков код',
-            [BankAccount] as 'Банкова сметка',
-            [Priority] as 'Priority',
-            [GroupID] as 'GroupID',
-            [Visible] as 'Visible',
-            [MainPartnerID] as 'MainPartnerID',
-            [StatusID] as 'StatusID',
-            [IsExported] as 'IsExported',
-            [IsOSSPartner] as 'IsOSSPartner',
-            [CountryID] as 'CountryID',
-            [DocumentEndDatePeriod] as 'DocumentEndDatePeriod'
-        FROM [dbo].[Partners]
-        WHERE [Visible] = 1
-        ORDER BY [Name]
-        """
+        with track_operation('export_partners', config):
+            with metric_stage('read'):
+                df_partners = read_partners_export_frame(conn)
 
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore')
-            df_partners = pd.read_sql(query_partners, conn)
+            if df_partners.empty:
+                log("ℹ Няма видими записи в 'Partners'. Ще бъде създаден празен sheet 'Партньори'.")
 
-        if df_partners.empty:
-            log("ℹ Няма видими записи в 'Partners'. Ще бъде създаден празен sheet 'Партньори'.")
-
-        with pd.ExcelWriter(export_file, engine='openpyxl') as writer:
-            df_partners.to_excel(writer, index=False, sheet_name='Партньори')
-            ws_partners = writer.sheets['Партньори']
-            auto_adjust_column_width(ws_partners)
-            format_header_bold(ws_partners)
+            with metric_stage('write'):
+                write_partners_workbook(export_file, df_partners)
+            metric_rows('exported', len(df_partners))
+            with metric_stage('archive'):
+                archive_partners_export(df_partners, log, config, export_file)
 
         log(f"✓ Експортирани {len(df_partners)} партньора")
+        log_peak_memory(log)
         if with_tk_dialog(
             lambda r: messagebox.askyesno('Успех', f"Експортирани са {len(df_partners)} партньора.\nДа се отвори ли файла?", parent=r)
         ):
@@ -349,6 +457,341 @@ def export_warehouse_partners_excel(log, config=CONFIG):
             conn.close()
 
 
+XLSX_MAX_DATA_ROWS = 1048575
+
+
+def split_items_shards(df_items, by_group, rows_per_shard):
+    rows_per_shard = max(1, min(int(rows_per_shard), XLSX_MAX_DATA_ROWS))
+    groups = df_items.groupby('Група ID', sort=True, dropna=False) if by_group and not df_items.empty else [(None, df_items)]
+    shards = []
+    for group_id, df_group in groups:
+        for start in range(0, max(len(df_group), 1), rows_per_shard):
+            shards.append((group_id, df_group.iloc[start:start + rows_per_shard]))
+    return shards
+
+
+def _write_items_shard(export_file, df_items, template_file):
+    return export_file, stream_items_workbook(template_file, export_file, df_items)
+
+
+def export_items_sharded_excel(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Експортът е отменен: няма избрана база данни.')
+        return
+
+    mode = input('Разделяне: 1 - по GroupID, 2 - по брой редове, 0 - Отказ: ').strip()
+    if mode not in ('1', '2'):
+        log('Експортът е отменен от потребителя.')
+        return
+    rows_input = input(f"Максимален брой редове в част [{config['shard_rows']}]: ").strip()
+    try:
+        rows_per_shard = int(rows_input) if rows_input else config['shard_rows']
+    except ValueError:
+        log('✗ Невалиден брой редове.')
+        return
+
+    export_file = _prompt_export_file(config, 'invoice_pro_items_export.xlsx')
+    if not export_file:
+        log('Експортът е отменен от потребителя.')
+        return
+
+    log('=== ЕКСПОРТ ОТ SQL КЪМ EXCEL НА ЧАСТИ ===')
+    log(f"Сървър: {config['server']}")
+    log(f"База: {config['database']}")
+    log(f"Таблица: {config['table_name']}")
+
+    conn = connect_read_source(config, log)
+    if not conn:
+        return
+
+    try:
+        df_items, refs = read_items_export_frames(conn, config)
+    except Exception as e:
+        log(f'✗ Грешка при четене на данните: {e}')
+        return
+    finally:
+        conn.close()
+
+    try:
+        shards = split_items_shards(df_items, by_group=mode == '1', rows_per_shard=rows_per_shard)
+        base_path = os.path.splitext(export_file)[0]
+        jobs = []
+        for index, (group_id, df_shard) in enumerate(shards, 1):
+            suffix = f'_{index:03d}' if group_id is None or pd.isna(group_id) else f'_{index:03d}_group_{int(group_id)}'
+            jobs.append((f'{base_path}{suffix}.xlsx', df_shard, group_id))
+
+        # Built once in the parent so the workers only stream their rows into a copy of it.
+        template_file = ensure_items_template(refs, df_items.columns, config, date_columns(df_items))
+        workers = config['export_workers'] or os.cpu_count() or 1
+        workers = max(1, min(workers, len(jobs)))
+        log(f'Записи: {len(df_items)} | Части: {len(jobs)} | Паралелни процеси: {workers}')
+
+        if workers == 1:
+            for path, df_shard, _ in jobs:
+                _write_items_shard(path, df_shard, template_file)
+                log(f'  ✓ {os.path.basename(path)} ({len(df_shard)} реда)')
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_write_items_shard, path, df_shard, template_file): path for path, df_shard, _ in jobs}
+                for future in as_completed(futures):
+                    path, rows = future.result()
+                    log(f'  ✓ {os.path.basename(path)} ({rows} реда)')
+
+        manifest_file = f'{base_path}{MANIFEST_SUFFIX}'
+        write_json(
+            manifest_file,
+            {
+                'kind': 'items',
+                'sheet': 'Items',
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'server': config['server'],
+                'database': config['database'],
+                'rows': len(df_items),
+                'shards': [
+                    {
+                        'file': os.path.basename(path),
+                        'rows': len(df_shard),
+                        'group_id': None if group_id is None or pd.isna(group_id) else int(group_id),
+                    }
+                    for path, df_shard, group_id in jobs
+                ],
+            },
+        )
+
+        archive_items_export(df_items, refs, log, config, manifest_file)
+
+        log(f'✓ Експортирани {len(df_items)} записа в {len(jobs)} файла')
+        log(f'✓ Манифест за импорт: {manifest_file}')
+        with_tk_dialog(
+            lambda r: messagebox.showinfo(
+                'Успех', f'Експортирани са {len(df_items)} записа в {len(jobs)} файла.\nМанифест: {manifest_file}', parent=r
+            )
+        )
+
+    except Exception as e:
+        log(f'✗ Грешка при експорт на части: {e}')
+        import traceback
+
+        traceback.print_exc()
+
+
+DELTA_ADDED = 'добавен'
+DELTA_CHANGED = 'променен'
+DELTA_HIDDEN = 'скрит'
+DELTA_ID_CHUNK = 1000
+
+
+def _delta_specs(config):
+    table = config['table_name']
+    return {
+        'items': {
+            'state': 'items_delta',
+            'title': 'СТОКИ',
+            'table': table,
+            'sheet': 'Промени стоки',
+            'label_column': 'Код',
+            'initial_name': 'invoice_pro_items_delta.xlsx',
+            'hash_query': f"""
+                SELECT [ItemID] AS RowID,
+                    CASE WHEN LTRIM(RTRIM(ISNULL([Code], ''))) = '' THEN CONCAT('#', [ItemID])
+                         ELSE LTRIM(RTRIM([Code])) END AS RowKey,
+                    ISNULL([Code], '') AS RowLabel,
+                    CONVERT(VARCHAR(32), HASHBYTES('MD5', CONCAT(
+                        [Code], '|', [Name], '|', [Measure], '|', CONVERT(VARCHAR(30), [SalePrice], 2), '|',
+                        [VatRateID], '|', [GroupID], '|', [StatusID], '|', [VatTermID]
+                    )), 2) AS RowHash
+                FROM [dbo].[{table}]
+                WHERE [Visible] = 1
+            """,
+            'rows_query': f"""
+                SELECT [ItemID] AS RowID, {ITEMS_SELECT_COLUMNS}
+                FROM [dbo].[{table}]
+                WHERE [ItemID] IN ({{ids}})
+            """,
+        },
+        'partners': {
+            'state': 'partners_delta',
+            'title': 'ПАРТНЬОРИ',
+            'table': 'Partners',
+            'sheet': 'Промени партньори',
+            'label_column': 'Име',
+            'initial_name': 'invoice_pro_partners_delta.xlsx',
+            'hash_query': """
+                SELECT [PartnerID] AS RowID,
+                    CASE WHEN LTRIM(RTRIM(ISNULL([Bulstat], ''))) = '' THEN CONCAT('name:', [Name])
+                         ELSE LTRIM(RTRIM([Bulstat])) END AS RowKey,
+                    ISNULL([Name], '') AS RowLabel,
+                    CONVERT(VARCHAR(32), HASHBYTES('MD5', CONCAT(
+                        [Name], '|', [NameEnglish], '|', [ContactName], '|', [ContactNameEnglish], '|',
+                        [EMail], '|', [Bulstat], '|', [VatId], '|', [BankName], '|', [BankCode], '|',
+                        [BankAccount], '|', [Priority], '|', [GroupID], '|', [StatusID], '|', [CountryID]
+                    )), 2) AS RowHash
+                FROM [dbo].[Partners]
+                WHERE [Visible] = 1
+            """,
+            'rows_query': f"""
+                SELECT [PartnerID] AS RowID, {PARTNERS_SELECT_COLUMNS}
+                FROM [dbo].[Partners]
+                WHERE [PartnerID] IN ({{ids}})
+            """,
+        },
+    }
+
+
+def _prompt_export_file(config, initial_name, initial_dir=None):
+    if initial_dir is None:
+        initial_dir = os.path.dirname(config['excel_file']) if config['excel_file'] and os.path.exists(config['excel_file']) else os.getcwd()
+    export_file = with_tk_dialog(
+        lambda r: filedialog.asksaveasfilename(
+            title='Запази Excel файл като',
+            initialdir=initial_dir,
+            initialfile=initial_name,
+            defaultextension='.xlsx',
+            filetypes=[('Excel файлове', '*.xlsx'), ('Всички файлове', '*.*')],
+            parent=r,
+        )
+    )
+    if not export_file:
+        return None
+
+    if os.path.exists(export_file):
+        try:
+            os.remove(export_file)
+        except Exception:
+            with_tk_dialog(
+                lambda r: messagebox.showerror('Грешка', 'Файлът е отворен в друга програма.\nМоля затворете го.', parent=r)
+            )
+            return None
+    return export_file
+
+
+def _read_rows_by_ids(conn, query_template, ids):
+    frames = []
+    ids = [int(row_id) for row_id in ids]
+    for start in range(0, len(ids), DELTA_ID_CHUNK):
+        chunk = ids[start:start + DELTA_ID_CHUNK]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            frames.append(pd.read_sql(query_template.format(ids=', '.join(map(str, chunk))), conn))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def diff_row_hashes(df_current, previous_rows):
+    current_rows = {}
+    for row_id, key, label, row_hash in df_current[['RowID', 'RowKey', 'RowLabel', 'RowHash']].itertuples(index=False):
+        current_rows[key] = (row_id, label, row_hash)
+
+    added, changed = [], []
+    for key, (row_id, _, row_hash) in current_rows.items():
+        previous = previous_rows.get(key)
+        if previous is None:
+            added.append(row_id)
+        elif previous[0] != row_hash:
+            changed.append(row_id)
+    hidden = [(key, previous[1]) for key, previous in previous_rows.items() if key not in current_rows]
+
+    snapshot = {key: [row_hash, label] for key, (_, label, row_hash) in current_rows.items()}
+    return added, changed, hidden, snapshot
+
+
+def export_delta_excel(log, config=CONFIG, kind='items'):
+    if not ensure_database_selected(config, log):
+        log('Експортът е отменен: няма избрана база данни.')
+        return
+
+    spec = _delta_specs(config)[kind]
+    export_file = _prompt_export_file(config, spec['initial_name'])
+    if not export_file:
+        log('Експортът е отменен от потребителя.')
+        return
+
+    log(f"=== ДЕЛТА ЕКСПОРТ НА {spec['title']} ОТ SQL КЪМ EXCEL ===")
+    log(f"Сървър: {config['server']}")
+    log(f"База: {config['database']}")
+    log(f"Таблица: {spec['table']}")
+
+    conn = connect_with_fallback(config, log)
+    if not conn:
+        return
+
+    try:
+        if not check_table_exists(conn, config, spec['table']):
+            log(f"✗ Таблица '{spec['table']}' не е намерена в избраната база.")
+            return
+
+        state = load_database_state(spec['state'], config)
+        previous_rows = state.get('rows', {})
+        if state.get('updated_at'):
+            log(f"Последен експорт: {state['updated_at']} ({len(previous_rows)} записа)")
+        else:
+            log('ℹ Няма предишен делта експорт за тази база. Всички записи ще бъдат маркирани като добавени.')
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            df_hashes = pd.read_sql(spec['hash_query'], conn)
+
+        duplicates = int(df_hashes['RowKey'].duplicated().sum())
+        if duplicates:
+            log(f'⚠ {duplicates} видими записа имат повтарящ се ключ. Използван е последният.')
+
+        added, changed, hidden, snapshot = diff_row_hashes(df_hashes, previous_rows)
+        log(f'Добавени: {len(added)} | Променени: {len(changed)} | Скрити: {len(hidden)}')
+
+        df_rows = _read_rows_by_ids(conn, spec['rows_query'], added + changed)
+        if not df_rows.empty:
+            added_ids = set(added)
+            df_rows.insert(
+                len(df_rows.columns),
+                DELTA_CHANGE_COLUMN,
+                [DELTA_ADDED if row_id in added_ids else DELTA_CHANGED for row_id in df_rows['RowID']],
+            )
+            df_rows = df_rows.drop(columns=['RowID'])
+
+        df_hidden = pd.DataFrame({spec['label_column']: [label for _, label in hidden], DELTA_CHANGE_COLUMN: DELTA_HIDDEN})
+        frames = [df for df in (df_rows, df_hidden) if not df.empty]
+        if frames:
+            df_delta = pd.concat(frames, ignore_index=True)
+        else:
+            df_delta = pd.DataFrame(columns=[spec['label_column'], DELTA_CHANGE_COLUMN])
+        if 'Код' in df_delta.columns:
+            df_delta['Код'] = df_delta['Код'].astype(str).replace(['nan', 'None', 'null'], '')
+
+        with pd.ExcelWriter(export_file, engine='openpyxl') as writer:
+            df_delta.to_excel(writer, index=False, sheet_name=spec['sheet'])
+            ws_delta = writer.sheets[spec['sheet']]
+            auto_adjust_column_width(ws_delta)
+            format_header_bold(ws_delta)
+
+        save_database_state(
+            spec['state'],
+            {'updated_at': datetime.now().isoformat(timespec='seconds'), 'rows': snapshot},
+            config,
+        )
+
+        log(f'✓ Експортирани {len(df_delta)} променени записа')
+        if with_tk_dialog(
+            lambda r: messagebox.askyesno('Успех', f"Експортирани са {len(df_delta)} променени записа.\nДа се отвори ли файла?", parent=r)
+        ):
+            os.startfile(export_file)
+
+    except Exception as e:
+        log(f'✗ Грешка при делта експорт: {e}')
+        import traceback
+
+        traceback.print_exc()
+    finally:
+        if conn:
+            conn.close()
+
+
+def export_items_delta_excel(log, config=CONFIG):
+    export_delta_excel(log, config, kind='items')
+
+
+def export_partners_delta_excel(log, config=CONFIG):
+    export_delta_excel(log, config, kind='partners')
+
+
 def export_to_excel(log, config=CONFIG):
     export_items_excel(log, config)
 
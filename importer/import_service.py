@@ -1,84 +1,163 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 from tkinter import filedialog, messagebox
 
 try:
     from .config import CONFIG, EXPECTED_COLUMNS
-    from .db import connect_with_fallback, ensure_database_selected
+    from .diagnostics_service import capture_lock_diagnostics
+    from .item_groups_service import (
+        prepare_item_groups,
+        read_item_groups_sheet,
+        remap_group_ids,
+        remap_staged_group_ids,
+        upsert_item_groups,
+    )
+    from .db import (
+        check_table_exists,
+        connect_database,
+        connect_with_fallback,
+        ensure_database_selected,
+        is_leading_index_column,
+    )
+    from .metrics import log_peak_memory, metric_rows, metric_stage, track_operation
+    from .pipeline import run_pipeline
+    from .preview_service import run_import_preview
+    from .replica_service import invalidate_replica
+    from .script_service import SCRIPT_SUFFIX, write_items_script, write_partners_script
+    from .snapshot_service import finish_import_snapshot, save_snapshot, take_import_snapshot
     from .utils import parse_id_value, transliterate, with_tk_dialog
+    from .workbook import (
+        DELTA_CHANGE_COLUMN,
+        MANIFEST_SUFFIX,
+        compact_string_dtype,
+        estimate_sheet_memory,
+        is_manifest_file,
+        iter_excel_sheet_chunks,
+        read_excel_sheet,
+        read_import_sheet,
+    )
 except ImportError:
     from config import CONFIG, EXPECTED_COLUMNS
-    from db import connect_with_fallback, ensure_database_selected
+    from diagnostics_service import capture_lock_diagnostics
+    from item_groups_service import (
+        prepare_item_groups,
+        read_item_groups_sheet,
+        remap_group_ids,
+        remap_staged_group_ids,
+        upsert_item_groups,
+    )
+    from db import (
+        check_table_exists,
+        connect_database,
+        connect_with_fallback,
+        ensure_database_selected,
+        is_leading_index_column,
+    )
+    from metrics import log_peak_memory, metric_rows, metric_stage, track_operation
+    from pipeline import run_pipeline
+    from preview_service import run_import_preview
+    from replica_service import invalidate_replica
+    from script_service import SCRIPT_SUFFIX, write_items_script, write_partners_script
+    from snapshot_service import finish_import_snapshot, save_snapshot, take_import_snapshot
     from utils import parse_id_value, transliterate, with_tk_dialog
+    from workbook import (
+        DELTA_CHANGE_COLUMN,
+        MANIFEST_SUFFIX,
+        compact_string_dtype,
+        estimate_sheet_memory,
+        is_manifest_file,
+        iter_excel_sheet_chunks,
+        read_excel_sheet,
+        read_import_sheet,
+    )
 
 
 PARTNERS_NAME_COLUMNS = ['Име', 'Name', 'Company']
 
 
-def build_items_import_payload(df, log):
+# Excel column -> (Items column, default when empty or invalid)
+ITEMS_ID_COLUMNS = {
+    'ДДС ID': ('VatRateID', 1),
+    'Група ID': ('GroupID', 1),
+    'Статус ID': ('StatusID', 3),
+    'ДДС Срок ID': ('VatTermID', 7),
+}
+ITEMS_CONSTANT_COLUMNS = {
+    'Visible': 1, 'FixedPrice': 0, 'EcoTax': 0, 'Priority': 0, 'IsService': 0, 'MainItemID': 0, 'Barcode': '', 'Permit': '',
+}
+
+
+def _map_unique(series, func):
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    mapped = np.array([func(value) for value in uniques], dtype=object)
+    return pd.Series(mapped[codes], index=series.index)
+
+
+def _stripped_text(series):
+    return _map_unique(series, lambda value: 'nan' if pd.isna(value) else str(value).strip())
+
+
+def _parse_id_column(series, default):
+    parsed = _map_unique(series, parse_id_value)
+    return pd.to_numeric(parsed.fillna(default), downcast='integer')
+
+
+def reject_delta_workbook(df):
+    # A delta export has the import columns, but hidden rows carry only the key; importing it would hide the whole catalog.
+    if DELTA_CHANGE_COLUMN in df.columns:
+        raise ValueError(f"Файлът е делта експорт (колона '{DELTA_CHANGE_COLUMN}') и не може да се импортира.")
+
+
+def build_items_import_frame(df, log):
+    reject_delta_workbook(df)
     log('Подготовка на данните...')
     df = df.dropna(subset=['Код', 'Стока'], how='all')
-    df['Цена'] = df['Цена'].fillna(0)
 
-    data = []
-    skipped = 0
+    code = _stripped_text(df['Код'])
+    name = _stripped_text(df['Стока'])
+    valid = code.ne('') & code.ne('nan') & name.ne('') & name.ne('nan')
+    skipped = int((~valid).sum())
+    df, code, name = df[valid], code[valid], name[valid]
 
-    for idx, row in df.iterrows():
-        try:
-            code = str(row['Код']).strip()
-            name = str(row['Стока']).strip()
-
-            if not code or code == 'nan' or not name or name == 'nan':
-                skipped += 1
-                continue
-
-            measure = str(row['Мярка']).strip() if pd.notna(row['Мярка']) else 'бр.'
-            price = float(row['Цена']) if pd.notna(row['Цена']) else 0.0
-
-            vatrate_id = parse_id_value(row['ДДС ID']) if 'ДДС ID' in row else None
-            group_id = parse_id_value(row['Група ID']) if 'Група ID' in row else None
-            status_id = parse_id_value(row['Статус ID']) if 'Статус ID' in row else None
-            vatterm_id = parse_id_value(row['ДДС Срок ID']) if 'ДДС Срок ID' in row else None
-
-            if vatrate_id is None:
-                vatrate_id = 1
-            if group_id is None:
-                group_id = 1
-            if status_id is None:
-                status_id = 3
-            if vatterm_id is None:
-                vatterm_id = 7
-
-            data.append(
-                {
-                    'Code': code,
-                    'Name': name,
-                    'Name2': transliterate(name),
-                    'Measure': measure,
-                    'Measure2': transliterate(measure),
-                    'SalePrice': price,
-                    'GroupID': group_id,
-                    'VatRateID': vatrate_id,
-                    'StatusID': status_id,
-                    'VatTermID': vatterm_id,
-                    'Visible': 1,
-                    'FixedPrice': 0,
-                    'EcoTax': 0,
-                    'Priority': 0,
-                    'IsService': 0,
-                    'MainItemID': 0,
-                    'Barcode': '',
-                    'Permit': '',
-                }
-            )
-        except Exception as e:
-            log(f'[ПРЕДУПРЕЖДЕНИЕ] Ред {idx + 1} пропуснат: {e}')
-            skipped += 1
+    measure = _stripped_text(df['Мярка']).where(df['Мярка'].notna(), 'бр.')
+    frame = pd.DataFrame(
+        {
+            'Code': code,
+            'Name': name,
+            'Name2': _map_unique(name, transliterate),
+            'Measure': measure,
+            'Measure2': _map_unique(measure, transliterate),
+            'SalePrice': pd.to_numeric(df['Цена'], errors='coerce').fillna(0.0).astype('float64'),
+        },
+        index=df.index,
+    )
+    for source, (target, default) in ITEMS_ID_COLUMNS.items():
+        frame[target] = _parse_id_column(df[source], default) if source in df.columns else default
+    for column, value in ITEMS_CONSTANT_COLUMNS.items():
+        frame[column] = value
 
     if skipped > 0:
         log(f'Пропуснати {skipped} невалидни реда')
-    return data
+    return compact_items_frame(frame.reset_index(drop=True))
+
+
+def compact_items_frame(frame):
+    frame = frame[ITEMS_INSERT_COLUMNS].copy()
+    for column in ('Code', 'Name', 'Name2'):
+        frame[column] = frame[column].astype(compact_string_dtype())
+    for column in ('Measure', 'Measure2', 'Barcode', 'Permit'):
+        frame[column] = frame[column].astype(compact_string_dtype()).astype('category')
+    for column in [target for target, _ in ITEMS_ID_COLUMNS.values()] + ['Visible', 'FixedPrice', 'EcoTax', 'Priority', 'IsService', 'MainItemID']:
+        frame[column] = pd.to_numeric(frame[column], downcast='integer')
+    return frame
+
+
+def build_items_import_payload(df, log):
+    return build_items_import_frame(df, log).to_dict('records')
 
 
 def _to_int(value, default=0):
@@ -126,6 +205,7 @@ def _to_identifier_string(value, default=''):
 
 
 def build_partners_import_payload(df, log):
+    reject_delta_workbook(df)
     if not any(col in df.columns for col in PARTNERS_NAME_COLUMNS):
         log("✗ Липсва колона за име (очаква се 'Име', 'Name' или 'Company').")
         return []
@@ -169,15 +249,644 @@ def build_partners_import_payload(df, log):
     return data
 
 
+ITEMS_INSERT_COLUMNS = [
+    'Code', 'Name', 'Name2', 'Measure', 'Measure2', 'SalePrice', 'GroupID', 'VatRateID',
+    'StatusID', 'VatTermID', 'Visible', 'FixedPrice', 'EcoTax', 'Priority', 'IsService',
+    'MainItemID', 'Barcode', 'Permit',
+]
+
+PARTNERS_INSERT_SQL = """
+    INSERT INTO [dbo].[Partners] (
+        PartnerID, Name, NameEnglish, ContactName, ContactNameEnglish, EMail, Bulstat,
+        VatId, BankName, BankCode, BankAccount, Priority, GroupID, Visible, MainPartnerID,
+        StatusID, IsExported, IsOSSPartner, CountryID, DocumentEndDatePeriod
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?, 0, 0, ?, 0)
+"""
+
+
+def _execute_batches(cursor, sql, rows, log, batch_size, offset=0, total=None):
+    cursor.fast_executemany = True
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if isinstance(batch, pd.DataFrame):
+            batch = list(batch.itertuples(index=False, name=None))
+        cursor.executemany(sql, batch)
+        done = offset + min(start + batch_size, len(rows))
+        log(f'  ... {done}/{total}' if total is not None else f'  ... {done}')
+
+
+ITEMS_CONFLICT_COLUMNS = ['Name', 'Measure', 'SalePrice', 'VatRateID', 'GroupID', 'StatusID', 'VatTermID']
+MULTI_IMPORT_POLICIES = ('first', 'last', 'error', 'priority', 'lowest', 'newest')
+MULTI_IMPORT_SAMPLE_SIZE = 20
+MULTI_IMPORT_WINNERS = {
+    'first': 'първият избран файл',
+    'last': 'последният избран файл',
+    'error': 'импортът се прекратява',
+    'priority': 'файлът с по-висок приоритет (MULTI_IMPORT_PRIORITY)',
+    'lowest': 'най-ниската цена',
+    'newest': 'най-новият файл',
+}
+# Items column -> column of the import sheet, so the merged workbook can be imported again as is.
+ITEMS_SHEET_COLUMNS = {
+    'Code': 'Код', 'Name': 'Стока', 'Measure': 'Мярка', 'SalePrice': 'Цена',
+    **{target: source for source, (target, _) in ITEMS_ID_COLUMNS.items()},
+}
+
+
+def _save_import_snapshot(snapshot, log, config):
+    if not snapshot:
+        return
+    try:
+        save_snapshot(snapshot, log, config)
+    except Exception as e:
+        log(f'⚠ Снимката за отмяна не е записана: {e}')
+
+
+def parse_group_scope(config=CONFIG):
+    scope = str(config['import_group_scope']).strip().lower()
+    if scope in ('', 'all'):
+        return None
+    if scope == 'workbook':
+        return scope
+    try:
+        return sorted({int(value) for value in scope.replace(';', ',').split(',') if value.strip()})
+    except ValueError:
+        raise ValueError(f"Невалидна стойност IMPORT_GROUP_SCOPE={config['import_group_scope']} (all, workbook или списък от GroupID)")
+
+
+def scope_items_import(data, log, config=CONFIG):
+    scope = parse_group_scope(config)
+    if scope is None:
+        return data, None
+    if scope == 'workbook':
+        groups = sorted(int(group) for group in data['GroupID'].dropna().unique())
+    else:
+        groups = scope
+        scoped = data[data['GroupID'].isin(groups)]
+        if len(scoped) < len(data):
+            log(f'⚠ Пропуснати редове от други групи: {len(data) - len(scoped)}')
+        data = scoped
+    if data.empty:
+        raise ValueError('Няма редове за импорт в избраните групи.')
+    log(f'ℹ Ограничен импорт{_groups_text(groups)}')
+    return data, groups
+
+
+def _groups_text(groups):
+    return f" (само GroupID {', '.join(str(group) for group in groups)})" if groups else ''
+
+
+def read_import_item_groups(import_files, log, config=CONFIG):
+    if not config['import_item_groups']:
+        return None
+    frames = [read_item_groups_sheet(import_file, log, config) for import_file in import_files]
+    frames = [frame for frame in frames if frame is not None]
+    return prepare_item_groups(pd.concat(frames, ignore_index=True), log) if frames else None
+
+
+def apply_items_import(conn, data, log, config=CONFIG, groups=None, item_groups=None):
+    rows = data[ITEMS_INSERT_COLUMNS] if isinstance(data, pd.DataFrame) else compact_items_frame(pd.DataFrame(list(data)))
+    return apply_items_import_stream(conn, [rows], log, config, total=len(rows), groups=groups, item_groups=item_groups)
+
+
+def apply_items_import_stream(conn, frames, log, config=CONFIG, total=None, stats=None, groups=None, item_groups=None, staging=False):
+    with capture_lock_diagnostics(conn, 'import_items', log, config, [config['table_name']]):
+        return _apply_items_import_stream(conn, frames, log, config, total, stats, groups, item_groups, staging)
+
+
+def _insert_items_frames(cursor, target, frames, log, config, total, stats, group_ids, stage):
+    insert_sql = f"""
+        INSERT INTO {target} ({', '.join(ITEMS_INSERT_COLUMNS)})
+        VALUES ({', '.join('?' for _ in ITEMS_INSERT_COLUMNS)})
+    """
+    inserted = 0
+    for rows in frames:
+        if group_ids:
+            rows = remap_group_ids(rows, group_ids)
+        started = time.monotonic()
+        with metric_stage(stage):
+            _execute_batches(cursor, insert_sql, rows, log, config['insert_batch_size'], offset=inserted, total=total)
+        inserted += len(rows)
+        if stats:
+            stats.add(stage, time.monotonic() - started)
+    return inserted
+
+
+def _apply_items_import_stream(conn, frames, log, config, total, stats, groups, item_groups, staging):
+    table = config['table_name']
+    columns = ', '.join(ITEMS_INSERT_COLUMNS)
+    cursor = conn.cursor()
+    snapshot = None
+    inserted = 0
+    group_ids = {}
+    try:
+        if staging:
+            # frames is a pipeline that is still reading the file. The chunks go to a temp table first, so
+            # Items is locked only for the hide and one INSERT ... SELECT at the end, not for the whole parse.
+            cursor.execute(f"SELECT TOP 0 IDENTITY(INT, 1, 1) AS StagingRowID, {columns} INTO #ItemsStaging FROM [dbo].[{table}]")
+            if not _insert_items_frames(cursor, '#ItemsStaging', frames, log, config, total, stats, {}, 'staging'):
+                raise ValueError('Няма валидни редове за импорт.')
+
+        # New groups get their IDs first; the workbook's GroupID values are then translated to them.
+        if item_groups is not None:
+            with metric_stage('groups'):
+                group_ids = upsert_item_groups(cursor, item_groups, log)
+                if staging:
+                    remap_staged_group_ids(cursor, '#ItemsStaging', group_ids)
+            if groups and groups != 'workbook':
+                groups = sorted({group_ids.get(group, group) for group in groups})
+        if groups == 'workbook':
+            # Only a staged import gets here: the groups are known once the whole file is in #ItemsStaging.
+            cursor.execute("SELECT DISTINCT GroupID FROM #ItemsStaging ORDER BY GroupID")
+            groups = [int(row[0]) for row in cursor.fetchall()]
+            log(f'ℹ Ограничен импорт{_groups_text(groups)}')
+
+        scope = ''
+        if groups:
+            # With an index on GroupID only the rows of the imported groups are read and locked.
+            scope = f" AND [GroupID] IN ({', '.join(str(int(group)) for group in groups)})"
+            if not is_leading_index_column(conn, 'dbo', table, 'GroupID'):
+                log(f'⚠ {table}.GroupID няма индекс: скриването на групите ще сканира цялата таблица.')
+
+        if config['import_snapshots']:
+            with metric_stage('snapshot'):
+                snapshot = take_import_snapshot(conn, 'items', config, groups)
+
+        with metric_stage('hide'):
+            cursor.execute(
+                f"""
+                SET NOCOUNT ON;
+                DECLARE @Targets TABLE (ItemID INT PRIMARY KEY);
+                DECLARE @Deleted INT;
+                INSERT INTO @Targets SELECT ItemID FROM [dbo].[{table}] WHERE [Visible] = 1{scope};
+                UPDATE t SET t.[Visible] = 0 FROM [dbo].[{table}] t JOIN @Targets x ON x.ItemID = t.ItemID;
+                DELETE t FROM [dbo].[{table}] t JOIN @Targets x ON x.ItemID = t.ItemID
+                WHERE NOT EXISTS (SELECT 1 FROM DocumentDetails d WHERE d.ItemID = t.ItemID)
+                AND NOT EXISTS (SELECT 1 FROM DocumentTemplateDetails dt WHERE dt.ItemID = t.ItemID);
+                SET @Deleted = @@ROWCOUNT;
+                SET NOCOUNT OFF;
+                SELECT (SELECT COUNT(*) FROM @Targets), @Deleted;
+                """
+            )
+            hidden, deleted = cursor.fetchone()
+        log(f'  Скрити: {hidden} | Изтрити неизползвани: {deleted}')
+
+        if staging:
+            with metric_stage('insert'):
+                # ORDER BY keeps the new ItemIDs in file order.
+                cursor.execute(f"INSERT INTO [dbo].[{table}] ({columns}) SELECT {columns} FROM #ItemsStaging ORDER BY StagingRowID")
+                inserted = cursor.rowcount
+                cursor.execute("DROP TABLE #ItemsStaging")
+            log(f'  Добавени: {inserted}')
+        else:
+            inserted = _insert_items_frames(cursor, f'[dbo].[{table}]', frames, log, config, total, stats, group_ids, 'insert')
+        if not inserted:
+            raise ValueError('Няма валидни редове за импорт.')
+        if snapshot:
+            finish_import_snapshot(conn, snapshot, snapshot['max_id_before'])
+
+        with metric_stage('commit'):
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    invalidate_replica(config, [table] + (['ItemGroups'] if item_groups is not None else []))
+    _save_import_snapshot(snapshot, log, config)
+    metric_rows('hidden', hidden)
+    metric_rows('deleted', deleted)
+    metric_rows('inserted', inserted)
+    return inserted
+
+
+def apply_partners_import(conn, data, log, config=CONFIG):
+    with capture_lock_diagnostics(conn, 'import_partners', log, config, ['Partners']):
+        return _apply_partners_import(conn, data, log, config)
+
+
+def _apply_partners_import(conn, data, log, config):
+    cursor = conn.cursor()
+    partner_id_is_identity = False
+    snapshot = None
+    try:
+        if config['import_snapshots']:
+            with metric_stage('snapshot'):
+                snapshot = take_import_snapshot(conn, 'partners', config)
+
+        with metric_stage('hide'):
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+                DECLARE @Hidden INT, @Deleted INT = 0;
+                UPDATE [dbo].[Partners] SET [Visible] = 0;
+                SET @Hidden = @@ROWCOUNT;
+                BEGIN TRY
+                    DELETE FROM [dbo].[Partners];
+                    SET @Deleted = @@ROWCOUNT;
+                END TRY
+                BEGIN CATCH
+                END CATCH;
+                SET NOCOUNT OFF;
+                SELECT @Hidden, @Deleted;
+                """
+            )
+            hidden, deleted = cursor.fetchone()
+        log(f'  Скрити: {hidden} | Изтрити: {deleted}')
+
+        cursor.execute("SELECT ISNULL(MAX([PartnerID]), 0) FROM [dbo].[Partners]")
+        max_partner_id = int(cursor.fetchone()[0] or 0)
+
+        cursor.execute("SELECT COLUMNPROPERTY(OBJECT_ID('dbo.Partners'), 'PartnerID', 'IsIdentity')")
+        row = cursor.fetchone()
+        partner_id_is_identity = bool(row and row[0] == 1)
+
+        if partner_id_is_identity:
+            cursor.execute("SET IDENTITY_INSERT [dbo].[Partners] ON")
+
+        rows = []
+        for i, partner in enumerate(data):
+            partner_id = max_partner_id + i + 1
+            rows.append(
+                (
+                    partner_id,
+                    partner['Name'],
+                    partner['NameEnglish'],
+                    partner['ContactName'],
+                    partner['ContactNameEnglish'],
+                    partner['EMail'],
+                    partner['Bulstat'],
+                    partner['VatId'],
+                    partner['BankName'],
+                    partner['BankCode'],
+                    partner['BankAccount'],
+                    partner['Priority'],
+                    partner['GroupID'],
+                    partner_id,
+                    partner['StatusID'],
+                    partner['CountryID'],
+                )
+            )
+        with metric_stage('insert'):
+            _execute_batches(cursor, PARTNERS_INSERT_SQL, rows, log, config['insert_batch_size'], total=len(rows))
+        if snapshot:
+            finish_import_snapshot(conn, snapshot, max_partner_id)
+
+        with metric_stage('commit'):
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if partner_id_is_identity:
+            try:
+                cursor.execute("SET IDENTITY_INSERT [dbo].[Partners] OFF")
+                conn.commit()
+            except Exception:
+                pass
+        cursor.close()
+
+    invalidate_replica(config, ['Partners'])
+    _save_import_snapshot(snapshot, log, config)
+    metric_rows('hidden', hidden)
+    metric_rows('deleted', deleted)
+    metric_rows('inserted', len(rows))
+    return len(rows)
+
+
+def is_over_memory_budget(import_file, config=CONFIG):
+    budget = config['memory_budget_mb'] * 1024 * 1024
+    return bool(budget) and not is_manifest_file(import_file) and estimate_sheet_memory(import_file) > budget
+
+
+def read_items_import_file(import_file, log, config=CONFIG):
+    if is_over_memory_budget(import_file, config):
+        return _read_items_import_chunks(import_file, log, config)
+
+    with metric_stage('read'):
+        df, _ = read_import_sheet(
+            import_file,
+            ['Items'],
+            log,
+            config,
+            skiprows=config['skiprows'],
+            fallback=config['sheet_name'],
+            dtype_plan='items',
+            kind='items',
+        )
+    metric_rows('read', len(df))
+    if not all(col in df.columns for col in EXPECTED_COLUMNS):
+        raise ValueError('Липсват задължителни колони!')
+    if df.empty:
+        raise ValueError('Файлът е празен!')
+
+    with metric_stage('prepare'):
+        data = build_items_import_frame(df, log)
+    if data.empty:
+        raise ValueError('Няма валидни редове за импорт.')
+    return len(df), data
+
+
+def _read_items_import_chunks(import_file, log, config):
+    log(
+        f"ℹ Файлът надхвърля MEMORY_BUDGET_MB={config['memory_budget_mb']} и се обработва на части "
+        f"по {config['chunk_rows']} реда"
+    )
+    chunks = iter_excel_sheet_chunks(
+        import_file,
+        ['Items'],
+        log,
+        config,
+        chunk_rows=config['chunk_rows'],
+        skiprows=config['skiprows'],
+        fallback=config['sheet_name'],
+        dtype_plan='items',
+        streaming=True,
+    )
+    rows_read = 0
+    frames = []
+    while True:
+        with metric_stage('read'):
+            df = next(chunks, None)
+        if df is None:
+            break
+        if not all(col in df.columns for col in EXPECTED_COLUMNS):
+            raise ValueError('Липсват задължителни колони!')
+        rows_read += len(df)
+        with metric_stage('prepare'):
+            frames.append(build_items_import_frame(df, log))
+        log(f'  ... прочетени {rows_read} реда')
+
+    metric_rows('read', rows_read)
+    if not rows_read:
+        raise ValueError('Файлът е празен!')
+    data = compact_items_frame(pd.concat(frames, ignore_index=True))
+    if data.empty:
+        raise ValueError('Няма валидни редове за импорт.')
+    return rows_read, data
+
+
+def import_items_file(import_file, log, config=CONFIG, conn=None):
+    # A file over MEMORY_BUDGET_MB always goes through the staged pipeline, so it is never held in memory whole.
+    over_budget = is_over_memory_budget(import_file, config)
+    if (config['import_pipeline'] or over_budget) and not is_manifest_file(import_file):
+        return import_items_file_pipelined(import_file, log, config, conn, streaming=over_budget)
+
+    with track_operation('import_items', config):
+        rows_read, data = read_items_import_file(import_file, log, config)
+        data, groups = scope_items_import(data, log, config)
+        item_groups = read_import_item_groups([import_file], log, config)
+
+        own_conn = conn is None
+        with metric_stage('connect'):
+            conn = conn or connect_database(config)
+        try:
+            inserted = apply_items_import(conn, data, log, config, groups, item_groups)
+        finally:
+            if own_conn:
+                conn.close()
+    log_peak_memory(log)
+    return {'rows_read': rows_read, 'inserted': inserted}
+
+
+def import_items_file_pipelined(import_file, log, config=CONFIG, conn=None, streaming=False):
+    counts = {'read': 0}
+    groups = parse_group_scope(config)
+    if groups and groups != 'workbook':
+        log(f'ℹ Ограничен импорт{_groups_text(groups)}')
+    if streaming:
+        log(f"ℹ Файлът надхвърля MEMORY_BUDGET_MB={config['memory_budget_mb']} и се чете поточно (openpyxl, read-only)")
+    item_groups = read_import_item_groups([import_file], log, config)
+
+    def prepare(df):
+        if not all(col in df.columns for col in EXPECTED_COLUMNS):
+            raise ValueError('Липсват задължителни колони!')
+        counts['read'] += len(df)
+        frame = build_items_import_frame(df, log)
+        if groups and groups != 'workbook':
+            frame = frame[frame['GroupID'].isin(groups)]
+        return frame if not frame.empty else None
+
+    with track_operation('import_items', config):
+        own_conn = conn is None
+        with metric_stage('connect'):
+            conn = conn or connect_database(config)
+        try:
+            log(f"ℹ Импорт на потоци: четене, подготовка и запис във временна таблица едновременно, по {config['pipeline_chunk_rows']} реда")
+            chunks = iter_excel_sheet_chunks(
+                import_file,
+                ['Items'],
+                log,
+                config,
+                chunk_rows=config['pipeline_chunk_rows'],
+                skiprows=config['skiprows'],
+                fallback=config['sheet_name'],
+                dtype_plan='items',
+                streaming=streaming,
+            )
+            # The pipeline threads copy the context when they start, so the lock sampler has to listen
+            # before run_pipeline for the read and prepare stages to reach it.
+            with capture_lock_diagnostics(conn, 'import_items', log, config, [config['table_name']]):
+                with run_pipeline(chunks, [('prepare', prepare)], queue_size=config['pipeline_queue_size']) as (frames, stats):
+                    inserted = _apply_items_import_stream(conn, frames, log, config, None, stats, groups, item_groups, True)
+            log(f'  Време по етапи (сек.): {stats.describe()}')
+        finally:
+            if own_conn:
+                conn.close()
+        metric_rows('read', counts['read'])
+    log_peak_memory(log)
+    return {'rows_read': counts['read'], 'inserted': inserted}
+
+
+def _parse_items_workbook(import_file, config):
+    messages = []
+    modified = os.path.getmtime(import_file) if os.path.exists(import_file) else 0.0
+    try:
+        rows_read, data = read_items_import_file(import_file, messages.append, config)
+        return {'file': import_file, 'modified': modified, 'rows_read': rows_read, 'data': data, 'error': None, 'log': messages}
+    except Exception as e:
+        return {'file': import_file, 'modified': modified, 'rows_read': 0, 'data': None, 'error': str(e), 'log': messages}
+
+
+def parse_items_workbooks(import_files, log, config=CONFIG):
+    workers = config['import_workers'] or os.cpu_count() or 1
+    workers = max(1, min(workers, len(import_files)))
+    log(f'Файлове: {len(import_files)} | Паралелни процеси: {workers}')
+
+    if workers == 1:
+        results = [_parse_items_workbook(path, config) for path in import_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_parse_items_workbook, import_files, [config] * len(import_files)))
+
+    for result in results:
+        name = os.path.basename(result['file'])
+        for message in result['log']:
+            log(f'  [{name}] {message}')
+        if result['error']:
+            log(f"  ✗ {name}: {result['error']}")
+        else:
+            log(f"  ✓ {name}: {result['rows_read']} реда, валидни {len(result['data'])}")
+    return results
+
+
+def parse_supplier_priority(config=CONFIG):
+    return [name.strip().casefold() for name in str(config['multi_import_priority']).replace(';', ',').split(',') if name.strip()]
+
+
+def _file_ranks(results, policy, priority):
+    # One rank per selected file; the lowest rank wins and ties keep the selection order.
+    count = len(results)
+    if policy == 'last':
+        return [count - order for order in range(count)]
+    if policy == 'newest':
+        by_age = sorted(range(count), key=lambda order: (-results[order]['modified'], -order))
+        return [by_age.index(order) for order in range(count)]
+    if policy == 'priority':
+        names = [os.path.basename(result['file']).casefold() for result in results]
+        matched = [next((rank for rank, supplier in enumerate(priority) if supplier in name), len(priority)) for name in names]
+        return [rank * count + order for order, rank in enumerate(matched)]
+    return list(range(count))
+
+
+def merge_items_payloads(results, policy, priority=()):
+    frames = [
+        result['data'].assign(Файл=os.path.basename(result['file']), Поредност=order)
+        for order, result in enumerate(results)
+        if result['data'] is not None and not result['data'].empty
+    ]
+    df = pd.concat(frames, ignore_index=True)
+    df = compact_items_frame(df).join(df[['Файл', 'Поредност']])
+    # Codes as integers: membership tests on the string column are far slower than np.isin.
+    code_ids = pd.factorize(df['Code'])[0]
+
+    distinct = df.drop_duplicates(subset=['Code'] + ITEMS_CONFLICT_COLUMNS)
+    conflict_ids = np.unique(code_ids[distinct.index[distinct['Code'].duplicated(keep=False)]])
+    conflicted = np.isin(code_ids, conflict_ids)
+    conflicts = distinct[conflicted[distinct.index]].sort_values(['Code', 'Поредност'], kind='stable')
+
+    if policy == 'error' and len(conflict_ids):
+        raise ValueError(f'{len(conflict_ids)} кода имат различни стойности в различните файлове.')
+
+    # After a stable sort by the policy key the first row of every Code wins.
+    ranked = df.assign(Ранг=df['Поредност'].map(dict(enumerate(_file_ranks(results, policy, priority)))))
+    keys = ['Code', 'Ранг']
+    if policy == 'lowest':
+        # A zero price means the file has no price for the item, so it wins only when no file has one.
+        ranked['Цена'] = ranked['SalePrice'].where(ranked['SalePrice'] > 0, np.inf)
+        keys = ['Code', 'Цена', 'Поредност']
+    merged = ranked.sort_values(keys, kind='stable').drop_duplicates(subset=['Code'], keep='first').sort_index()
+
+    winners = merged.set_index('Code')['Файл']
+    conflicts = conflicts[['Code', 'Файл'] + ITEMS_CONFLICT_COLUMNS].assign(
+        Избран=np.where(conflicts['Файл'].to_numpy() == conflicts['Code'].map(winners).to_numpy(), '✓', '')
+    )
+
+    # The prices of every conflicting code side by side, one column per file in selection order.
+    prices = df[conflicted].pivot_table(index='Code', columns='Файл', values='SalePrice', aggfunc='last', sort=False)
+    prices = prices[[name for name in dict.fromkeys(os.path.basename(result['file']) for result in results) if name in prices.columns]]
+    offered = prices.where(prices > 0)
+    lowest, highest = offered.min(axis=1), offered.max(axis=1)
+    prices = prices.assign(
+        **{
+            'Мин.': lowest,
+            'Макс.': highest,
+            'Разлика %': ((highest - lowest) / lowest.where(lowest > 0) * 100).round(2),
+            'Избрана цена': merged.set_index('Code')['SalePrice'].reindex(prices.index),
+            'Избран файл': winners.reindex(prices.index),
+        }
+    ).reset_index()
+    prices.columns.name = None
+
+    data = merged[ITEMS_INSERT_COLUMNS].reset_index(drop=True)
+    sources = merged['Файл'].reset_index(drop=True)
+    return data, sources, conflicts, prices, len(df) - len(merged)
+
+
+def write_merged_items_workbook(merged_file, data, sources, config=CONFIG):
+    sheet = data[list(ITEMS_SHEET_COLUMNS)].rename(columns=ITEMS_SHEET_COLUMNS).assign(Файл=sources)
+    with pd.ExcelWriter(merged_file, engine='openpyxl') as writer:
+        sheet.to_excel(writer, index=False, sheet_name='Items', startrow=config['skiprows'])
+    return merged_file
+
+
+def write_multi_import_conflicts(report_file, conflicts, prices):
+    with pd.ExcelWriter(report_file, engine='openpyxl') as writer:
+        conflicts.to_excel(writer, index=False, sheet_name='Конфликти')
+        prices.to_excel(writer, index=False, sheet_name='Цени')
+    return report_file
+
+
+def import_partners_file(import_file, log, config=CONFIG, conn=None):
+    with track_operation('import_partners', config):
+        with metric_stage('read'):
+            df, _ = read_import_sheet(
+                import_file, ['Партньори', 'Partners'], log, config, dtype_plan='partners', kind='partners'
+            )
+        metric_rows('read', len(df))
+        if df.empty:
+            raise ValueError('Файлът е празен!')
+
+        with metric_stage('prepare'):
+            data = build_partners_import_payload(df, log)
+        if not data:
+            raise ValueError('Няма валидни редове за импорт.')
+
+        own_conn = conn is None
+        with metric_stage('connect'):
+            conn = conn or connect_database(config)
+        try:
+            if not check_table_exists(conn, config, 'Partners'):
+                raise ValueError("Таблица 'Partners' не е намерена в избраната база.")
+            inserted = apply_partners_import(conn, data, log, config)
+        finally:
+            if own_conn:
+                conn.close()
+    log_peak_memory(log)
+    return {'rows_read': len(df), 'inserted': inserted}
+
+
+def write_import_script(kind, data, import_file, log, config=CONFIG, groups=None):
+    script_file = with_tk_dialog(
+        lambda r: filedialog.asksaveasfilename(
+            title='Запази T-SQL скрипта като',
+            initialdir=os.path.dirname(import_file),
+            initialfile=f'{os.path.splitext(os.path.basename(import_file))[0]}{SCRIPT_SUFFIX}',
+            defaultextension=SCRIPT_SUFFIX,
+            filetypes=[('SQL скриптове', f'*{SCRIPT_SUFFIX}'), ('Всички файлове', '*.*')],
+            parent=r,
+        )
+    )
+    if not script_file:
+        log('Записът на скрипта е отменен от потребителя.')
+        return None
+
+    started = time.monotonic()
+    if kind == 'items':
+        rows = write_items_script(script_file, data[ITEMS_INSERT_COLUMNS], ITEMS_INSERT_COLUMNS, config, groups)
+    else:
+        rows = write_partners_script(script_file, data, config)
+    log(
+        f'✓ T-SQL скрипт: {rows} записа в {script_file} '
+        f'({os.path.getsize(script_file) // 1024} KB, {time.monotonic() - started:.1f} сек.)'
+    )
+    if not str(config.get('database', '')).strip():
+        log('ℹ Скриптът няма USE: задайте базата при изпълнение (sqlcmd -d <база>).')
+    with_tk_dialog(lambda r: messagebox.showinfo('Успех', f'Скриптът е записан:\n{script_file}', parent=r))
+    return script_file
+
+
 def import_items_excel(log, config=CONFIG):
-    if not ensure_database_selected(config, log):
+    script_output = config['import_output'] == 'script'
+    if not script_output and not ensure_database_selected(config, log):
         log('Импортът е отменен: няма избрана база данни.')
         return
 
     import_file = with_tk_dialog(
         lambda r: filedialog.askopenfilename(
             title='Изберете Excel файл за импорт',
-            filetypes=[('Excel файлове', '*.xlsx *.xls'), ('Всички файлове', '*.*')],
+            filetypes=[('Excel файлове', '*.xlsx *.xls'), ('Експорт на части', f'*{MANIFEST_SUFFIX}'), ('Всички файлове', '*.*')],
             initialdir=os.getcwd(),
             parent=r,
         )
@@ -195,75 +904,136 @@ def import_items_excel(log, config=CONFIG):
 
     try:
         try:
-            df = pd.read_excel(import_file, sheet_name='Items', skiprows=config['skiprows'])
-        except ValueError:
-            df = pd.read_excel(import_file, sheet_name=config['sheet_name'], skiprows=config['skiprows'])
+            _, data = read_items_import_file(import_file, log, config)
+            data, groups = scope_items_import(data, log, config)
+        except ValueError as e:
+            log(f'✗ {e}')
+            return
 
-        if not all(col in df.columns for col in EXPECTED_COLUMNS):
-            log('✗ Липсват задължителни колони!')
+        print('\nПърви 3 реда:')
+        print(data.head(3).to_string())
+
+        if script_output:
+            if config['import_item_groups']:
+                log('⚠ T-SQL скриптът не обновява ItemGroups (IMPORT_ITEM_GROUPS се прилага само при директен импорт).')
+            write_import_script('items', data, import_file, log, config, groups)
             return
 
-        if df.empty:
-            log('✗ Файлът е празен!')
+        conn = connect_with_fallback(config, log)
+        if not conn:
             return
 
-        print('\nПърви 3 реда:')
-        print(df.head(3).to_string())
+        try:
+            preview = run_import_preview(conn, 'items', data, log, config, groups) if config['import_preview'] else ''
+            if not with_tk_dialog(
+                lambda r: messagebox.askyesno(
+                    'Потвърждение',
+                    f"Ще бъдат заменени записите в '{config['table_name']}'{_groups_text(groups)} с {len(data)} нови.\n{preview}Потвърждавате ли?",
+                    parent=r,
+                )
+            ):
+                return
 
-        if not with_tk_dialog(
-            lambda r: messagebox.askyesno(
-                'Потвърждение',
-                f"Ще бъдат заменени записите в '{config['table_name']}' с {len(df)} нови.\nПотвърждавате ли?",
-                parent=r,
-            )
-        ):
+            # Only the database work after the confirmation is timed, so the time spent in the dialog is not counted.
+            with track_operation('import_items', config):
+                metric_rows('read', len(data))
+                inserted = apply_items_import(conn, data, log, config, groups, read_import_item_groups([import_file], log, config))
+            log(f'✓ Импортирани {inserted} записа')
+            log_peak_memory(log)
+            with_tk_dialog(lambda r: messagebox.showinfo('Успех', f'Импортирани {inserted} записа!', parent=r))
+        except Exception as e:
+            log(f'✗ Грешка: {e}')
+            raise
+        finally:
+            conn.close()
+
+    except Exception as e:
+        log(f'✗ Грешка при импорт: {e}')
+
+
+def import_items_multi_excel(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Импортът е отменен: няма избрана база данни.')
+        return
+
+    policy = config['multi_import_conflicts']
+    if policy not in MULTI_IMPORT_POLICIES:
+        log(f"✗ Невалидна стойност MULTI_IMPORT_CONFLICTS={policy} (допустими: {', '.join(MULTI_IMPORT_POLICIES)})")
+        return
+    priority = parse_supplier_priority(config)
+    if policy == 'priority' and not priority:
+        log('✗ MULTI_IMPORT_CONFLICTS=priority изисква MULTI_IMPORT_PRIORITY (доставчици по приоритет, разделени със запетая)')
+        return
+
+    import_files = with_tk_dialog(
+        lambda r: filedialog.askopenfilenames(
+            title='Изберете Excel файлове за импорт',
+            filetypes=[('Excel файлове', '*.xlsx *.xls'), ('Експорт на части', f'*{MANIFEST_SUFFIX}'), ('Всички файлове', '*.*')],
+            initialdir=os.getcwd(),
+            parent=r,
+        )
+    )
+    if not import_files:
+        log('Импортът е отменен от потребителя.')
+        return
+
+    import_files = list(import_files)
+    log('=== ИМПОРТ НА СТОКИ ОТ НЯКОЛКО EXCEL ФАЙЛА ===')
+    log(f'При еднакъв код с различни данни: {policy} ({MULTI_IMPORT_WINNERS[policy]})')
+    if policy == 'priority':
+        log(f"Приоритет на доставчиците: {' > '.join(priority)}")
+
+    try:
+        results = parse_items_workbooks(import_files, log, config)
+        failed = [result for result in results if result['error']]
+        if failed:
+            log(f'✗ {len(failed)} файла не могат да бъдат прочетени. Импортът е прекратен.')
             return
 
-        data = build_items_import_payload(df, log)
-        if not data:
+        report_dir = os.path.dirname(import_files[0])
+        try:
+            data, sources, conflicts, prices, duplicates = merge_items_payloads(results, policy, priority)
+        except ValueError as e:
+            log(f'✗ {e}')
+            return
+
+        log(f'Общо редове: {sum(len(result["data"]) for result in results)} | Повторени кодове: {duplicates} | За импорт: {len(data)}')
+        if not conflicts.empty:
+            log(f"⚠ Кодове с различни данни: {conflicts['Code'].nunique()} (избира се {MULTI_IMPORT_WINNERS[policy]})")
+            print(f'\nКонфликти (първи {MULTI_IMPORT_SAMPLE_SIZE}):')
+            print(conflicts.head(MULTI_IMPORT_SAMPLE_SIZE).to_string(index=False))
+            report_file = write_multi_import_conflicts(os.path.join(report_dir, 'multi_import_conflicts.xlsx'), conflicts, prices)
+            log(f'✓ Отчет за конфликтите: {report_file}')
+        merged_file = write_merged_items_workbook(os.path.join(report_dir, 'multi_import_merged.xlsx'), data, sources, config)
+        log(f'✓ Обединен файл: {merged_file}')
+
+        try:
+            data, groups = scope_items_import(data, log, config)
+        except ValueError as e:
+            log(f'✗ {e}')
             return
 
         conn = connect_with_fallback(config, log)
         if not conn:
             return
 
-        cursor = conn.cursor()
-
         try:
-            cursor.execute(
-                f"""
-                DECLARE @Targets TABLE (ItemID INT);
-                INSERT INTO @Targets SELECT ItemID FROM [dbo].[{config['table_name']}] WHERE [Visible] = 1;
-                UPDATE [dbo].[{config['table_name']}] SET [Visible] = 0 WHERE ItemID IN (SELECT ItemID FROM @Targets);
-                DELETE FROM [dbo].[{config['table_name']}] WHERE ItemID IN (SELECT ItemID FROM @Targets)
-                AND ItemID NOT IN (SELECT ItemID FROM DocumentDetails WHERE ItemID IS NOT NULL)
-                AND ItemID NOT IN (SELECT ItemID FROM DocumentTemplateDetails WHERE ItemID IS NOT NULL);
-                """
-            )
-
-            for i, item in enumerate(data):
-                cursor.execute(
-                    f"""
-                    INSERT INTO [dbo].[{config['table_name']}] (
-                        Code, Name, Name2, Measure, Measure2, SalePrice, GroupID, VatRateID,
-                        StatusID, VatTermID, Visible, FixedPrice, EcoTax, Priority, IsService,
-                        MainItemID, Barcode, Permit
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    tuple(item.values()),
+            preview = run_import_preview(conn, 'items', data, log, config, groups) if config['import_preview'] else ''
+            if not with_tk_dialog(
+                lambda r: messagebox.askyesno(
+                    'Потвърждение',
+                    f"Ще бъдат заменени записите в '{config['table_name']}'{_groups_text(groups)} с {len(data)} нови от {len(import_files)} файла.\n{preview}Потвърждавате ли?",
+                    parent=r,
                 )
+            ):
+                return
 
-                if (i + 1) % 100 == 0:
-                    log(f'  ... {i + 1}/{len(data)}')
-
-            conn.commit()
-            log(f'✓ Импортирани {len(data)} записа')
-            with_tk_dialog(lambda r: messagebox.showinfo('Успех', f'Импортирани {len(data)} записа!', parent=r))
-
-        except Exception as e:
-            conn.rollback()
-            log(f'✗ Грешка: {e}')
-            raise
+            with track_operation('import_items_multi', config):
+                metric_rows('read', len(data))
+                inserted = apply_items_import(conn, data, log, config, groups, read_import_item_groups(import_files, log, config))
+            log(f'✓ Импортирани {inserted} записа от {len(import_files)} файла')
+            log_peak_memory(log)
+            with_tk_dialog(lambda r: messagebox.showinfo('Успех', f'Импортирани {inserted} записа!', parent=r))
         finally:
             conn.close()
 
@@ -272,14 +1042,15 @@ def import_items_excel(log, config=CONFIG):
 
 
 def import_partners_excel(log, config=CONFIG):
-    if not ensure_database_selected(config, log):
+    script_output = config['import_output'] == 'script'
+    if not script_output and not ensure_database_selected(config, log):
         log('Импортът е отменен: няма избрана база данни.')
         return
 
     import_file = with_tk_dialog(
         lambda r: filedialog.askopenfilename(
             title='Изберете Excel файл за импорт на партньори',
-            filetypes=[('Excel файлове', '*.xlsx *.xls'), ('Всички файлове', '*.*')],
+            filetypes=[('Excel файлове', '*.xlsx *.xls'), ('Експорт на части', f'*{MANIFEST_SUFFIX}'), ('Всички файлове', '*.*')],
             initialdir=os.getcwd(),
             parent=r,
         )
@@ -296,14 +1067,11 @@ def import_partners_excel(log, config=CONFIG):
         return
 
     try:
-        try:
-            df = pd.read_excel(import_file, sheet_name='Партньори')
-        except ValueError:
-            try:
-                df = pd.read_excel(import_file, sheet_name='Partners')
-            except ValueError:
-                df = pd.read_excel(import_file, sheet_name=0)
-                log("ℹ Sheet 'Партньори'/'Partners' не е намерен. Използван е първият sheet.")
+        df, sheet_name = read_import_sheet(
+            import_file, ['Партньори', 'Partners'], log, config, dtype_plan='partners', kind='partners'
+        )
+        if sheet_name not in ('Партньори', 'Partners'):
+            log("ℹ Sheet 'Партньори'/'Partners' не е намерен. Използван е първият sheet.")
 
         if df.empty:
             log('✗ Файлът е празен!')
@@ -312,97 +1080,38 @@ def import_partners_excel(log, config=CONFIG):
         print('\nПърви 3 реда:')
         print(df.head(3).to_string())
 
-        if not with_tk_dialog(
-            lambda r: messagebox.askyesno(
-                'Потвърждение',
-                f'Ще бъдат заменени записите в Partners с {len(df)} нови.\nПотвърждавате ли?',
-                parent=r,
-            )
-        ):
-            return
-
         data = build_partners_import_payload(df, log)
         if not data:
             return
 
+        if script_output:
+            write_import_script('partners', data, import_file, log, config)
+            return
+
         conn = connect_with_fallback(config, log)
         if not conn:
             return
 
-        cursor = conn.cursor()
-        partner_id_is_identity = False
-
         try:
-            cursor.execute(
-                """
-                SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
-                WHERE TABLE_NAME = 'Partners' AND TABLE_TYPE = 'BASE TABLE'
-                """
-            )
-            if cursor.fetchone()[0] == 0:
+            if not check_table_exists(conn, config, 'Partners'):
                 log("✗ Таблица 'Partners' не е намерена в избраната база.")
                 return
 
-            cursor.execute(
-                """
-                UPDATE [dbo].[Partners] SET [Visible] = 0;
-                BEGIN TRY
-                    DELETE FROM [dbo].[Partners];
-                END TRY
-                BEGIN CATCH
-                END CATCH;
-                """
-            )
-
-            cursor.execute("SELECT ISNULL(MAX([PartnerID]), 0) FROM [dbo].[Partners]")
-            max_partner_id = int(cursor.fetchone()[0] or 0)
-
-            cursor.execute("SELECT COLUMNPROPERTY(OBJECT_ID('dbo.Partners'), 'PartnerID', 'IsIdentity')")
-            row = cursor.fetchone()
-            partner_id_is_identity = bool(row and row[0] == 1)
-
-            if partner_id_is_identity:
-                cursor.execute("SET IDENTITY_INSERT [dbo].[Partners] ON")
-
-            insert_sql = """
-                INSERT INTO [dbo].[Partners] (
-                    PartnerID, Name, NameEnglish, ContactName, ContactNameEnglish, EMail, Bulstat,
-                    VatId, BankName, BankCode, BankAccount, Priority, GroupID, Visible, MainPartnerID,
-                    StatusID, IsExported, IsOSSPartner, CountryID, DocumentEndDatePeriod
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?, 0, 0, ?, 0)
-            """
-
-            inserted = 0
-
-            for i, partner in enumerate(data):
-                partner_id = max_partner_id + i + 1
-                insert_values = (
-                    partner_id,
-                    partner['Name'],
-                    partner['NameEnglish'],
-                    partner['ContactName'],
-                    partner['ContactNameEnglish'],
-                    partner['EMail'],
-                    partner['Bulstat'],
-                    partner['VatId'],
-                    partner['BankName'],
-                    partner['BankCode'],
-                    partner['BankAccount'],
-                    partner['Priority'],
-                    partner['GroupID'],
-                    partner_id,
-                    partner['StatusID'],
-                    partner['CountryID'],
+            preview = run_import_preview(conn, 'partners', data, log, config) if config['import_preview'] else ''
+            if not with_tk_dialog(
+                lambda r: messagebox.askyesno(
+                    'Потвърждение',
+                    f'Ще бъдат заменени записите в Partners с {len(data)} нови.\n{preview}Потвърждавате ли?',
+                    parent=r,
                 )
+            ):
+                return
 
-                cursor.execute(insert_sql, insert_values)
-                inserted += 1
-
-                if (i + 1) % 100 == 0:
-                    log(f'  ... {i + 1}/{len(data)}')
-
-            conn.commit()
+            with track_operation('import_partners', config):
+                metric_rows('read', len(df))
+                inserted = apply_partners_import(conn, data, log, config)
             log(f'✓ Импортът приключи. Добавени: {inserted}')
+            log_peak_memory(log)
             with_tk_dialog(
                 lambda r: messagebox.showinfo(
                     'Успех',
@@ -411,16 +1120,9 @@ def import_partners_excel(log, config=CONFIG):
                 )
             )
         except Exception as e:
-            conn.rollback()
             log(f'✗ Грешка: {e}')
             raise
         finally:
-            if partner_id_is_identity:
-                try:
-                    cursor.execute("SET IDENTITY_INSERT [dbo].[Partners] OFF")
-                    conn.commit()
-                except Exception:
-                    pass
             conn.close()
     except Exception as e:
         log(f'✗ Грешка при импорт на партньори: {e}')
@@ -471,10 +1173,8 @@ def convert_warehouse_partners_excel_for_invoice_pro(log, config=CONFIG):
     log('=== КОНВЕРТИРАНЕ WAREHOUSE PARTNERS -> INVOICE PRO ПАРТНЬОРИ ===')
 
     try:
-        try:
-            df_source = pd.read_excel(source_file, sheet_name='Partners')
-        except ValueError:
-            df_source = pd.read_excel(source_file, sheet_name=0)
+        df_source, sheet_name = read_excel_sheet(source_file, ['Partners'], log, config, dtype_plan='partners')
+        if sheet_name != 'Partners':
             log("ℹ Sheet 'Partners' не е намерен. Използван е първият sheet.")
 
         if df_source.empty:
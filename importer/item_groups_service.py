@@ -0,0 +1,162 @@
+import os
+
+import pandas as pd
+
+try:
+    from .state import read_json
+    from .utils import parse_id_value
+    from .workbook import is_manifest_file, read_excel_sheet
+except ImportError:
+    from state import read_json
+    from utils import parse_id_value
+    from workbook import is_manifest_file, read_excel_sheet
+
+
+ITEM_GROUPS_SHEET = 'ItemGroups'
+ITEM_GROUPS_ID_COLUMN = 'Група ID'
+ITEM_GROUPS_NAME_COLUMNS = ['Име', 'Name']
+ITEM_GROUPS_CODE_COLUMNS = ['Код', 'Code']
+
+ITEM_GROUPS_MERGE_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @Output TABLE (Action NVARCHAR(10), RowID INT, GroupID INT);
+
+    UPDATE s SET s.TargetID = t.GroupID
+    FROM #ItemGroupsSource s JOIN [dbo].[ItemGroups] t ON t.GroupID = s.SourceID;
+
+    UPDATE s SET s.TargetID = m.GroupID
+    FROM #ItemGroupsSource s
+    CROSS APPLY (
+        SELECT TOP 1 t.GroupID FROM [dbo].[ItemGroups] t
+        WHERE t.Name = s.Name AND NOT EXISTS (SELECT 1 FROM #ItemGroupsSource o WHERE o.TargetID = t.GroupID)
+        ORDER BY t.GroupID
+    ) m
+    WHERE s.TargetID IS NULL
+      -- One set-based UPDATE does not see its own writes, so only the first row with a name may take it.
+      AND NOT EXISTS (SELECT 1 FROM #ItemGroupsSource p WHERE p.TargetID IS NULL AND p.Name = s.Name AND p.RowID < s.RowID);
+    {assign_ids}
+
+    MERGE [dbo].[ItemGroups] AS t
+    USING #ItemGroupsSource AS s ON t.GroupID = s.TargetID
+    WHEN MATCHED AND (t.Name <> s.Name OR (s.Code <> N'' AND ISNULL(t.Code, N'') <> s.Code)) THEN
+        UPDATE SET t.Name = s.Name, t.Code = CASE WHEN s.Code <> N'' THEN s.Code ELSE t.Code END
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT ({insert_columns}) VALUES ({insert_values})
+    OUTPUT $action, s.RowID, inserted.GroupID INTO @Output;
+
+    UPDATE s SET s.TargetID = o.GroupID
+    FROM #ItemGroupsSource s JOIN @Output o ON o.RowID = s.RowID
+    WHERE o.Action = 'INSERT';
+
+    SELECT s.SourceID, s.TargetID, o.Action
+    FROM #ItemGroupsSource s LEFT JOIN @Output o ON o.RowID = s.RowID;
+"""
+
+# Without IDENTITY the new groups get MAX(GroupID) + n, numbered in sheet order.
+ITEM_GROUPS_ASSIGN_IDS_SQL = """
+    WITH n AS (
+        SELECT TargetID, ROW_NUMBER() OVER (ORDER BY RowID) AS RowNumber FROM #ItemGroupsSource WHERE TargetID IS NULL
+    )
+    UPDATE n SET TargetID = (SELECT ISNULL(MAX(GroupID), 0) FROM [dbo].[ItemGroups]) + RowNumber;
+"""
+
+
+def _first_column(df, candidates):
+    return next((column for column in candidates if column in df.columns), None)
+
+
+def read_item_groups_sheet(import_file, log, config):
+    # A sharded export repeats the reference sheets in every part, so the first part is enough.
+    path = import_file
+    if is_manifest_file(import_file):
+        manifest = read_json(import_file, None) or {}
+        shards = manifest.get('shards') or []
+        if not shards:
+            return None
+        path = os.path.join(os.path.dirname(os.path.abspath(import_file)), shards[0]['file'])
+    try:
+        df, _ = read_excel_sheet(path, [ITEM_GROUPS_SHEET], log, config, fallback=None)
+    except ValueError:
+        log(f"ℹ Sheet '{ITEM_GROUPS_SHEET}' не е намерен. Групите не се обновяват.")
+        return None
+    return df
+
+
+def prepare_item_groups(df, log):
+    name_column = _first_column(df, ITEM_GROUPS_NAME_COLUMNS) if df is not None else None
+    if name_column is None or df.empty:
+        return None
+
+    code_column = _first_column(df, ITEM_GROUPS_CODE_COLUMNS)
+    ids = df[ITEM_GROUPS_ID_COLUMN].map(parse_id_value) if ITEM_GROUPS_ID_COLUMN in df.columns else pd.Series(None, index=df.index)
+    groups = pd.DataFrame(
+        {
+            'SourceID': pd.array(ids, dtype='Int64'),
+            'Code': df[code_column].fillna('').astype(str).str.strip() if code_column else '',
+            'Name': df[name_column].fillna('').astype(str).str.strip(),
+        }
+    )
+    groups = groups[groups['Name'] != '']
+    # One row per workbook ID; groups without an ID are matched by name, so one row per name is enough.
+    with_id = groups[groups['SourceID'].notna()].drop_duplicates('SourceID', keep='last')
+    without_id = groups[groups['SourceID'].isna()]
+    without_id = without_id[~without_id['Name'].str.casefold().isin(with_id['Name'].str.casefold())]
+    without_id = without_id.drop_duplicates(subset='Name', keep='last')
+    groups = pd.concat([with_id, without_id], ignore_index=True)
+    if len(without_id):
+        log(f'ℹ Групи без ID в sheet {ITEM_GROUPS_SHEET}: {len(without_id)} (съпоставят се по име)')
+    return groups if not groups.empty else None
+
+
+def upsert_item_groups(cursor, groups, log):
+    cursor.execute(
+        """
+        CREATE TABLE #ItemGroupsSource (
+            RowID INT PRIMARY KEY, SourceID INT NULL, Code NVARCHAR(4000) NOT NULL,
+            Name NVARCHAR(4000) NOT NULL, TargetID INT NULL
+        )
+        """
+    )
+    rows = [
+        (row_id, None if pd.isna(source_id) else int(source_id), code, name)
+        for row_id, (source_id, code, name) in enumerate(groups[['SourceID', 'Code', 'Name']].itertuples(index=False, name=None), 1)
+    ]
+    cursor.fast_executemany = True
+    cursor.executemany("INSERT INTO #ItemGroupsSource (RowID, SourceID, Code, Name) VALUES (?, ?, ?, ?)", rows)
+
+    cursor.execute("SELECT COLUMNPROPERTY(OBJECT_ID('dbo.ItemGroups'), 'GroupID', 'IsIdentity')")
+    row = cursor.fetchone()
+    identity = bool(row and row[0] == 1)
+    if identity:
+        sql = ITEM_GROUPS_MERGE_SQL.format(assign_ids='', insert_columns='Code, Name', insert_values='s.Code, s.Name')
+    else:
+        sql = ITEM_GROUPS_MERGE_SQL.format(
+            assign_ids=ITEM_GROUPS_ASSIGN_IDS_SQL, insert_columns='GroupID, Code, Name', insert_values='s.TargetID, s.Code, s.Name'
+        )
+    cursor.execute(sql)
+    result = cursor.fetchall()
+    cursor.execute("DROP TABLE #ItemGroupsSource")
+
+    actions = pd.Series([action for _, _, action in result], dtype=object)
+    log(f"  Групи: нови {int((actions == 'INSERT').sum())} | преименувани {int((actions == 'UPDATE').sum())} | без промяна {int(actions.isna().sum())}")
+    return {int(source_id): int(target_id) for source_id, target_id, _ in result if source_id is not None and target_id is not None}
+
+
+def remap_group_ids(frame, mapping):
+    changed = {source: target for source, target in mapping.items() if source != target}
+    if not changed:
+        return frame
+    group_ids = frame['GroupID']
+    remapped = group_ids.map(changed).fillna(group_ids).astype('int64')
+    return frame.assign(GroupID=pd.to_numeric(remapped, downcast='integer'))
+
+
+def remap_staged_group_ids(cursor, table, mapping):
+    changed = [(source, target) for source, target in mapping.items() if source != target]
+    if not changed:
+        return
+    cursor.execute("CREATE TABLE #ItemGroupsMap (SourceID INT PRIMARY KEY, TargetID INT NOT NULL)")
+    cursor.fast_executemany = True
+    cursor.executemany("INSERT INTO #ItemGroupsMap (SourceID, TargetID) VALUES (?, ?)", changed)
+    cursor.execute(f"UPDATE s SET s.GroupID = m.TargetID FROM {table} s JOIN #ItemGroupsMap m ON m.SourceID = s.GroupID")
+    cursor.execute("DROP TABLE #ItemGroupsMap")
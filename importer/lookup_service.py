@@ -0,0 +1,215 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .config import CONFIG
+    from .db import check_table_exists, ensure_database_selected
+    from .replica_service import connect_read_source
+    from .utils import transliterate
+except ImportError:
+    from config import CONFIG
+    from db import check_table_exists, ensure_database_selected
+    from replica_service import connect_read_source
+    from utils import transliterate
+
+
+LOOKUP_LIMIT = 20
+NGRAM = 3
+
+ITEMS_LOOKUP_SQL = """
+    SELECT [Code] AS 'Код', [Name] AS 'Стока', [Name2] AS 'Стока (EN)', [Measure] AS 'Мярка',
+           [SalePrice] AS 'Цена', [GroupID] AS 'Група ID'
+    FROM [dbo].[{table}]
+    WHERE [Visible] = 1
+"""
+PARTNERS_LOOKUP_SQL = """
+    SELECT [PartnerID] AS 'PartnerID', [Name] AS 'Име', [NameEnglish] AS 'Име (EN)',
+           [Bulstat] AS 'Булстат', [VatId] AS 'ДДС Номер', [EMail] AS 'EMail'
+    FROM [dbo].[Partners]
+    WHERE [Visible] = 1
+"""
+
+# One index per server/database for the lifetime of the process.
+_SESSION_INDEXES = {}
+
+
+# Casefold before transliterating: 'Я' -> 'Qa' but 'я' -> 'q', so the other order is not case-insensitive.
+def normalize_text(value):
+    return transliterate(str(value).casefold())
+
+
+def normalize_texts(series):
+    # transliterate() maps character by character, so one translate table per column gives the same result.
+    texts = [text.casefold() for text in series.fillna('').astype(str).to_numpy(dtype=object)]
+    table = str.maketrans({char: transliterate(char) for char in set(''.join(texts)) if char.strip()})
+    return [text.translate(table) for text in texts]
+
+
+def normalize_key(value):
+    if pd.isna(value):
+        return ''
+    return ''.join(str(value).split()).upper()
+
+
+def _group_rows(keys, rows):
+    codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+    return dict(zip(uniques, np.split(rows[order].astype(np.int32), bounds)))
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class TextIndex:
+    # Trigram postings narrow the candidates, the substring check on them makes the match exact.
+    def __init__(self, texts):
+        self.texts = np.array(texts, dtype=object)
+        grams = [_ngrams(text) for text in self.texts]
+        rows = np.repeat(np.arange(len(grams), dtype=np.int32), [len(row_grams) for row_grams in grams])
+        self.postings = _group_rows([gram for row_grams in grams for gram in row_grams], rows)
+
+    def search(self, query):
+        query = normalize_text(query)
+        if not query:
+            return np.array([], dtype=np.int32)
+        grams = _ngrams(query)
+        if not grams:
+            candidates = np.arange(len(self.texts), dtype=np.int32)
+        else:
+            lists = sorted((self.postings.get(gram) for gram in grams), key=lambda rows: -1 if rows is None else len(rows))
+            if lists[0] is None:
+                return np.array([], dtype=np.int32)
+            candidates = lists[0]
+            for rows in lists[1:]:
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+                if not len(candidates):
+                    return candidates
+        return candidates[[query in text for text in self.texts[candidates]]]
+
+
+class KeyIndex:
+    def __init__(self, values):
+        keys = [normalize_key(value) for value in values.to_numpy(dtype=object)]
+        self.rows = _group_rows(keys, np.arange(len(keys)))
+        self.rows.pop('', None)
+
+    def search(self, query):
+        return self.rows.get(normalize_key(query), np.array([], dtype=np.int32))
+
+
+class LookupIndex:
+    def __init__(self, items, partners):
+        self.items = items.reset_index(drop=True)
+        self.partners = partners.reset_index(drop=True)
+        self.built_at = time.time()
+        self.item_codes = KeyIndex(self.items['Код'])
+        self.item_names = TextIndex(_search_texts(self.items, ['Стока', 'Стока (EN)']))
+        self.partner_bulstats = KeyIndex(self.partners['Булстат'])
+        self.partner_vat_ids = KeyIndex(self.partners['ДДС Номер'])
+        self.partner_names = TextIndex(_search_texts(self.partners, ['Име', 'Име (EN)']))
+
+    def search(self, query, limit=LOOKUP_LIMIT):
+        key = normalize_key(query)
+        bulstat_rows = self.partner_bulstats.search(query)
+        if not len(bulstat_rows) and len(key) > 2 and key[:2].isalpha():
+            bulstat_rows = self.partner_bulstats.search(key[2:])
+        partner_key_rows = np.union1d(bulstat_rows, self.partner_vat_ids.search(query)).astype(np.int32)
+
+        item_codes = self.item_codes.search(query)
+        item_names = self.item_names.search(query)
+        partner_names = self.partner_names.search(query)
+        return [
+            ('Стоки по код', self.items.iloc[item_codes[:limit]], len(item_codes)),
+            ('Стоки по име', self.items.iloc[item_names[:limit]], len(item_names)),
+            ('Партньори по Булстат/ДДС номер', self.partners.iloc[partner_key_rows[:limit]], len(partner_key_rows)),
+            ('Партньори по име', self.partners.iloc[partner_names[:limit]], len(partner_names)),
+        ]
+
+
+def _search_texts(df, columns):
+    # Both the name and its Latin form are searched; '\n' keeps trigrams from spanning the two.
+    parts = [normalize_texts(df[column]) for column in columns if column in df.columns]
+    return ['\n'.join(values) for values in zip(*parts)] if parts else [''] * len(df)
+
+
+def build_lookup_index(conn, config=CONFIG):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        items = pd.read_sql(ITEMS_LOOKUP_SQL.format(table=config['table_name']), conn)
+        if check_table_exists(conn, config, 'Partners'):
+            partners = pd.read_sql(PARTNERS_LOOKUP_SQL, conn)
+        else:
+            partners = pd.DataFrame(columns=['PartnerID', 'Име', 'Име (EN)', 'Булстат', 'ДДС Номер', 'EMail'])
+    return LookupIndex(items, partners)
+
+
+def get_lookup_index(log, config=CONFIG, refresh=False):
+    key = (config['server'], config['database'])
+    if key in _SESSION_INDEXES and not refresh:
+        return _SESSION_INDEXES[key]
+
+    conn = connect_read_source(config, log)
+    if not conn:
+        return None
+    started = time.monotonic()
+    try:
+        index = build_lookup_index(conn, config)
+    finally:
+        conn.close()
+    log(
+        f'✓ Индекс за търсене: {len(index.items)} стоки, {len(index.partners)} партньори '
+        f'({time.monotonic() - started:.1f} сек.)'
+    )
+    _SESSION_INDEXES[key] = index
+    return index
+
+
+def print_lookup_results(query, index):
+    started = time.perf_counter()
+    sections = index.search(query)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    found = False
+    for title, frame, total in sections:
+        if not total:
+            continue
+        found = True
+        shown = f' (първи {len(frame)})' if total > len(frame) else ''
+        print(f'\n{title}: {total}{shown}')
+        print(frame.fillna('').to_string(index=False))
+    if not found:
+        print(f"\nНяма резултати за '{query}'.")
+    print(f'({elapsed_ms:.1f} ms)')
+
+
+def lookup_interactive(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Търсенето е отменено: няма избрана база данни.')
+        return
+
+    try:
+        index = get_lookup_index(log, config)
+    except Exception as e:
+        log(f'✗ Грешка при зареждане на данните за търсене: {e}')
+        return
+    if index is None:
+        return
+
+    print('\nТърсене по код, име (кирилица или латиница), Булстат или ДДС номер.')
+    print('Празен ред - край, !r - презареждане на данните от базата.')
+    while True:
+        query = input('Търсене: ').strip()
+        if not query:
+            return
+        if query == '!r':
+            try:
+                index = get_lookup_index(log, config, refresh=True) or index
+            except Exception as e:
+                log(f'✗ Грешка при зареждане на данните за търсене: {e}')
+            continue
+        print_lookup_results(query, index)
@@ -1,11 +1,72 @@
+import argparse
+
 try:
-    from .manager import run_app
+    from .manager import run_api, run_app, run_archive, run_diff, run_export, run_lookup, run_watch
 except ImportError:
-    from manager import run_app
+    from manager import run_api, run_app, run_archive, run_diff, run_export, run_lookup, run_watch
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Microinvest Invoice Pro import/export')
+    subparsers = parser.add_subparsers(dest='command')
+
+    watch_parser = subparsers.add_parser('watch', help='Автоматичен импорт на файлове, поставени в папка')
+    watch_parser.add_argument('directory', help='Папка за наблюдение (подпапка <база>/ импортира в съответната база)')
+    watch_parser.add_argument('--interval', type=float, default=None, help='Секунди между проверките')
+    watch_parser.add_argument('--database', default=None, help='База по подразбиране за файловете в основната папка')
+    watch_parser.add_argument('--once', action='store_true', help='Обработва наличните файлове и спира')
+
+    serve_parser = subparsers.add_parser('serve', help='Локален HTTP API с опашка от задачи за импорт/експорт')
+    serve_parser.add_argument('--host', default=None)
+    serve_parser.add_argument('--port', type=int, default=None)
+
+    export_parser = subparsers.add_parser('export', help='Експорт на Стоки/Партньори без диалози (за планировчик)')
+    export_parser.add_argument('kind', choices=['items', 'partners'])
+    export_parser.add_argument('output', help='Файл за експорта (.xlsx)')
+    export_parser.add_argument('--database', default=None)
+
+    diff_parser = subparsers.add_parser('diff', help='Сравнение на Стоки/Партньори между главна база и други бази')
+    diff_parser.add_argument('kind', choices=['items', 'partners'])
+    diff_parser.add_argument('databases', nargs='*', help='Бази за сравнение с главната')
+    diff_parser.add_argument('--master', default=None, help='Главна база (по подразбиране DB_DATABASE)')
+    diff_parser.add_argument('--all', action='store_true', help='Сравнява с всички бази на сървъра')
+    diff_parser.add_argument('--output', default=None, help='Файл за отчета (.xlsx)')
+
+    lookup_parser = subparsers.add_parser('lookup', help='Търсене на стоки/партньори по код, име, Булстат или ДДС номер')
+    lookup_parser.add_argument('queries', nargs='*', help='Търсени стойности (без тях - интерактивно търсене)')
+    lookup_parser.add_argument('--database', default=None)
+
+    archive_parser = subparsers.add_parser('archive', help='Архив на експортите: списък и възстановяване')
+    archive_subparsers = archive_parser.add_subparsers(dest='action', required=True)
+    archive_list_parser = archive_subparsers.add_parser('list', help='Списък на архивираните експорти')
+    archive_list_parser.add_argument('--database', default=None, help='Само експортите от тази база')
+    archive_list_parser.add_argument('--kind', choices=['items', 'partners'], default=None)
+    archive_restore_parser = archive_subparsers.add_parser('restore', help='Възстановява архивиран експорт като Excel файл')
+    archive_restore_parser.add_argument('archive_id', help='Идентификатор от archive list')
+    archive_restore_parser.add_argument('output', help='Файл за експорта (.xlsx)')
+
+    return parser.parse_args(argv)
 
 
-def main():
-    run_app()
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'watch':
+        run_watch(args.directory, poll_interval=args.interval, database=args.database, once=args.once)
+    elif args.command == 'serve':
+        run_api(host=args.host, port=args.port)
+    elif args.command == 'export':
+        run_export(args.kind, args.output, database=args.database)
+    elif args.command == 'lookup':
+        run_lookup(args.queries, database=args.database)
+    elif args.command == 'diff':
+        run_diff(args.kind, args.databases, master=args.master, all_databases=args.all, output=args.output)
+    elif args.command == 'archive':
+        if args.action == 'list':
+            run_archive('list', database=args.database, kind=args.kind)
+        else:
+            run_archive('restore', archive_id=args.archive_id, output=args.output)
+    else:
+        run_app()
 
 
 if __name__ == '__main__':
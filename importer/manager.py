@@ -4,15 +4,63 @@ from datetime import datetime
 import pyodbc
 
 try:
+    from .api_service import run_api_server
+    from .archive_service import print_archive_index, read_archive_index
     from .config import CONFIG
-    from .db import check_odbc_driver, get_connection_string, prompt_database_selection
-    from .export_service import export_items_excel, export_partners_excel, export_warehouse_partners_excel
-    from .import_service import convert_warehouse_partners_excel_for_invoice_pro, import_items_excel, import_partners_excel
+    from .db import check_odbc_driver, get_available_databases, get_connection_string, prompt_database_selection
+    from .diff_service import diff_databases, diff_databases_interactive
+    from .export_service import (
+        export_items_delta_excel,
+        export_items_excel,
+        export_items_file,
+        export_items_sharded_excel,
+        export_partners_delta_excel,
+        export_partners_excel,
+        export_partners_file,
+        export_warehouse_partners_excel,
+        restore_archived_export,
+    )
+    from .import_service import (
+        convert_warehouse_partners_excel_for_invoice_pro,
+        import_items_excel,
+        import_items_multi_excel,
+        import_partners_excel,
+    )
+    from .lookup_service import get_lookup_index, lookup_interactive, print_lookup_results
+    from .purge_service import purge_unreferenced_hidden
+    from .replica_service import refresh_replica_now
+    from .snapshot_service import undo_last_import
+    from .verify_service import verify_items_excel
+    from .watch_service import run_watch_folder
 except ImportError:
+    from api_service import run_api_server
+    from archive_service import print_archive_index, read_archive_index
     from config import CONFIG
-    from db import check_odbc_driver, get_connection_string, prompt_database_selection
-    from export_service import export_items_excel, export_partners_excel, export_warehouse_partners_excel
-    from import_service import convert_warehouse_partners_excel_for_invoice_pro, import_items_excel, import_partners_excel
+    from db import check_odbc_driver, get_available_databases, get_connection_string, prompt_database_selection
+    from diff_service import diff_databases, diff_databases_interactive
+    from export_service import (
+        export_items_delta_excel,
+        export_items_excel,
+        export_items_file,
+        export_items_sharded_excel,
+        export_partners_delta_excel,
+        export_partners_excel,
+        export_partners_file,
+        export_warehouse_partners_excel,
+        restore_archived_export,
+    )
+    from import_service import (
+        convert_warehouse_partners_excel_for_invoice_pro,
+        import_items_excel,
+        import_items_multi_excel,
+        import_partners_excel,
+    )
+    from lookup_service import get_lookup_index, lookup_interactive, print_lookup_results
+    from purge_service import purge_unreferenced_hidden
+    from replica_service import refresh_replica_now
+    from snapshot_service import undo_last_import
+    from verify_service import verify_items_excel
+    from watch_service import run_watch_folder
 
 
 def log(message):
@@ -35,6 +83,17 @@ def show_menu(config=CONFIG):
     print('6. 🔄 Конвертиране Excel (Warehouse партньори) → формат за Invoice Pro Партньори')
     print('7. 🗃️ Смяна на база данни')
     print('8. 🚪 Изход')
+    print('-' * 60)
+    print('9. 📤 Делта експорт Стоки (само промени от последния експорт) → Excel')
+    print('10. 📤 Делта експорт Партньори (само промени от последния експорт) → Excel')
+    print('11. 🔍 Проверка: Excel ↔ Invoice Pro Items (контролни суми)')
+    print('12. 🧹 Изчистване на неизползвани скрити Стоки/Партньори')
+    print('13. 📤 Експорт Invoice Pro Стоки на части (паралелно, с манифест) → Excel')
+    print('14. ↩️ Отмяна на последния импорт на Стоки/Партньори')
+    print('15. 🔄 Обновяване на локалното копие на базата (SQLite)')
+    print('16. 📥 Импорт на Стоки от няколко Excel файла (паралелно четене)')
+    print('17. 🔍 Сравнение на Стоки/Партньори между бази (главна база ↔ останалите)')
+    print('18. 🔎 Търсене на стока/партньор по код, име, Булстат или ДДС номер')
     print('=' * 60)
 
 
@@ -54,7 +113,7 @@ def run_app(config=CONFIG):
 
     while True:
         show_menu(config)
-        choice = input('Изберете (1-8): ').strip()
+        choice = input('Изберете (1-18): ').strip()
 
         if choice == '1':
             export_items_excel(log, config)
@@ -73,5 +132,124 @@ def run_app(config=CONFIG):
         elif choice == '8':
             log('Изход...')
             break
+        elif choice == '9':
+            export_items_delta_excel(log, config)
+        elif choice == '10':
+            export_partners_delta_excel(log, config)
+        elif choice == '11':
+            verify_items_excel(log, config)
+        elif choice == '12':
+            purge_unreferenced_hidden(log, config)
+        elif choice == '13':
+            export_items_sharded_excel(log, config)
+        elif choice == '14':
+            undo_last_import(log, config)
+        elif choice == '15':
+            refresh_replica_now(log, config)
+        elif choice == '16':
+            import_items_multi_excel(log, config)
+        elif choice == '17':
+            diff_databases_interactive(log, config)
+        elif choice == '18':
+            lookup_interactive(log, config)
         else:
             print('Невалидна опция!')
+
+
+def run_watch(watch_dir, config=CONFIG, poll_interval=None, database=None, once=False):
+    log('Стартиране на наблюдение на папка за импорт...')
+
+    if not check_odbc_driver(log):
+        sys.exit(1)
+
+    if database:
+        config['database'] = database
+    if not str(config.get('database', '')).strip():
+        log('✗ Не е зададена база данни (DB_DATABASE или --database).')
+        sys.exit(1)
+
+    run_watch_folder(watch_dir, log, config, poll_interval=poll_interval, once=once)
+
+
+def run_api(config=CONFIG, host=None, port=None):
+    log('Стартиране на локален HTTP API...')
+
+    if not check_odbc_driver(log):
+        sys.exit(1)
+
+    run_api_server(log, config, host=host, port=port)
+
+
+def run_diff(kind, databases, config=CONFIG, master=None, all_databases=False, output=None):
+    log('Стартиране на сравнение между бази...')
+
+    if not check_odbc_driver(log):
+        sys.exit(1)
+
+    master = master or config['database']
+    if not str(master or '').strip():
+        log('✗ Не е зададена главна база (DB_DATABASE или --master).')
+        sys.exit(1)
+    if all_databases:
+        databases = get_available_databases(config, log)
+    if not [db for db in databases if db != master]:
+        log('✗ Не са зададени бази за сравнение.')
+        sys.exit(1)
+
+    try:
+        diff_databases(kind, master, databases, log, config, report_file=output)
+    except Exception as e:
+        log(f'✗ Грешка при сравнение: {e}')
+        sys.exit(1)
+
+
+def run_export(kind, output, config=CONFIG, database=None):
+    if not check_odbc_driver(log):
+        sys.exit(1)
+
+    if database:
+        config['database'] = database
+    if not str(config.get('database', '')).strip():
+        log('✗ Не е зададена база данни (DB_DATABASE или --database).')
+        sys.exit(1)
+
+    export_file = export_items_file if kind == 'items' else export_partners_file
+    try:
+        export_file(output, log, config)
+    except Exception as e:
+        log(f'✗ Грешка при експорт: {e}')
+        sys.exit(1)
+
+
+def run_lookup(queries, config=CONFIG, database=None):
+    if not check_odbc_driver(log):
+        sys.exit(1)
+
+    if database:
+        config['database'] = database
+    if not queries:
+        lookup_interactive(log, config)
+        return
+
+    try:
+        index = get_lookup_index(log, config)
+    except Exception as e:
+        log(f'✗ Грешка при зареждане на данните за търсене: {e}')
+        sys.exit(1)
+    if index is None:
+        sys.exit(1)
+    for query in queries:
+        print(f"\n=== {query} ===")
+        print_lookup_results(query, index)
+
+
+def run_archive(action, database=None, kind=None, archive_id=None, output=None, config=CONFIG):
+    if action == 'list':
+        print_archive_index(read_archive_index(config, database=database, kind=kind))
+        return
+
+    try:
+        restore_archived_export(archive_id, output, log, config)
+    except Exception as e:
+        log(f'✗ Грешка при възстановяване от архива: {e}')
+        sys.exit(1)
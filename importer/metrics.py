@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+try:
+    from .config import CONFIG
+except ImportError:
+    from config import CONFIG
+
+
+METRICS_PREFIX = 'invoice_pro'
+
+_current_operation = ContextVar('current_operation', default=None)
+_stage_listener = ContextVar('stage_listener', default=None)
+
+
+def peak_rss_bytes():
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return int(counters.PeakWorkingSetSize)
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak if sys.platform == 'darwin' else peak * 1024)
+
+
+def log_peak_memory(log):
+    peak = peak_rss_bytes()
+    if peak is not None:
+        log(f'ℹ Пикова памет на процеса: {peak / (1024 * 1024):.0f} MB')
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class OperationMetrics:
+    def __init__(self, operation, config=CONFIG):
+        self.operation = operation
+        self.database = config['database']
+        self.started = time.monotonic()
+        self.finished_at = None
+        self.duration = None
+        self.success = False
+        self.rows = {}
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - started
+
+    def add_rows(self, kind, count):
+        self.rows[kind] = self.rows.get(kind, 0) + int(count)
+
+    def finish(self, success):
+        self.success = success
+        self.duration = time.monotonic() - self.started
+        self.finished_at = time.time()
+
+    def render(self):
+        labels = f'database="{_escape_label(self.database)}",operation="{_escape_label(self.operation)}"'
+        main_rows = self.rows.get('inserted', self.rows.get('exported', 0))
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f'# HELP {METRICS_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRICS_PREFIX}_{name} gauge')
+            for extra, value in samples:
+                lines.append(f'{METRICS_PREFIX}_{name}{{{labels}{extra}}} {value}')
+
+        metric('operation_success', 'Whether the last run succeeded (1) or failed (0).', [('', int(self.success))])
+        metric('operation_last_run_timestamp_seconds', 'Unix time the last run finished.', [('', f'{self.finished_at:.3f}')])
+        metric('operation_duration_seconds', 'Wall time of the last run.', [('', f'{self.duration:.3f}')])
+        metric(
+            'operation_stage_duration_seconds',
+            'Wall time of each stage of the last run.',
+            [(f',stage="{_escape_label(stage)}"', f'{seconds:.3f}') for stage, seconds in sorted(self.stages.items())],
+        )
+        metric(
+            'operation_rows',
+            'Rows handled by the last run.',
+            [(f',kind="{_escape_label(kind)}"', count) for kind, count in sorted(self.rows.items())],
+        )
+        rows_per_second = main_rows / self.duration if self.duration else 0
+        metric('operation_rows_per_second', 'Inserted or exported rows per second in the last run.', [('', f'{rows_per_second:.1f}')])
+        peak = peak_rss_bytes()
+        if peak is not None:
+            metric('process_peak_rss_bytes', 'Peak resident set size of the process after the last run.', [('', peak)])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_dir):
+        os.makedirs(metrics_dir, exist_ok=True)
+        safe_database = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in self.database)
+        path = os.path.join(metrics_dir, f'{METRICS_PREFIX}_{self.operation}_{safe_database}.prom')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        return path
+
+
+@contextmanager
+def track_operation(operation, config=CONFIG):
+    if not config['metrics_dir']:
+        yield None
+        return
+
+    metrics = OperationMetrics(operation, config)
+    token = _current_operation.set(metrics)
+    success = False
+    try:
+        yield metrics
+        success = True
+    finally:
+        _current_operation.reset(token)
+        metrics.finish(success)
+        try:
+            metrics.write(config['metrics_dir'])
+        except OSError:
+            pass
+
+
+@contextmanager
+def listen_stages(listener):
+    token = _stage_listener.set(listener)
+    try:
+        yield
+    finally:
+        _stage_listener.reset(token)
+
+
+@contextmanager
+def _listened_stage(name, metrics, listener):
+    with listener.stage(name), metrics.stage(name) if metrics else nullcontext():
+        yield
+
+
+def metric_stage(name):
+    metrics = _current_operation.get()
+    listener = _stage_listener.get()
+    if listener:
+        return _listened_stage(name, metrics, listener)
+    return metrics.stage(name) if metrics else nullcontext()
+
+
+def metric_rows(kind, count):
+    metrics = _current_operation.get()
+    if metrics:
+        metrics.add_rows(kind, count)
@@ -0,0 +1,130 @@
+import contextvars
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from .metrics import metric_stage
+except ImportError:
+    from metrics import metric_stage
+
+
+PUT_TIMEOUT = 0.1
+
+_END = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+class PipelineStats:
+    def __init__(self):
+        self.busy = {}
+        self.items = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+            self.items[stage] = self.items.get(stage, 0) + 1
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def describe(self):
+        stages = ', '.join(f'{stage} {seconds:.1f}' for stage, seconds in self.busy.items())
+        return f'{stages} | общо {self.elapsed():.1f} сек.'
+
+
+def _put(target, item, stop):
+    # Bounded queues give backpressure; the timeout only lets a blocked producer notice a stop.
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _source_worker(name, source, target, stop, stats):
+    iterator = iter(source)
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            with metric_stage(name):
+                item = next(iterator, _END)
+            if item is _END:
+                break
+            stats.add(name, time.monotonic() - started)
+            if not _put(target, item, stop):
+                break
+        _put(target, _END, stop)
+    except BaseException as e:
+        _put(target, _Failed(e), stop)
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close:
+            close()
+
+
+def _stage_worker(name, func, source, target, stop, stats):
+    try:
+        while not stop.is_set():
+            try:
+                item = source.get(timeout=PUT_TIMEOUT)
+            except queue.Empty:
+                continue
+            if item is _END or isinstance(item, _Failed):
+                _put(target, item, stop)
+                return
+            started = time.monotonic()
+            with metric_stage(name):
+                result = func(item)
+            stats.add(name, time.monotonic() - started)
+            if result is not None and not _put(target, result, stop):
+                return
+    except BaseException as e:
+        _put(target, _Failed(e), stop)
+
+
+def _drain(output, stop):
+    while True:
+        item = output.get()
+        if item is _END:
+            return
+        if isinstance(item, _Failed):
+            stop.set()
+            raise item.error
+        yield item
+
+
+# Each stage runs in its own thread and stages are linked by bounded queues. The caller
+# consumes the output on its own thread, so the database insert stays on the thread that
+# owns the connection; an error in any stage is re-raised there.
+@contextmanager
+def run_pipeline(source, stages, queue_size=4, source_name='read'):
+    stop = threading.Event()
+    stats = PipelineStats()
+    queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+    targets = [(_source_worker, (source_name, source, queues[0], stop, stats))]
+    for i, (name, func) in enumerate(stages):
+        targets.append((_stage_worker, (name, func, queues[i], queues[i + 1], stop, stats)))
+
+    threads = []
+    for target, args in targets:
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(target, *args), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    try:
+        yield _drain(queues[-1], stop), stats
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,161 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .config import CONFIG
+except ImportError:
+    from config import CONFIG
+
+
+PREVIEW_SAMPLE_SIZE = 10
+PRICE_EPSILON = 0.005
+# Percent change buckets for the price delta distribution
+PRICE_BINS = [-np.inf, -50, -20, -5, 0, 5, 20, 50, np.inf]
+PRICE_LABELS = ['< -50%', '-50..-20%', '-20..-5%', '-5..0%', '0..5%', '5..20%', '20..50%', '> 50%']
+
+
+def _preview_specs(config):
+    return {
+        'items': {
+            'title': 'Стоки',
+            'key': 'Code',
+            'price': 'SalePrice',
+            'sql': f"SELECT [Code], [Name], [SalePrice] FROM [dbo].[{config['table_name']}] WHERE [Visible] = 1",
+        },
+        'partners': {
+            'title': 'Партньори',
+            'key': 'Bulstat',
+            'price': None,
+            'sql': "SELECT [Bulstat], [Name] FROM [dbo].[Partners] WHERE [Visible] = 1",
+        },
+    }
+
+
+def _normalize(df, spec):
+    frame = pd.DataFrame({
+        'Key': df[spec['key']].fillna('').astype(str).str.strip().to_numpy(dtype=object),
+        'Name': df['Name'].fillna('').astype(str).str.strip().to_numpy(dtype=object),
+    })
+    if spec['price']:
+        frame['Price'] = pd.to_numeric(df[spec['price']], errors='coerce').astype('float64').to_numpy()
+    # Rows without a key cannot be matched; they only count as added or removed.
+    keyed = frame[frame['Key'] != '']
+    duplicates = int(keyed['Key'].duplicated().sum())
+    return keyed.drop_duplicates('Key', keep='last'), frame[frame['Key'] == ''], duplicates
+
+
+def compare_import_preview(df_new, df_current, spec):
+    new, new_unkeyed, new_duplicates = _normalize(df_new, spec)
+    current, current_unkeyed, _ = _normalize(df_current, spec)
+
+    merged = new.merge(current, on='Key', how='outer', suffixes=('', ' (база)'), indicator=True)
+    added = pd.concat([merged[merged['_merge'] == 'left_only'], new_unkeyed])
+    removed = pd.concat([merged[merged['_merge'] == 'right_only'], current_unkeyed.rename(columns={'Name': 'Name (база)'})])
+    both = merged[merged['_merge'] == 'both']
+
+    renamed = both[both['Name'] != both['Name (база)']]
+    preview = {
+        'title': spec['title'],
+        'new_rows': len(df_new),
+        'current_rows': len(df_current),
+        'added': len(added),
+        'removed': len(removed),
+        'matched': len(both),
+        'renamed': len(renamed),
+        'duplicates': new_duplicates,
+        'samples': {
+            'Нови': added[['Key', 'Name']],
+            'Премахнати (ще бъдат скрити)': removed[['Key', 'Name (база)']],
+            'Преименувани': renamed[['Key', 'Name (база)', 'Name']],
+        },
+        'price_changed': 0,
+        'price_stats': None,
+    }
+
+    if spec['price']:
+        delta = both['Price'].fillna(0.0) - both['Price (база)'].fillna(0.0)
+        changed = both[delta.abs() >= PRICE_EPSILON].assign(Delta=delta)
+        preview['price_changed'] = len(changed)
+        preview['samples']['Променена цена'] = changed[['Key', 'Name', 'Price (база)', 'Price', 'Delta']]
+        if not changed.empty:
+            old = changed['Price (база)'].fillna(0.0)
+            percent = (changed['Delta'] / old.where(old != 0)) * 100
+            buckets = pd.cut(percent.dropna(), PRICE_BINS, labels=PRICE_LABELS).value_counts(sort=False)
+            preview['price_stats'] = {
+                'up': int((changed['Delta'] > 0).sum()),
+                'down': int((changed['Delta'] < 0).sum()),
+                'delta': changed['Delta'].describe(percentiles=[0.05, 0.5, 0.95]),
+                'buckets': buckets[buckets > 0],
+                'from_zero': int(percent.isna().sum()),
+            }
+    return preview
+
+
+def read_current_rows(conn, kind, config=CONFIG, groups=None):
+    sql = _preview_specs(config)[kind]['sql']
+    if groups:
+        sql += f" AND [GroupID] IN ({', '.join(str(int(group)) for group in groups)})"
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return pd.read_sql(sql, conn)
+
+
+def build_import_preview(conn, kind, data, config=CONFIG, groups=None):
+    df_new = data if isinstance(data, pd.DataFrame) else pd.DataFrame(list(data))
+    return compare_import_preview(df_new, read_current_rows(conn, kind, config, groups), _preview_specs(config)[kind])
+
+
+def print_import_preview(preview, log):
+    log(
+        f"Преглед на промените ({preview['title']}): в базата {preview['current_rows']} | във файла {preview['new_rows']} | "
+        f"нови {preview['added']} | премахнати {preview['removed']} | съвпадащи {preview['matched']} | "
+        f"преименувани {preview['renamed']}"
+        + (f" | с променена цена {preview['price_changed']}" if 'Променена цена' in preview['samples'] else '')
+    )
+    if preview['duplicates']:
+        log(f"⚠ Повтарящи се ключове във файла: {preview['duplicates']}")
+
+    for title, frame in preview['samples'].items():
+        if frame.empty:
+            continue
+        print(f'\n{title} ({len(frame)}, първи {min(len(frame), PREVIEW_SAMPLE_SIZE)}):')
+        print(frame.head(PREVIEW_SAMPLE_SIZE).to_string(index=False))
+
+    stats = preview['price_stats']
+    if stats:
+        delta = stats['delta']
+        print(
+            f"\nЦени: поскъпнали {stats['up']}, поевтинели {stats['down']} | разлика мин {delta['min']:.2f}, "
+            f"5% {delta['5%']:.2f}, медиана {delta['50%']:.2f}, 95% {delta['95%']:.2f}, макс {delta['max']:.2f}"
+        )
+        for label, count in stats['buckets'].items():
+            print(f'  {label:>10}: {count}')
+        if stats['from_zero']:
+            print(f"  {'от 0':>10}: {stats['from_zero']}")
+
+
+def preview_summary(preview):
+    lines = [
+        f"Нови: {preview['added']}",
+        f"Премахнати (ще бъдат скрити): {preview['removed']}",
+        f"Преименувани: {preview['renamed']}",
+    ]
+    if 'Променена цена' in preview['samples']:
+        lines.append(f"С променена цена: {preview['price_changed']}")
+    return '\n'.join(lines)
+
+
+def run_import_preview(conn, kind, data, log, config=CONFIG, groups=None):
+    # The preview is informational: a failure is reported but never blocks the import.
+    started = time.monotonic()
+    try:
+        preview = build_import_preview(conn, kind, data, config, groups)
+    except Exception as e:
+        log(f'⚠ Прегледът на промените не е наличен: {e}')
+        return ''
+    print_import_preview(preview, log)
+    log(f'  Прегледът е изготвен за {time.monotonic() - started:.2f} сек.')
+    return preview_summary(preview) + '\n'
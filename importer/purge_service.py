@@ -0,0 +1,208 @@
+import re
+import time
+
+from tkinter import messagebox
+
+try:
+    from .config import CONFIG
+    from .db import check_table_exists, connect_with_fallback, ensure_database_selected, is_leading_index_column
+    from .diagnostics_service import capture_lock_diagnostics
+    from .metrics import metric_rows, metric_stage, track_operation
+    from .replica_service import invalidate_replica
+    from .utils import with_tk_dialog
+except ImportError:
+    from config import CONFIG
+    from db import check_table_exists, connect_with_fallback, ensure_database_selected, is_leading_index_column
+    from diagnostics_service import capture_lock_diagnostics
+    from metrics import metric_rows, metric_stage, track_operation
+    from replica_service import invalidate_replica
+    from utils import with_tk_dialog
+
+
+def _purge_specs(config):
+    return {
+        'items': {
+            'title': 'стоки',
+            'table': config['table_name'],
+            'key': 'ItemID',
+            'self_refs': ['MainItemID'],
+            'known_refs': [('dbo', 'DocumentDetails', 'ItemID'), ('dbo', 'DocumentTemplateDetails', 'ItemID')],
+        },
+        'partners': {
+            'title': 'партньори',
+            'table': 'Partners',
+            'key': 'PartnerID',
+            'self_refs': ['MainPartnerID'],
+            'known_refs': [],
+        },
+    }
+
+
+def find_reference_columns(conn, table, key):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT c.TABLE_SCHEMA, c.TABLE_NAME, c.COLUMN_NAME
+        FROM INFORMATION_SCHEMA.COLUMNS c
+        JOIN INFORMATION_SCHEMA.TABLES t
+            ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME AND t.TABLE_TYPE = 'BASE TABLE'
+        WHERE c.COLUMN_NAME = ? AND c.TABLE_NAME <> ?
+        UNION
+        SELECT OBJECT_SCHEMA_NAME(fkc.parent_object_id), OBJECT_NAME(fkc.parent_object_id),
+               COL_NAME(fkc.parent_object_id, fkc.parent_column_id)
+        FROM sys.foreign_key_columns fkc
+        WHERE fkc.referenced_object_id = OBJECT_ID(?) AND fkc.parent_object_id <> fkc.referenced_object_id
+        """,
+        (key, table, f'dbo.{table}'),
+    )
+    refs = [tuple(row) for row in cursor.fetchall()]
+    cursor.close()
+    return refs
+
+
+def _table_space_kb(conn, table):
+    cursor = conn.cursor()
+    cursor.execute('EXEC sp_spaceused ?', (f'dbo.{table}',))
+    row = cursor.fetchone()
+    cursor.close()
+    if not row:
+        return None
+
+    def kb(value):
+        match = re.match(r'\s*(\d+)', str(value or ''))
+        return int(match.group(1)) if match else 0
+
+    return {'rows': kb(row[1]), 'reserved_kb': kb(row[2]), 'data_kb': kb(row[3]), 'index_kb': kb(row[4])}
+
+
+def build_unreferenced_predicate(spec, refs, alias='t'):
+    key = spec['key']
+    conditions = [
+        f'NOT EXISTS (SELECT 1 FROM [{schema}].[{table}] r WHERE r.[{column}] = {alias}.[{key}])'
+        for schema, table, column in refs
+    ]
+    conditions += [
+        f"NOT EXISTS (SELECT 1 FROM [dbo].[{spec['table']}] s WHERE s.[{column}] = {alias}.[{key}] AND s.[{key}] <> {alias}.[{key}])"
+        for column in spec['self_refs']
+    ]
+    return ' AND '.join([f'{alias}.[Visible] = 0'] + conditions)
+
+
+def purge_hidden_rows(conn, kind, log, config=CONFIG, batch_size=None, time_budget=None):
+    table = _purge_specs(config)[kind]['table']
+    try:
+        with capture_lock_diagnostics(conn, f'purge_{kind}', log, config, [table]):
+            return _purge_hidden_rows(conn, kind, log, config, batch_size, time_budget)
+    finally:
+        # Every batch is committed on its own, so even a failed purge may have deleted rows.
+        invalidate_replica(config, [table])
+
+
+def _purge_hidden_rows(conn, kind, log, config, batch_size, time_budget):
+    spec = _purge_specs(config)[kind]
+    table = spec['table']
+    batch_size = batch_size or config['purge_batch_size']
+    time_budget = config['purge_time_budget'] if time_budget is None else time_budget
+
+    refs = set(find_reference_columns(conn, table, spec['key']))
+    for schema, ref_table, column in spec['known_refs']:
+        if check_table_exists(conn, config, ref_table):
+            refs.add((schema, ref_table, column))
+    refs = sorted(refs)
+
+    for schema, ref_table, column in refs:
+        indexed = is_leading_index_column(conn, schema, ref_table, column)
+        marker = '✓' if indexed else '⚠ без индекс (пълно сканиране)'
+        log(f'  Референция: {schema}.{ref_table}.{column} {marker}')
+
+    predicate = build_unreferenced_predicate(spec, refs)
+    cursor = conn.cursor()
+    with metric_stage('count'):
+        cursor.execute(f"SELECT COUNT(*) FROM [dbo].[{table}] t WHERE {predicate}")
+        candidates = int(cursor.fetchone()[0])
+    log(f"Неизползвани скрити {spec['title']}: {candidates}")
+
+    space_before = _table_space_kb(conn, table)
+    deleted = 0
+    started = time.monotonic()
+    stopped_by_budget = False
+
+    delete_sql = f"DELETE TOP ({int(batch_size)}) t FROM [dbo].[{table}] t WHERE {predicate}"
+    while deleted < candidates:
+        if time_budget and time.monotonic() - started >= time_budget:
+            stopped_by_budget = True
+            break
+        with metric_stage('delete'):
+            cursor.execute(delete_sql)
+            batch_deleted = cursor.rowcount
+            conn.commit()
+        deleted += max(batch_deleted, 0)
+        log(f'  ... изтрити {deleted}/{candidates}')
+        if batch_deleted < batch_size:
+            break
+
+    cursor.close()
+    metric_rows('deleted', deleted)
+    space_after = _table_space_kb(conn, table)
+    return {
+        'table': table,
+        'candidates': candidates,
+        'deleted': deleted,
+        'seconds': time.monotonic() - started,
+        'stopped_by_budget': stopped_by_budget,
+        'space_before': space_before,
+        'space_after': space_after,
+    }
+
+
+def purge_unreferenced_hidden(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Изчистването е отменено: няма избрана база данни.')
+        return
+
+    choice = input('Изчистване на: 1 - Стоки, 2 - Партньори, 0 - Отказ: ').strip()
+    kind = {'1': 'items', '2': 'partners'}.get(choice)
+    if not kind:
+        log('Изчистването е отменено от потребителя.')
+        return
+
+    spec = _purge_specs(config)[kind]
+    if not with_tk_dialog(
+        lambda r: messagebox.askyesno(
+            'Потвърждение',
+            f"Ще бъдат изтрити скритите {spec['title']} от '{spec['table']}', които не се използват в документи.\nПотвърждавате ли?",
+            parent=r,
+        )
+    ):
+        return
+
+    log(f"=== ИЗЧИСТВАНЕ НА НЕИЗПОЛЗВАНИ СКРИТИ {spec['title'].upper()} ===")
+    log(f"База: {config['database']} | Пакет: {config['purge_batch_size']} | Лимит: {config['purge_time_budget'] or 'няма'} сек.")
+
+    conn = connect_with_fallback(config, log)
+    if not conn:
+        return
+
+    try:
+        if not check_table_exists(conn, config, spec['table']):
+            log(f"✗ Таблица '{spec['table']}' не е намерена в избраната база.")
+            return
+
+        with track_operation(f'purge_{kind}', config):
+            result = purge_hidden_rows(conn, kind, log, config)
+        log(f"✓ Изтрити {result['deleted']} от {result['candidates']} записа за {result['seconds']:.1f} сек.")
+        if result['stopped_by_budget']:
+            log('⚠ Достигнат е лимитът за време. Стартирайте отново, за да продължите.')
+
+        before, after = result['space_before'], result['space_after']
+        if before and after:
+            log(
+                f"Таблица {result['table']}: редове {before['rows']} → {after['rows']}, "
+                f"заето място {before['reserved_kb']} KB → {after['reserved_kb']} KB "
+                f"({before['reserved_kb'] - after['reserved_kb']} KB по-малко)"
+            )
+    except Exception as e:
+        conn.rollback()
+        log(f'✗ Грешка при изчистване: {e}')
+    finally:
+        conn.close()
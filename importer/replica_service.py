@@ -0,0 +1,247 @@
+import json
+import os
+import sqlite3
+import time
+import warnings
+
+import pandas as pd
+
+try:
+    from .config import CONFIG
+    from .db import check_table_exists, connect_database, connect_with_fallback, ensure_database_selected
+    from .state import database_state_dir
+except ImportError:
+    from config import CONFIG
+    from db import check_table_exists, connect_database, connect_with_fallback, ensure_database_selected
+    from state import database_state_dir
+
+
+REPLICA_FILE = 'replica.sqlite'
+REPLICA_ID_CHUNK = 1000
+
+# MD5 of the whole row serialized by the server, so any column change is picked up.
+SQL_ROW_HASH = "CONVERT(VARCHAR(32), HASHBYTES('MD5', (SELECT t.* FOR XML RAW)), 2)"
+
+
+def _replica_tables(config):
+    return [
+        (config['table_name'], 'ItemID'),
+        ('Partners', 'PartnerID'),
+        ('VatRates', 'VatRateID'),
+        ('ItemGroups', 'GroupID'),
+        ('Status', 'StatusID'),
+        ('VatTerms', 'VatTermID'),
+    ]
+
+
+def replica_path(config=CONFIG):
+    return os.path.join(database_state_dir(config), REPLICA_FILE)
+
+
+def _open_replica_file(path):
+    replica = sqlite3.connect(path)
+    replica.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS _replica_meta (
+            table_name TEXT PRIMARY KEY, columns TEXT, row_count INTEGER, checksum INTEGER, refreshed_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS _replica_hashes (
+            table_name TEXT, row_id INTEGER, row_hash TEXT, PRIMARY KEY (table_name, row_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    return replica
+
+
+def _read_server(conn, sql, params=None):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return pd.read_sql(sql, conn, params=params)
+
+
+def _server_columns(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT TOP 0 * FROM [dbo].[{table}]")
+    columns = [column[0] for column in cursor.description]
+    cursor.close()
+    return columns
+
+
+def _server_fingerprint(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT_BIG(*), ISNULL(CHECKSUM_AGG(BINARY_CHECKSUM(*)), 0) FROM [dbo].[{table}]")
+    row_count, checksum = cursor.fetchone()
+    cursor.close()
+    return int(row_count), int(checksum)
+
+
+def _read_rows_by_ids(conn, table, key, ids):
+    frames = []
+    for start in range(0, len(ids), REPLICA_ID_CHUNK):
+        chunk = ', '.join(str(int(value)) for value in ids[start:start + REPLICA_ID_CHUNK])
+        frames.append(_read_server(conn, f"SELECT * FROM [dbo].[{table}] WHERE [{key}] IN ({chunk})"))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _delete_local_rows(replica, table, key, ids):
+    replica.execute('CREATE TEMP TABLE IF NOT EXISTS _replica_ids (id INTEGER PRIMARY KEY)')
+    replica.execute('DELETE FROM _replica_ids')
+    replica.executemany('INSERT INTO _replica_ids (id) VALUES (?)', [(int(value),) for value in ids])
+    replica.execute(f'DELETE FROM "{table}" WHERE "{key}" IN (SELECT id FROM _replica_ids)')
+    replica.execute('DELETE FROM _replica_hashes WHERE table_name = ? AND row_id IN (SELECT id FROM _replica_ids)', (table,))
+
+
+def sync_replica_table(conn, replica, table, key, log):
+    columns = _server_columns(conn, table)
+    meta = replica.execute('SELECT columns FROM _replica_meta WHERE table_name = ?', (table,)).fetchone()
+    if meta is None or json.loads(meta[0]) != columns:
+        replica.execute(f'DROP TABLE IF EXISTS "{table}"')
+        replica.execute('DELETE FROM _replica_hashes WHERE table_name = ?', (table,))
+
+    df_server = _read_server(conn, f"SELECT t.[{key}] AS RowID, {SQL_ROW_HASH} AS RowHash FROM [dbo].[{table}] t")
+    df_local = pd.read_sql(
+        'SELECT row_id AS RowID, row_hash AS RowHash FROM _replica_hashes WHERE table_name = ?', replica, params=[table]
+    )
+    merged = df_server.merge(df_local, on='RowID', how='outer', suffixes=('', '_local'), indicator=True)
+    changed = merged[(merged['_merge'] == 'left_only') | ((merged['_merge'] == 'both') & (merged['RowHash'] != merged['RowHash_local']))]
+    removed = merged[merged['_merge'] == 'right_only']
+
+    changed_ids = changed['RowID'].astype('int64').tolist()
+    df_rows = _read_rows_by_ids(conn, table, key, changed_ids)
+
+    table_exists = replica.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if not table_exists:
+        frame = df_rows if not df_rows.empty else pd.DataFrame(columns=columns)
+        frame.head(0).to_sql(table, replica, index=False)
+        replica.execute(f'CREATE UNIQUE INDEX "ux_{table}_{key}" ON "{table}" ("{key}")')
+
+    _delete_local_rows(replica, table, key, changed_ids + removed['RowID'].astype('int64').tolist())
+    if not df_rows.empty:
+        df_rows.to_sql(table, replica, index=False, if_exists='append')
+    replica.executemany(
+        'INSERT INTO _replica_hashes (table_name, row_id, row_hash) VALUES (?, ?, ?)',
+        [(table, int(row.RowID), row.RowHash) for row in changed.itertuples(index=False)],
+    )
+    log(f'  {table}: {len(df_server)} реда, обновени {len(changed_ids)}, премахнати {len(removed)}')
+    return columns
+
+
+def refresh_replica(conn, log, config=CONFIG, force=False):
+    replica = _open_replica_file(replica_path(config))
+    try:
+        for table, key in _replica_tables(config):
+            if not check_table_exists(conn, config, table):
+                log(f"⚠ Таблица '{table}' липсва в базата и няма да бъде копирана.")
+                continue
+
+            row_count, checksum = _server_fingerprint(conn, table)
+            meta = replica.execute('SELECT row_count, checksum FROM _replica_meta WHERE table_name = ?', (table,)).fetchone()
+            if force or meta != (row_count, checksum):
+                columns = sync_replica_table(conn, replica, table, key, log)
+                replica.execute(
+                    'INSERT OR REPLACE INTO _replica_meta (table_name, columns, row_count, checksum, refreshed_at) VALUES (?, ?, ?, ?, ?)',
+                    (table, json.dumps(columns), row_count, checksum, time.time()),
+                )
+            else:
+                replica.execute('UPDATE _replica_meta SET refreshed_at = ? WHERE table_name = ?', (time.time(), table))
+            replica.commit()
+    finally:
+        replica.close()
+
+
+def invalidate_replica(config=CONFIG, tables=None):
+    # Called after the tool's own writes: the next read checks the server fingerprint instead of trusting
+    # the copy for up to REPLICA_MAX_AGE seconds.
+    path = replica_path(config)
+    if not os.path.exists(path):
+        return
+    tables = tables or [table for table, _ in _replica_tables(config)]
+    replica = sqlite3.connect(path)
+    try:
+        replica.execute(
+            f"UPDATE _replica_meta SET refreshed_at = NULL WHERE table_name IN ({', '.join('?' for _ in tables)})", tables
+        )
+        replica.commit()
+    except sqlite3.Error:
+        pass
+    finally:
+        replica.close()
+
+
+def replica_age(config=CONFIG):
+    path = replica_path(config)
+    if not os.path.exists(path):
+        return None
+    replica = _open_replica_file(path)
+    try:
+        tables = [table for table, _ in _replica_tables(config)]
+        rows = replica.execute(
+            f"SELECT COUNT(*), MIN(COALESCE(refreshed_at, 0)) FROM _replica_meta WHERE table_name IN ({', '.join('?' for _ in tables)})",
+            tables,
+        ).fetchone()
+    finally:
+        replica.close()
+    if not rows[0]:
+        return None
+    return time.time() - rows[1]
+
+
+def open_replica(config=CONFIG):
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.execute('ATTACH DATABASE ? AS dbo', (replica_path(config),))
+    # check_table_exists() looks tables up in INFORMATION_SCHEMA, so expose the mirrored ones there.
+    conn.execute("ATTACH DATABASE ':memory:' AS INFORMATION_SCHEMA")
+    conn.execute(
+        "CREATE TABLE INFORMATION_SCHEMA.TABLES AS "
+        "SELECT name AS TABLE_NAME, 'BASE TABLE' AS TABLE_TYPE FROM dbo.sqlite_master WHERE type = 'table'"
+    )
+    return conn
+
+
+def connect_replica(config, log, interactive=True):
+    age = replica_age(config)
+    if age is not None and age <= config['replica_max_age']:
+        log(f'ℹ Използва се локално копие на базата (обновено преди {age:.0f} сек.)')
+        return open_replica(config)
+
+    conn = connect_with_fallback(config, log) if interactive else connect_database(config)
+    if not conn:
+        return None
+    try:
+        log('Проверка и обновяване на локалното копие...')
+        refresh_replica(conn, log, config)
+    except Exception as e:
+        if not interactive:
+            raise
+        log(f'✗ Грешка при обновяване на локалното копие: {e}')
+        return None
+    finally:
+        conn.close()
+    log('✓ Локалното копие е актуално.')
+    return open_replica(config)
+
+
+def connect_read_source(config, log, interactive=True):
+    if not config['use_replica']:
+        return connect_with_fallback(config, log) if interactive else connect_database(config)
+    return connect_replica(config, log, interactive)
+
+
+def refresh_replica_now(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Обновяването е отменено: няма избрана база данни.')
+        return
+
+    log(f"=== ОБНОВЯВАНЕ НА ЛОКАЛНО КОПИЕ: {config['database']} ===")
+    conn = connect_with_fallback(config, log)
+    if not conn:
+        return
+
+    started = time.monotonic()
+    try:
+        refresh_replica(conn, log, config, force=True)
+        log(f'✓ Локалното копие е обновено за {time.monotonic() - started:.1f} сек.: {replica_path(config)}')
+    except Exception as e:
+        log(f'✗ Грешка при обновяване на локалното копие: {e}')
+    finally:
+        conn.close()
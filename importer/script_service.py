@@ -0,0 +1,170 @@
+import math
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .config import CONFIG
+except ImportError:
+    from config import CONFIG
+
+
+# SQL Server accepts at most 1000 row constructors in one INSERT ... VALUES.
+SCRIPT_MAX_BATCH_ROWS = 1000
+SCRIPT_SUFFIX = '.sql'
+
+PARTNERS_SCRIPT_COLUMNS = [
+    'Name', 'NameEnglish', 'ContactName', 'ContactNameEnglish', 'EMail', 'Bulstat', 'VatId',
+    'BankName', 'BankCode', 'BankAccount', 'Priority', 'GroupID', 'StatusID', 'CountryID',
+]
+
+
+def sql_literal(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return 'NULL'
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return 'NULL' if math.isinf(value) else repr(value)
+    text = str(value).replace("'", "''")
+    # sqlcmd expands $(name) and treats a line with only GO as a batch end even inside a literal,
+    # so "$(" is split and line breaks are written as NCHAR() to keep every row on one line.
+    text = text.replace('$(', "$' + N'(")
+    text = text.replace('\r', "' + NCHAR(13) + N'").replace('\n', "' + NCHAR(10) + N'")
+    return f"N'{text}'"
+
+
+def _row_values(row):
+    return ', '.join(sql_literal(value) for value in row)
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _script_header(f, title, rows, config):
+    f.write(f"-- {title}: {rows} записа, генериран {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    f.write('-- Изпълнение: sqlcmd -S <сървър> -E -f 65001 -i <файл>\n')
+    # sqlcmd stops at the first error and closes the session, which rolls the open transaction back.
+    f.write(':on error exit\n')
+    if str(config.get('database', '')).strip():
+        f.write(f"USE [{config['database']}];\nGO\n")
+    f.write('SET NOCOUNT ON;\nBEGIN TRANSACTION;\nGO\n\n')
+
+
+def _script_footer(f):
+    f.write('COMMIT TRANSACTION;\nGO\n')
+
+
+def _write_script(script_file, write_body):
+    tmp_path = f'{script_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8-sig', newline='\r\n') as f:
+            rows = write_body(f)
+        os.replace(tmp_path, script_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return rows
+
+
+def write_items_script(script_file, rows, columns, config=CONFIG, groups=None):
+    table = config['table_name']
+    batch_size = max(1, min(config['insert_batch_size'], SCRIPT_MAX_BATCH_ROWS))
+    group_list = ', '.join(str(int(group)) for group in groups or [])
+    scope = f' AND [GroupID] IN ({group_list})' if groups else ''
+    title = f'Импорт на {table}' + (f' за GroupID {group_list}' if groups else '')
+
+    def write_body(f):
+        _script_header(f, title, len(rows), config)
+        f.write(
+            f"""-- 1. Скриване на видимите записи и изтриване на неизползваните
+DECLARE @Targets TABLE (ItemID INT PRIMARY KEY);
+INSERT INTO @Targets SELECT ItemID FROM [dbo].[{table}] WHERE [Visible] = 1{scope};
+UPDATE t SET t.[Visible] = 0 FROM [dbo].[{table}] t JOIN @Targets x ON x.ItemID = t.ItemID;
+DELETE t FROM [dbo].[{table}] t JOIN @Targets x ON x.ItemID = t.ItemID
+WHERE NOT EXISTS (SELECT 1 FROM DocumentDetails d WHERE d.ItemID = t.ItemID)
+AND NOT EXISTS (SELECT 1 FROM DocumentTemplateDetails dt WHERE dt.ItemID = t.ItemID);
+GO
+
+-- 2. Нови записи
+"""
+        )
+        insert = f"INSERT INTO [dbo].[{table}] ({', '.join(f'[{column}]' for column in columns)}) VALUES\n"
+        written = 0
+        for batch in _batches(rows[columns].itertuples(index=False, name=None), batch_size):
+            f.write(insert)
+            f.write(',\n'.join(f'({_row_values(row)})' for row in batch))
+            f.write(';\nGO\n')
+            written += len(batch)
+        _script_footer(f)
+        return written
+
+    return _write_script(script_file, write_body)
+
+
+def write_partners_script(script_file, data, config=CONFIG):
+    batch_size = max(1, min(config['insert_batch_size'], SCRIPT_MAX_BATCH_ROWS))
+    value_columns = ', '.join(f'[{column}]' for column in PARTNERS_SCRIPT_COLUMNS)
+
+    def write_body(f):
+        _script_header(f, 'Импорт на Partners', len(data), config)
+        # Same as the direct import: hide everything, then try to delete; rows still referenced stay hidden.
+        f.write(
+            """-- 1. Скриване и изтриване на съществуващите партньори
+UPDATE [dbo].[Partners] SET [Visible] = 0;
+BEGIN TRY
+    DELETE FROM [dbo].[Partners];
+END TRY
+BEGIN CATCH
+END CATCH;
+GO
+
+-- 2. Нови записи с PartnerID = MAX(PartnerID) + пореден номер
+SELECT ISNULL(MAX([PartnerID]), 0) AS [MaxPartnerID] INTO #PartnerBase FROM [dbo].[Partners];
+IF COLUMNPROPERTY(OBJECT_ID('dbo.Partners'), 'PartnerID', 'IsIdentity') = 1
+    SET IDENTITY_INSERT [dbo].[Partners] ON;
+GO
+"""
+        )
+        written = 0
+        rows = ((i + 1, *(partner[column] for column in PARTNERS_SCRIPT_COLUMNS)) for i, partner in enumerate(data))
+        for batch in _batches(rows, batch_size):
+            f.write(
+                'INSERT INTO [dbo].[Partners] (\n'
+                '    [PartnerID], [Name], [NameEnglish], [ContactName], [ContactNameEnglish], [EMail], [Bulstat], [VatId],\n'
+                '    [BankName], [BankCode], [BankAccount], [Priority], [GroupID], [Visible], [MainPartnerID],\n'
+                '    [StatusID], [IsExported], [IsOSSPartner], [CountryID], [DocumentEndDatePeriod]\n'
+                ')\n'
+                'SELECT b.[MaxPartnerID] + v.[RowNumber], v.[Name], v.[NameEnglish], v.[ContactName], v.[ContactNameEnglish],\n'
+                '    v.[EMail], v.[Bulstat], v.[VatId], v.[BankName], v.[BankCode], v.[BankAccount], v.[Priority], v.[GroupID],\n'
+                '    1, b.[MaxPartnerID] + v.[RowNumber], v.[StatusID], 0, 0, v.[CountryID], 0\n'
+                'FROM (VALUES\n'
+            )
+            f.write(',\n'.join(f'({_row_values(row)})' for row in batch))
+            f.write(f'\n) v ([RowNumber], {value_columns})\nCROSS JOIN #PartnerBase b;\nGO\n')
+            written += len(batch)
+        f.write(
+            "IF COLUMNPROPERTY(OBJECT_ID('dbo.Partners'), 'PartnerID', 'IsIdentity') = 1\n"
+            '    SET IDENTITY_INSERT [dbo].[Partners] OFF;\n'
+            'DROP TABLE #PartnerBase;\nGO\n'
+        )
+        _script_footer(f)
+        return written
+
+    return _write_script(script_file, write_body)
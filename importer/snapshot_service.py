@@ -0,0 +1,320 @@
+import gzip
+import os
+import pickle
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from tkinter import messagebox
+
+try:
+    from .config import CONFIG
+    from .db import connect_with_fallback, ensure_database_selected
+    from .metrics import metric_rows, metric_stage, track_operation
+    from .purge_service import find_reference_columns
+    from .replica_service import invalidate_replica
+    from .state import database_state_dir
+    from .utils import with_tk_dialog
+except ImportError:
+    from config import CONFIG
+    from db import connect_with_fallback, ensure_database_selected
+    from metrics import metric_rows, metric_stage, track_operation
+    from purge_service import find_reference_columns
+    from replica_service import invalidate_replica
+    from state import database_state_dir
+    from utils import with_tk_dialog
+
+
+SNAPSHOT_SUFFIX = '.pkl.gz'
+UNDONE_SUFFIX = '.undone'
+
+ITEMS_UNREFERENCED = """
+    NOT EXISTS (SELECT 1 FROM [dbo].[DocumentDetails] d WHERE d.[ItemID] = t.[ItemID])
+    AND NOT EXISTS (SELECT 1 FROM [dbo].[DocumentTemplateDetails] dt WHERE dt.[ItemID] = t.[ItemID])
+"""
+
+
+def _snapshot_specs(config):
+    return {
+        'items': {'title': 'Стоки', 'table': config['table_name'], 'key': 'ItemID'},
+        'partners': {'title': 'Партньори', 'table': 'Partners', 'key': 'PartnerID'},
+    }
+
+
+def _snapshot_dir(config):
+    path = os.path.join(database_state_dir(config), 'snapshots')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def insertable_columns(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT c.name FROM sys.columns c
+        JOIN sys.types t ON t.user_type_id = c.user_type_id
+        WHERE c.object_id = OBJECT_ID(?) AND c.is_computed = 0 AND t.name NOT IN ('timestamp', 'rowversion')
+        ORDER BY c.column_id
+        """,
+        (f'dbo.{table}',),
+    )
+    columns = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return columns
+
+
+def _scalar(conn, sql, params=()):
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+
+def _read_frame(conn, sql):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return pd.read_sql(sql, conn)
+
+
+def _has_references(conn, table, key):
+    refs = find_reference_columns(conn, table, key)
+    if not refs:
+        return False
+    checks = ' OR '.join(
+        f"EXISTS (SELECT 1 FROM [{schema}].[{ref_table}] r JOIN [dbo].[{table}] t ON t.[{key}] = r.[{column}])"
+        for schema, ref_table, column in refs
+    )
+    return _scalar(conn, f"SELECT CASE WHEN {checks} THEN 1 ELSE 0 END") == 1
+
+
+def take_import_snapshot(conn, kind, config=CONFIG, groups=None):
+    spec = _snapshot_specs(config)[kind]
+    table, key = spec['table'], spec['key']
+    columns = insertable_columns(conn, table)
+    column_list = ', '.join(f't.[{col}]' for col in columns)
+    # A group-scoped items import only hides and deletes rows of its groups.
+    scope = f" AND t.[GroupID] IN ({', '.join(str(int(group)) for group in groups)})" if groups else ''
+
+    visible = _read_frame(conn, f"SELECT t.[{key}] FROM [dbo].[{table}] t WHERE t.[Visible] = 1{scope}")
+    if kind == 'items':
+        deleted_rows = _read_frame(
+            conn, f"SELECT {column_list} FROM [dbo].[{table}] t WHERE t.[Visible] = 1{scope} AND {ITEMS_UNREFERENCED}"
+        )
+    else:
+        # The partners import deletes either every row or none, see finish_import_snapshot. A referenced partner
+        # makes the delete fail, so the full table is read only when nothing points at it.
+        where = ' WHERE 1 = 0' if _has_references(conn, table, key) else ''
+        deleted_rows = _read_frame(conn, f"SELECT {column_list} FROM [dbo].[{table}] t{where}")
+
+    return {
+        'kind': kind,
+        'table': table,
+        'key': key,
+        'server': config['server'],
+        'database': config['database'],
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'columns': columns,
+        'identity': bool(_scalar(conn, f"SELECT COLUMNPROPERTY(OBJECT_ID('dbo.{table}'), '{key}', 'IsIdentity')") == 1),
+        'visible_ids': visible[key].to_numpy(dtype=np.int64),
+        'deleted_rows': deleted_rows,
+        'max_id_before': int(_scalar(conn, f"SELECT ISNULL(MAX([{key}]), 0) FROM [dbo].[{table}]") or 0),
+    }
+
+
+def finish_import_snapshot(conn, snapshot, inserted_after):
+    table, key = snapshot['table'], snapshot['key']
+    # The partners import deletes every row or none: a non-empty table before the insert means nothing was deleted.
+    if snapshot['kind'] == 'partners' and inserted_after > 0:
+        snapshot['deleted_rows'] = snapshot['deleted_rows'].iloc[0:0]
+    snapshot['inserted_after'] = inserted_after
+    snapshot['inserted_last'] = int(_scalar(conn, f"SELECT ISNULL(MAX([{key}]), 0) FROM [dbo].[{table}]") or 0)
+    return snapshot
+
+
+def save_snapshot(snapshot, log, config=CONFIG):
+    folder = _snapshot_dir(config)
+    # Microseconds keep two imports in the same second apart; latest_snapshots still reads the kind after the last '_'.
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    path = os.path.join(folder, f"{stamp}_{snapshot['kind']}{SNAPSHOT_SUFFIX}")
+    with gzip.open(path, 'wb', compresslevel=6) as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    log(
+        f"✓ Снимка за отмяна: {len(snapshot['visible_ids'])} скрити, {len(snapshot['deleted_rows'])} изтрити записа "
+        f"({os.path.getsize(path) // 1024} KB)"
+    )
+    _prune_snapshots(folder, config['snapshot_keep'])
+    return path
+
+
+def _prune_snapshots(folder, keep):
+    files = sorted(name for name in os.listdir(folder) if name.endswith((SNAPSHOT_SUFFIX, UNDONE_SUFFIX)))
+    for name in files[:-keep] if keep > 0 else []:
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+
+
+def load_snapshot(path):
+    with gzip.open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def latest_snapshots(config=CONFIG):
+    folder = _snapshot_dir(config)
+    latest = {}
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(SNAPSHOT_SUFFIX):
+            kind = name[:-len(SNAPSHOT_SUFFIX)].rsplit('_', 1)[-1]
+            latest[kind] = os.path.join(folder, name)
+        elif name.endswith(UNDONE_SUFFIX):
+            kind = name[:-len(SNAPSHOT_SUFFIX + UNDONE_SUFFIX)].rsplit('_', 1)[-1]
+            latest.pop(kind, None)
+    return latest
+
+
+def _insert_rows(cursor, table, columns, df, batch_size):
+    if df.empty:
+        return 0
+    sql = f"INSERT INTO [dbo].[{table}] ({', '.join(f'[{col}]' for col in columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    rows = [tuple(None if pd.isna(value) else value for value in row) for row in df[columns].itertuples(index=False)]
+    cursor.fast_executemany = True
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def restore_snapshot(conn, snapshot, log, config=CONFIG):
+    table, key = snapshot['table'], snapshot['key']
+    first_new, last_new = snapshot['inserted_after'], snapshot['inserted_last']
+    # When the partners import deleted the whole table, the new PartnerIDs start again from 1 over the old ones.
+    overlaps = snapshot['kind'] == 'partners' and first_new < snapshot['max_id_before'] and last_new > first_new
+    if overlaps and snapshot['deleted_rows'].empty:
+        raise ValueError(
+            'Импортът е изтрил старите партньори, а снимката не ги съдържа. '
+            'Новите PartnerID съвпадат със старите, затова отмяната е невъзможна.'
+        )
+    cursor = conn.cursor()
+    identity_on = False
+    try:
+        with metric_stage('hide'):
+            cursor.execute(f"UPDATE [dbo].[{table}] SET [Visible] = 0 WHERE [{key}] > ? AND [{key}] <= ?", (first_new, last_new))
+            hidden_new = cursor.rowcount
+            if snapshot['kind'] == 'items':
+                cursor.execute(
+                    f"DELETE t FROM [dbo].[{table}] t WHERE t.[{key}] > ? AND t.[{key}] <= ? AND {ITEMS_UNREFERENCED}",
+                    (first_new, last_new),
+                )
+            else:
+                cursor.execute(
+                    f"""
+                    BEGIN TRY
+                        DELETE FROM [dbo].[{table}] WHERE [{key}] > ? AND [{key}] <= ?;
+                    END TRY
+                    BEGIN CATCH
+                    END CATCH;
+                    """,
+                    (first_new, last_new),
+                )
+        log(f'  Скрити записи от импорта: {hidden_new}')
+        if overlaps and _scalar(conn, f"SELECT COUNT(*) FROM [dbo].[{table}] WHERE [{key}] > ? AND [{key}] <= ?", (first_new, last_new)):
+            raise ValueError(
+                'Новите партньори се използват в документи и не могат да бъдат изтрити. '
+                'PartnerID им съвпадат със старите, затова отмяната е отказана.'
+            )
+
+        with metric_stage('restore'):
+            if snapshot['identity'] and not snapshot['deleted_rows'].empty:
+                cursor.execute(f"SET IDENTITY_INSERT [dbo].[{table}] ON")
+                identity_on = True
+            restored_rows = _insert_rows(cursor, table, snapshot['columns'], snapshot['deleted_rows'], config['insert_batch_size'])
+            if identity_on:
+                cursor.execute(f"SET IDENTITY_INSERT [dbo].[{table}] OFF")
+                identity_on = False
+        log(f'  Възстановени изтрити записи: {restored_rows}')
+
+        with metric_stage('show'):
+            cursor.execute("CREATE TABLE #UndoKeys (ID INT PRIMARY KEY)")
+            keys = [(int(value),) for value in snapshot['visible_ids']]
+            if keys:
+                cursor.fast_executemany = True
+                cursor.executemany("INSERT INTO #UndoKeys (ID) VALUES (?)", keys)
+            cursor.execute(f"UPDATE t SET t.[Visible] = 1 FROM [dbo].[{table}] t JOIN #UndoKeys k ON k.ID = t.[{key}]")
+            visible_again = cursor.rowcount
+            cursor.execute("DROP TABLE #UndoKeys")
+        log(f'  Отново видими записи: {visible_again} от {len(keys)}')
+
+        with metric_stage('commit'):
+            conn.commit()
+        metric_rows('hidden', hidden_new)
+        metric_rows('restored', restored_rows)
+        metric_rows('visible', visible_again)
+        invalidate_replica(config, [table])
+        return {'hidden': hidden_new, 'restored': restored_rows, 'visible': visible_again}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if identity_on:
+            try:
+                cursor.execute(f"SET IDENTITY_INSERT [dbo].[{table}] OFF")
+            except Exception:
+                pass
+        cursor.close()
+
+
+def undo_last_import(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Отмяната е отказана: няма избрана база данни.')
+        return
+
+    latest = latest_snapshots(config)
+    if not latest:
+        log(f"ℹ Няма снимки за отмяна на импорт за база '{config['database']}'.")
+        return
+
+    specs = _snapshot_specs(config)
+    options = sorted(latest.items())
+    print('\nПоследни импорти, които могат да бъдат отменени:')
+    for i, (kind, path) in enumerate(options, 1):
+        print(f"{i}. {specs[kind]['title']}: {os.path.basename(path)[:15]}")
+    choice = input(f'Изберете (1-{len(options)}, 0 - Отказ): ').strip()
+    try:
+        kind, path = options[int(choice) - 1]
+    except (ValueError, IndexError):
+        log('Отмяната е отказана от потребителя.')
+        return
+
+    snapshot = load_snapshot(path)
+    if snapshot['database'] != config['database']:
+        log('✗ Снимката е от друга база данни.')
+        return
+
+    if not with_tk_dialog(
+        lambda r: messagebox.askyesno(
+            'Потвърждение',
+            f"Ще бъде отменен импортът на {specs[kind]['title']} от {snapshot['created_at']}.\n"
+            f"Записите, добавени от него, ще бъдат скрити, а предишните {len(snapshot['visible_ids'])} ще станат видими отново.\n"
+            'Потвърждавате ли?',
+            parent=r,
+        )
+    ):
+        return
+
+    log(f"=== ОТМЯНА НА ИМПОРТ: {specs[kind]['title']} от {snapshot['created_at']} ===")
+    conn = connect_with_fallback(config, log)
+    if not conn:
+        return
+
+    try:
+        with track_operation(f'undo_{kind}', config):
+            restore_snapshot(conn, snapshot, log, config)
+        os.replace(path, f'{path}{UNDONE_SUFFIX}')
+        log('✓ Импортът е отменен.')
+        with_tk_dialog(lambda r: messagebox.showinfo('Успех', 'Импортът е отменен.', parent=r))
+    except Exception as e:
+        log(f'✗ Грешка при отмяна на импорт: {e}')
+    finally:
+        conn.close()
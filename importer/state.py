@@ -0,0 +1,39 @@
+import json
+import os
+import re
+import threading
+
+try:
+    from .config import CONFIG
+except ImportError:
+    from config import CONFIG
+
+
+def read_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def database_state_dir(config=CONFIG):
+    folder = re.sub(r'[^\w.-]+', '_', f"{config['server']}__{config['database']}")
+    path = os.path.join(config['state_dir'], folder)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def load_database_state(name, config=CONFIG, default=None):
+    return read_json(os.path.join(database_state_dir(config), f'{name}.json'), default if default is not None else {})
+
+
+def save_database_state(name, data, config=CONFIG):
+    write_json(os.path.join(database_state_dir(config), f'{name}.json'), data)
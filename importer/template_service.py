@@ -0,0 +1,198 @@
+import hashlib
+import numbers
+import os
+import re
+import zipfile
+from datetime import date, datetime
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook.defined_name import DefinedName
+
+try:
+    from .config import CONFIG
+    from .state import database_state_dir
+    from .utils import add_dropdown_validation, format_header_bold
+except ImportError:
+    from config import CONFIG
+    from state import database_state_dir
+    from utils import add_dropdown_validation, format_header_bold
+
+
+# Bump when the template layout changes so cached templates are rebuilt.
+TEMPLATE_VERSION = 1
+XLSX_LAST_ROW = 1048576
+STREAM_CHUNK_ROWS = 10000
+
+# (sheet, ID column, description column, extra columns, Items column with the dropdown)
+ITEMS_REFERENCE_SHEETS = [
+    ('VatRates', 'ДДС ID', 'Описание', ['Описание', 'Стойност', 'Тип'], 'E'),
+    ('ItemGroups', 'Група ID', 'Име', ['Име'], 'F'),
+    ('Status', 'Статус ID', 'Име', ['Име'], 'G'),
+    ('VatTerms', 'ДДС Срок ID', 'Описание', ['Описание', 'Тип'], 'H'),
+]
+ITEMS_NUMBER_FORMATS = {'A': '@', 'C': '@', 'D': '0.00'}
+DATE_NUMBER_FORMAT = 'yyyy-mm-dd'
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def date_columns(df):
+    return [column for column in df.columns if pd.api.types.is_datetime64_any_dtype(df[column])]
+
+
+def reference_checksum(refs, columns, dates=()):
+    digest = hashlib.sha256(f'{TEMPLATE_VERSION}|{list(columns)}|{list(dates)}'.encode('utf-8'))
+    for sheet, _, _, _, _ in ITEMS_REFERENCE_SHEETS:
+        df = refs[sheet]
+        digest.update(f'{sheet}|{list(df.columns)}|'.encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+    return digest.hexdigest()[:20]
+
+
+def build_items_template(template_file, refs, columns, dates=()):
+    with pd.ExcelWriter(template_file, engine='openpyxl') as writer:
+        pd.DataFrame(columns=list(columns)).to_excel(writer, index=False, sheet_name='Items')
+        ws_items = writer.sheets['Items']
+        format_header_bold(ws_items)
+        # Row 2 only carries the cell styles the streamed rows reuse; it has no values.
+        for column, number_format in ITEMS_NUMBER_FORMATS.items():
+            ws_items[f'{column}2'].number_format = number_format
+        for i, column in enumerate(columns, 1):
+            if column in dates:
+                ws_items.cell(row=2, column=i).number_format = DATE_NUMBER_FORMAT
+
+        for sheet, id_column, label_column, extra_columns, items_column in ITEMS_REFERENCE_SHEETS:
+            df_ref = refs[sheet].copy()
+            if df_ref.empty:
+                continue
+            df_ref['Display'] = df_ref[id_column].astype(str) + ' - ' + df_ref[label_column]
+            df_ref[[id_column, 'Display'] + extra_columns].to_excel(writer, index=False, sheet_name=sheet)
+
+            list_name = f'{sheet}List'
+            writer.book.defined_names[list_name] = DefinedName(list_name, attr_text=f"'{sheet}'!$B$2:$B${len(df_ref) + 1}")
+            add_dropdown_validation(ws_items, items_column, sheet, 'B', 2, XLSX_LAST_ROW, source_range=list_name)
+
+
+def ensure_items_template(refs, columns, config=CONFIG, dates=()):
+    template_dir = os.path.join(database_state_dir(config), 'templates')
+    os.makedirs(template_dir, exist_ok=True)
+    template_file = os.path.join(template_dir, f'items_{reference_checksum(refs, columns, dates)}.xlsx')
+    if os.path.exists(template_file):
+        return template_file
+
+    tmp_file = f'{template_file}.{os.getpid()}.tmp.xlsx'
+    build_items_template(tmp_file, refs, columns, dates)
+    os.replace(tmp_file, template_file)
+    for name in os.listdir(template_dir):
+        path = os.path.join(template_dir, name)
+        if name.startswith('items_') and path != template_file:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return template_file
+
+
+def _sheet_part(archive, sheet_name):
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(f'{{{PACKAGE_REL_NS}}}Relationship')}
+    for sheet in workbook.iter(f'{{{MAIN_NS}}}sheet'):
+        if sheet.get('name') == sheet_name:
+            target = targets[sheet.get(f'{{{REL_NS}}}id')]
+            return target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    raise ValueError(f"Шаблонът няма sheet '{sheet_name}'")
+
+
+def _column_widths(df):
+    widths = []
+    for column in df.columns:
+        values = df[column].dropna().astype(str)
+        longest = max(len(str(column)), int(values.str.len().max()) if len(values) else 0)
+        widths.append(min(longest + 2, 50))
+    return widths
+
+
+def _excel_serial(value):
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_localize(None)
+    return (value - EXCEL_EPOCH) / pd.Timedelta(days=1)
+
+
+def _cell_xml(ref, value, style):
+    # pd.isna covers None, NaN, NaT and pd.NA alike.
+    if value is None or pd.isna(value):
+        return ''
+    style_attr = f' s="{style}"' if style else ''
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    # Dates are stored as serial numbers; the column's date style in the template makes Excel show them as dates.
+    if isinstance(value, (datetime, date, np.datetime64)):
+        return f'<c r="{ref}"{style_attr}><v>{_excel_serial(value)!r}</v></c>'
+    if isinstance(value, (numbers.Integral, np.integer)):
+        return f'<c r="{ref}"{style_attr}><v>{int(value)}</v></c>'
+    if isinstance(value, (numbers.Number, np.number)):
+        return f'<c r="{ref}"{style_attr}><v>{float(value)!r}</v></c>'
+    text = escape(ILLEGAL_XML_CHARS.sub('', str(value)))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _write_sheet_rows(out, df, styles):
+    letters = [get_column_letter(i) for i in range(1, len(df.columns) + 1)]
+    cell_styles = [styles.get(letter) for letter in letters]
+    row_number = 1
+    for start in range(0, len(df), STREAM_CHUNK_ROWS):
+        parts = []
+        for values in df.iloc[start:start + STREAM_CHUNK_ROWS].itertuples(index=False, name=None):
+            row_number += 1
+            cells = ''.join(
+                _cell_xml(f'{letter}{row_number}', value, style) for letter, value, style in zip(letters, values, cell_styles)
+            )
+            parts.append(f'<row r="{row_number}">{cells}</row>')
+        out.write(''.join(parts).encode('utf-8'))
+
+
+def _write_items_sheet(out, template_xml, df_items):
+    head, _, rest = template_xml.partition('<sheetData>')
+    sheet_data, _, tail = rest.partition('</sheetData>')
+    header_row = re.search(r'<row r="1"[^>]*>.*?</row>', sheet_data, re.S).group(0)
+    style_row = re.search(r'<row r="2"[^>]*>.*?</row>', sheet_data, re.S)
+    styles = dict(re.findall(r'<c r="([A-Z]+)2" s="(\d+)"', style_row.group(0))) if style_row else {}
+
+    last_column = get_column_letter(max(1, len(df_items.columns)))
+    cols = ''.join(
+        f'<col min="{i}" max="{i}" width="{width}" customWidth="1"/>' for i, width in enumerate(_column_widths(df_items), 1)
+    )
+    head = re.sub(r'<dimension ref="[^"]*"/>', f'<dimension ref="A1:{last_column}{len(df_items) + 1}"/>', head)
+    # <cols> sits right before <sheetData> in the schema order, so it can be rebuilt in place.
+    head = re.sub(r'<cols>.*?</cols>', '', head, flags=re.S)
+    out.write(f'{head}<cols>{cols}</cols><sheetData>{header_row}'.encode('utf-8'))
+    _write_sheet_rows(out, df_items, styles)
+    out.write(f'</sheetData>{tail}'.encode('utf-8'))
+
+
+def stream_items_workbook(template_file, export_file, df_items):
+    tmp_file = f'{export_file}.{os.getpid()}.tmp'
+    try:
+        with zipfile.ZipFile(template_file) as src, zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as dst:
+            items_part = _sheet_part(src, 'Items')
+            for info in src.infolist():
+                if info.filename == items_part:
+                    with dst.open(info.filename, 'w', force_zip64=True) as out:
+                        _write_items_sheet(out, src.read(info.filename).decode('utf-8'), df_items)
+                else:
+                    dst.writestr(info, src.read(info.filename))
+        os.replace(tmp_file, export_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return len(df_items)
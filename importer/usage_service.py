@@ -0,0 +1,174 @@
+try:
+    from .config import CONFIG
+except ImportError:
+    from config import CONFIG
+
+
+DOCUMENT_KEY_CANDIDATES = ['DocumentID', 'DocID']
+TEMPLATE_KEY_CANDIDATES = ['DocumentTemplateID', 'TemplateID', 'DocumentID']
+PRICE_CANDIDATES = ['Price', 'SalePrice', 'PriceOut', 'SinglePrice', 'UnitPrice']
+DATE_CANDIDATES = ['Date', 'DocumentDate', 'DocDate', 'IssueDate', 'CreatedDate', 'CreateDate']
+HEADER_CANDIDATES = ['Documents', 'Document']
+DATE_TYPES = ('date', 'datetime', 'datetime2', 'smalldatetime', 'datetimeoffset')
+
+USAGE_COLUMNS = ['Брой документи', 'Брой шаблони', 'Последна продажба', 'Последна цена']
+
+
+def _table_columns(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = 'dbo' AND TABLE_NAME = ?
+        ORDER BY ORDINAL_POSITION
+        """,
+        (table,),
+    )
+    columns = {row[0].lower(): (row[0], row[1].lower()) for row in cursor.fetchall()}
+    cursor.close()
+    return columns
+
+
+def _pick(columns, candidates):
+    for candidate in candidates:
+        if candidate.lower() in columns:
+            return columns[candidate.lower()][0]
+    return None
+
+
+def _referenced_table(conn, table, column):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT OBJECT_NAME(fkc.referenced_object_id), COL_NAME(fkc.referenced_object_id, fkc.referenced_column_id)
+        FROM sys.foreign_key_columns fkc
+        WHERE fkc.parent_object_id = OBJECT_ID(?) AND COL_NAME(fkc.parent_object_id, fkc.parent_column_id) = ?
+        """,
+        (f'dbo.{table}', column),
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def discover_usage_sources(conn):
+    # Invoice Pro versions differ in the names of the document columns, so they are looked up instead of assumed.
+    sources = {'details': None, 'templates': None}
+
+    detail_columns = _table_columns(conn, 'DocumentDetails')
+    document_key = _pick(detail_columns, DOCUMENT_KEY_CANDIDATES)
+    if 'itemid' in detail_columns and document_key:
+        header, header_key = _referenced_table(conn, 'DocumentDetails', document_key)
+        header_columns = _table_columns(conn, header) if header else {}
+        if not header_columns:
+            for candidate in HEADER_CANDIDATES:
+                header_columns = _table_columns(conn, candidate)
+                if document_key.lower() in header_columns:
+                    header, header_key = candidate, header_columns[document_key.lower()][0]
+                    break
+            else:
+                header, header_columns = None, {}
+
+        date_column = _pick(header_columns, DATE_CANDIDATES)
+        if date_column is None:
+            date_column = next(
+                (name for name, kind in header_columns.values() if kind in DATE_TYPES and 'date' in name.lower()), None
+            )
+        sources['details'] = {
+            'document_key': document_key,
+            'price': _pick(detail_columns, PRICE_CANDIDATES),
+            'header': header if date_column else None,
+            'header_key': header_key,
+            'date': date_column,
+        }
+
+    template_columns = _table_columns(conn, 'DocumentTemplateDetails')
+    template_key = _pick(template_columns, TEMPLATE_KEY_CANDIDATES)
+    if 'itemid' in template_columns and template_key:
+        sources['templates'] = {'template_key': template_key}
+    return sources
+
+
+def build_usage_aggregate(sources, config=CONFIG):
+    visible = f"SELECT [ItemID] FROM [dbo].[{config['table_name']}] WHERE [Visible] = 1"
+    details, templates = sources['details'], sources['templates']
+    parts = []
+    columns = ['ItemID']
+
+    if details:
+        document_key = f"d.[{details['document_key']}]"
+        # The latest price is taken in the same pass: MAX over "<date><document id><price>" picks the newest line.
+        order_key = f"RIGHT(REPLICATE('0', 19) + CAST({document_key} AS VARCHAR(19)), 19)"
+        order_length = 19
+        date_expr = 'NULL'
+        join = ''
+        if details['date']:
+            date_expr = f"h.[{details['date']}]"
+            order_key = f"CONVERT(CHAR(23), {date_expr}, 121) + {order_key}"
+            order_length += 23
+            join = f"JOIN [dbo].[{details['header']}] h ON h.[{details['header_key']}] = {document_key}"
+        price_expr = (
+            f"{order_key} + CONVERT(VARCHAR(40), CAST(d.[{details['price']}] AS DECIMAL(19, 4)))" if details['price'] else 'NULL'
+        )
+        parts.append(
+            f"""
+            SELECT d.[ItemID], 1 AS Source, {document_key} AS DocumentKey, {date_expr} AS DocumentDate, {price_expr} AS PriceKey
+            FROM [dbo].[DocumentDetails] d {join}
+            WHERE d.[ItemID] IN ({visible})
+            """
+        )
+        columns.append('COUNT(DISTINCT CASE WHEN Source = 1 THEN DocumentKey END) AS UsageDocuments')
+        if details['date']:
+            columns.append('MAX(DocumentDate) AS UsageLastDate')
+        if details['price']:
+            columns.append(f'CAST(SUBSTRING(MAX(PriceKey), {order_length + 1}, 40) AS DECIMAL(19, 4)) AS UsageLastPrice')
+
+    if templates:
+        parts.append(
+            f"""
+            SELECT [ItemID], 2 AS Source, [{templates['template_key']}] AS DocumentKey, NULL AS DocumentDate, NULL AS PriceKey
+            FROM [dbo].[DocumentTemplateDetails]
+            WHERE [ItemID] IN ({visible})
+            """
+        )
+        columns.append('COUNT(DISTINCT CASE WHEN Source = 2 THEN DocumentKey END) AS UsageTemplates')
+
+    if not parts:
+        return None, []
+
+    select = []
+    if details:
+        select.append(('Брой документи', 'ISNULL(u.UsageDocuments, 0)'))
+    if templates:
+        select.append(('Брой шаблони', 'ISNULL(u.UsageTemplates, 0)'))
+    if details and details['date']:
+        select.append(('Последна продажба', 'u.UsageLastDate'))
+    if details and details['price']:
+        select.append(('Последна цена', 'u.UsageLastPrice'))
+
+    aggregate = f"""
+        SELECT {', '.join(columns)}
+        FROM ({' UNION ALL '.join(parts)}) usage_rows
+        GROUP BY [ItemID]
+    """
+    return aggregate, select
+
+
+def items_usage_query(conn, select_columns, log, config=CONFIG):
+    sources = discover_usage_sources(conn)
+    aggregate, usage_select = build_usage_aggregate(sources, config)
+    if aggregate is None:
+        log('⚠ Не са намерени DocumentDetails/DocumentTemplateDetails с колона ItemID - експорт без данни за употреба.')
+        return None
+
+    labels = [label for label, _ in usage_select]
+    missing = [column for column in USAGE_COLUMNS if column not in labels]
+    if missing:
+        log(f"⚠ Липсват данни за: {', '.join(missing)}")
+
+    return f"""
+    SELECT {select_columns}, {', '.join(f"{expr} AS '{label}'" for label, expr in usage_select)}
+    FROM [dbo].[{config['table_name']}] i
+    LEFT JOIN ({aggregate}) u ON u.[ItemID] = i.[ItemID]
+    WHERE i.[Visible] = 1
+    """
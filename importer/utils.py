@@ -82,9 +82,9 @@ def parse_id_value(value):
     return None
 
 
-def add_dropdown_validation(worksheet, column_letter, source_sheet, source_column, start_row, end_row, allow_blank=True):
+def add_dropdown_validation(worksheet, column_letter, source_sheet, source_column, start_row, end_row, allow_blank=True, source_range=None):
     max_source_row = 1000
-    formula = f"='{source_sheet}'!${source_column}$2:${source_column}${max_source_row}"
+    formula = f"={source_range}" if source_range else f"='{source_sheet}'!${source_column}$2:${source_column}${max_source_row}"
     dv = DataValidation(type='list', formula1=formula, allow_blank=allow_blank)
     dv.error = 'Моля изберете стойност от списъка'
     dv.errorTitle = 'Невалидна стойност'
@@ -0,0 +1,181 @@
+import hashlib
+import math
+import os
+import warnings
+from decimal import ROUND_HALF_UP, Decimal
+
+import pandas as pd
+from tkinter import filedialog, messagebox
+
+try:
+    from .config import CONFIG, EXPECTED_COLUMNS
+    from .db import connect_with_fallback, ensure_database_selected
+    from .import_service import build_items_import_frame
+    from .utils import with_tk_dialog
+    from .workbook import MANIFEST_SUFFIX, read_import_sheet
+except ImportError:
+    from config import CONFIG, EXPECTED_COLUMNS
+    from db import connect_with_fallback, ensure_database_selected
+    from import_service import build_items_import_frame
+    from utils import with_tk_dialog
+    from workbook import MANIFEST_SUFFIX, read_import_sheet
+
+
+VERIFY_COLUMNS = ['Code', 'Name', 'Measure', 'SalePrice', 'VatRateID', 'GroupID', 'StatusID', 'VatTermID']
+VERIFY_SAMPLE_SIZE = 20
+
+# Both sides hash the same NVARCHAR (UTF-16LE) text: MD5 of Code picks the
+# bucket, MD5 of the whole row is summed per bucket as a 32-bit unsigned value.
+SQL_BUCKET_EXPR = "CAST(SUBSTRING(HASHBYTES('MD5', CAST(ISNULL([Code], '') AS NVARCHAR(4000))), 1, 4) AS BIGINT) % ?"
+SQL_ROW_EXPR = """CAST(SUBSTRING(HASHBYTES('MD5', CAST(CONCAT(
+    [Code], N'|', [Name], N'|', [Measure], N'|', CONVERT(VARCHAR(30), CAST([SalePrice] AS DECIMAL(18, 2))), N'|',
+    [VatRateID], N'|', [GroupID], N'|', [StatusID], N'|', [VatTermID]
+) AS NVARCHAR(4000))), 1, 4) AS BIGINT)"""
+
+
+def _md5_prefix(text):
+    return int.from_bytes(hashlib.md5(text.encode('utf-16-le')).digest()[:4], 'big')
+
+
+def _format_price(value):
+    return str(Decimal(repr(float(value))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+def _canonical_row(row):
+    return '|'.join(
+        [row.Code, row.Name, row.Measure, _format_price(row.SalePrice)]
+        + [str(int(getattr(row, col))) for col in ('VatRateID', 'GroupID', 'StatusID', 'VatTermID')]
+    )
+
+
+def hash_workbook_rows(df_rows, buckets):
+    df_rows = df_rows.copy()
+    df_rows['Bucket'] = [_md5_prefix(code) % buckets for code in df_rows['Code']]
+    df_rows['RowValue'] = [_md5_prefix(_canonical_row(row)) for row in df_rows.itertuples(index=False)]
+    return df_rows
+
+
+def summarize_buckets(df_hashed):
+    return df_hashed.groupby('Bucket').agg(Rows=('RowValue', 'size'), Total=('RowValue', 'sum'))
+
+
+def _read_server_buckets(conn, config, buckets):
+    query = f"""
+    SELECT Bucket, COUNT(*) AS Rows, SUM(RowValue) AS Total
+    FROM (
+        SELECT {SQL_BUCKET_EXPR} AS Bucket, {SQL_ROW_EXPR} AS RowValue
+        FROM [dbo].[{config['table_name']}]
+        WHERE [Visible] = 1
+    ) h
+    GROUP BY Bucket
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df = pd.read_sql(query, conn, params=[buckets])
+    return df.set_index('Bucket')[['Rows', 'Total']]
+
+
+def _read_server_rows(conn, config, buckets, bucket_ids):
+    query = f"""
+    SELECT [Code], [Name], [Measure], [SalePrice], [VatRateID], [GroupID], [StatusID], [VatTermID],
+           {SQL_ROW_EXPR} AS RowValue
+    FROM [dbo].[{config['table_name']}]
+    WHERE [Visible] = 1 AND {SQL_BUCKET_EXPR} IN ({', '.join(str(int(b)) for b in bucket_ids)})
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        df = pd.read_sql(query, conn, params=[buckets])
+    df['Code'] = df['Code'].fillna('').astype(str)
+    return df
+
+
+def compare_bucket_rows(df_workbook, df_server):
+    merged = df_workbook.merge(df_server, on='Code', how='outer', suffixes=('', ' (SQL)'), indicator=True)
+    missing = merged[merged['_merge'] == 'left_only']
+    extra = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+    changed = both[both['RowValue'] != both['RowValue (SQL)']]
+    return missing, extra, changed
+
+
+def verify_items_excel(log, config=CONFIG):
+    if not ensure_database_selected(config, log):
+        log('Проверката е отменена: няма избрана база данни.')
+        return
+
+    import_file = with_tk_dialog(
+        lambda r: filedialog.askopenfilename(
+            title='Изберете Excel файл за проверка',
+            filetypes=[('Excel файлове', '*.xlsx *.xls'), ('Експорт на части', f'*{MANIFEST_SUFFIX}'), ('Всички файлове', '*.*')],
+            initialdir=os.getcwd(),
+            parent=r,
+        )
+    )
+    if not import_file:
+        log('Проверката е отменена от потребителя.')
+        return
+
+    log(f'✓ Избран файл за проверка: {import_file}')
+    log('=== ПРОВЕРКА EXCEL ↔ SQL ===')
+
+    try:
+        df, _ = read_import_sheet(
+            import_file,
+            ['Items'],
+            log,
+            config,
+            skiprows=config['skiprows'],
+            fallback=config['sheet_name'],
+            dtype_plan='items',
+            kind='items',
+        )
+        if not all(col in df.columns for col in EXPECTED_COLUMNS):
+            log('✗ Липсват задължителни колони!')
+            return
+
+        df_rows = build_items_import_frame(df, log)[VERIFY_COLUMNS]
+        buckets = max(1, math.ceil(len(df_rows) / config['verify_chunk_rows']))
+        df_hashed = hash_workbook_rows(df_rows, buckets)
+        workbook_buckets = summarize_buckets(df_hashed)
+
+        conn = connect_with_fallback(config, log)
+        if not conn:
+            return
+
+        try:
+            server_buckets = _read_server_buckets(conn, config, buckets)
+            joined = workbook_buckets.join(server_buckets, how='outer', lsuffix='_xl', rsuffix='_sql').fillna(0)
+            mismatched = joined[(joined['Rows_xl'] != joined['Rows_sql']) | (joined['Total_xl'] != joined['Total_sql'])]
+            log(
+                f'Записи: Excel {len(df_rows)} | SQL {int(server_buckets["Rows"].sum())} | '
+                f'Блокове: {buckets} | Различаващи се блокове: {len(mismatched)}'
+            )
+
+            if mismatched.empty:
+                log('✓ Видимите записи в базата съвпадат с Excel файла.')
+                with_tk_dialog(lambda r: messagebox.showinfo('Успех', 'Данните в базата съвпадат с Excel файла.', parent=r))
+                return
+
+            bucket_ids = [int(b) for b in mismatched.index]
+            df_server = _read_server_rows(conn, config, buckets, bucket_ids)
+        finally:
+            conn.close()
+
+        missing, extra, changed = compare_bucket_rows(df_hashed[df_hashed['Bucket'].isin(bucket_ids)], df_server)
+        log(f'✗ Липсват в базата: {len(missing)} | Излишни в базата: {len(extra)} | С различни стойности: {len(changed)}')
+
+        for title, frame in (('Липсват в базата', missing), ('Излишни в базата', extra), ('С различни стойности', changed)):
+            if frame.empty:
+                continue
+            print(f'\n{title} (първи {VERIFY_SAMPLE_SIZE}):')
+            columns = [c for c in frame.columns if c not in ('Bucket', 'RowValue', 'RowValue (SQL)', '_merge')]
+            print(frame[columns].head(VERIFY_SAMPLE_SIZE).to_string(index=False))
+
+        report_file = f'{os.path.splitext(import_file)[0]}_verify.xlsx'
+        with pd.ExcelWriter(report_file, engine='openpyxl') as writer:
+            for sheet, frame in (('Missing', missing), ('Extra', extra), ('Changed', changed)):
+                frame.drop(columns=['Bucket', '_merge'], errors='ignore').to_excel(writer, index=False, sheet_name=sheet)
+        log(f'✓ Отчет за разликите: {report_file}')
+
+    except Exception as e:
+        log(f'✗ Грешка при проверка: {e}')
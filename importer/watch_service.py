@@ -0,0 +1,172 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+try:
+    from .config import CONFIG
+    from .import_service import import_items_file, import_partners_file
+    from .state import write_json
+    from .workbook import list_sheet_names
+except ImportError:
+    from config import CONFIG
+    from import_service import import_items_file, import_partners_file
+    from state import write_json
+    from workbook import list_sheet_names
+
+
+WATCH_EXTENSIONS = ('.xlsx', '.xls')
+DONE_DIR = 'done'
+FAILED_DIR = 'failed'
+
+
+def detect_import_kind(path, config=CONFIG):
+    sheet_names = list_sheet_names(path, config)
+    if 'Items' in sheet_names:
+        return 'items'
+    if 'Партньори' in sheet_names or 'Partners' in sheet_names:
+        return 'partners'
+    return None
+
+
+def _is_watched_file(name):
+    return name.lower().endswith(WATCH_EXTENSIONS) and not name.startswith(('~$', '.'))
+
+
+def scan_watch_dir(watch_dir, config=CONFIG):
+    found = []
+    for entry in os.scandir(watch_dir):
+        if entry.is_file() and _is_watched_file(entry.name):
+            found.append((entry.path, config['database']))
+        elif entry.is_dir() and entry.name not in (DONE_DIR, FAILED_DIR) and not entry.name.startswith('.'):
+            for sub_entry in os.scandir(entry.path):
+                if sub_entry.is_file() and _is_watched_file(sub_entry.name):
+                    found.append((sub_entry.path, entry.name))
+    return found
+
+
+def _move_with_report(path, status, report):
+    target_dir = os.path.join(os.path.dirname(path), status)
+    os.makedirs(target_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    target = os.path.join(target_dir, f'{stamp}_{os.path.basename(path)}')
+    shutil.move(path, target)
+    write_json(f'{target}.result.json', report)
+    return target
+
+
+def process_watched_file(path, database, log, config=CONFIG):
+    db_config = dict(config, database=database)
+    started = time.monotonic()
+    report = {
+        'file': os.path.basename(path),
+        'database': database,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    log(f'[{database}] Импорт на {os.path.basename(path)}...')
+
+    try:
+        kind = detect_import_kind(path, db_config)
+        if kind is None:
+            raise ValueError("Не е намерен sheet 'Items', 'Партньори' или 'Partners'.")
+        report['kind'] = kind
+        importer = import_items_file if kind == 'items' else import_partners_file
+        report.update(importer(path, log, db_config))
+        report['status'] = DONE_DIR
+    except Exception as e:
+        report['status'] = FAILED_DIR
+        report['error'] = str(e)
+
+    report['seconds'] = round(time.monotonic() - started, 3)
+    try:
+        target = _move_with_report(path, report['status'], report)
+    except Exception as e:
+        log(f'✗ [{database}] Файлът не може да бъде преместен: {e} (няма да се импортира отново, докато не бъде променен)')
+        return report
+
+    if report['status'] == DONE_DIR:
+        log(f"✓ [{database}] {report['file']}: добавени {report['inserted']} записа за {report['seconds']} сек. → {target}")
+    else:
+        log(f"✗ [{database}] {report['file']}: {report['error']} → {target}")
+    return report
+
+
+def _database_worker(database, jobs, pending, processed, pending_lock, log, config):
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        path, signature = job
+        try:
+            process_watched_file(path, database, log, config)
+        finally:
+            with pending_lock:
+                pending.discard(path)
+                # A file that could not be moved (e.g. still open in Excel) stays in the folder;
+                # it is not imported again until its size or mtime changes.
+                if os.path.exists(path):
+                    processed[path] = signature
+
+
+def run_watch_folder(watch_dir, log, config=CONFIG, poll_interval=None, once=False):
+    if not os.path.isdir(watch_dir):
+        log(f'✗ Папката не съществува: {watch_dir}')
+        return
+
+    poll_interval = poll_interval or config['watch_interval']
+    log(f'=== НАБЛЮДЕНИЕ НА ПАПКА: {watch_dir} ===')
+    log(f"База по подразбиране: {config['database']} | Проверка на всеки {poll_interval} сек. | Ctrl+C за спиране")
+
+    seen = {}
+    pending = set()
+    processed = {}
+    pending_lock = threading.Lock()
+    workers = {}
+
+    try:
+        while True:
+            current = {}
+            for path, database in scan_watch_dir(watch_dir, config):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                current[path] = signature
+
+                # A file is queued only after its size and mtime are unchanged between two polls.
+                stable = once or seen.get(path) == signature
+                with pending_lock:
+                    if not stable or path in pending or processed.get(path) == signature:
+                        continue
+                    processed.pop(path, None)
+                    pending.add(path)
+
+                if database not in workers:
+                    jobs = queue.Queue()
+                    thread = threading.Thread(
+                        target=_database_worker,
+                        args=(database, jobs, pending, processed, pending_lock, log, config),
+                        daemon=True,
+                    )
+                    thread.start()
+                    workers[database] = (jobs, thread)
+                workers[database][0].put((path, signature))
+                log(f'[{database}] В опашката: {os.path.basename(path)}')
+
+            seen = current
+            with pending_lock:
+                for path in [path for path in processed if path not in current]:
+                    del processed[path]
+            if once:
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        log('Спиране на наблюдението...')
+    finally:
+        for jobs, _ in workers.values():
+            jobs.put(None)
+        for _, thread in workers.values():
+            thread.join()
@@ -0,0 +1,371 @@
+import hashlib
+import importlib.util
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .config import CONFIG
+    from .state import read_json, write_json
+except ImportError:
+    from config import CONFIG
+    from state import read_json, write_json
+
+
+# Bump when the cached frame layout changes so stale entries are ignored.
+CACHE_VERSION = 3
+
+EXCEL_ENGINES = ('calamine', 'openpyxl')
+MANIFEST_SUFFIX = '.manifest.json'
+# Marks the rows of a delta export; such a workbook is not a full catalog and must never be imported.
+DELTA_CHANGE_COLUMN = 'Промяна'
+
+# Codes and identifiers are read as text so values like '018' keep their
+# leading zeros; prices are coerced to float after reading. Columns with few
+# distinct values (measures, reference IDs) are kept as categories.
+DTYPE_PLANS = {
+    'items': {
+        'Код': 'str',
+        'Стока': 'str',
+        'Мярка': 'category',
+        'Цена': 'float',
+        'ДДС ID': 'category',
+        'Група ID': 'category',
+        'Статус ID': 'category',
+        'ДДС Срок ID': 'category',
+    },
+    'partners': {
+        'PartnerID': 'str',
+        'MainPartnerID': 'str',
+        'ID': 'str',
+        'Име': 'str',
+        'Name': 'str',
+        'Company': 'str',
+        'Булстат': 'str',
+        'Bulstat': 'str',
+        'ДДС Номер': 'str',
+        'VatId': 'str',
+        'TaxNo': 'str',
+        'Банков код': 'str',
+        'BankCode': 'str',
+        'Банкова сметка': 'str',
+        'BankAccount': 'str',
+        'Phone': 'str',
+    },
+}
+
+
+def available_excel_engines():
+    engines = []
+    if importlib.util.find_spec('python_calamine') is not None:
+        engines.append('calamine')
+    if importlib.util.find_spec('openpyxl') is not None:
+        engines.append('openpyxl')
+    return engines
+
+
+def resolve_excel_engine(path, config=CONFIG):
+    requested = str(config.get('excel_engine', 'auto') or 'auto').strip().lower()
+    available = available_excel_engines()
+    if path.lower().endswith('.xls'):
+        return 'calamine' if 'calamine' in available and requested != 'openpyxl' else None
+    if requested in available:
+        return requested
+    return 'calamine' if 'calamine' in available else 'openpyxl'
+
+
+def _dtype_plan(plan):
+    if plan is None:
+        return {}
+    return DTYPE_PLANS[plan] if isinstance(plan, str) else plan
+
+
+def compact_string_dtype():
+    storage = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else 'python'
+    return pd.StringDtype(storage, na_value=np.nan)
+
+
+def compact_frame(df, plan):
+    for column, kind in _dtype_plan(plan).items():
+        if column not in df.columns:
+            continue
+        if kind == 'str' and df[column].dtype != compact_string_dtype():
+            df[column] = df[column].astype(compact_string_dtype())
+        elif kind == 'category' and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(compact_string_dtype()).astype('category')
+    return df
+
+
+def apply_dtype_plan(df, plan, log=None):
+    for column, kind in _dtype_plan(plan).items():
+        if column not in df.columns or kind != 'float':
+            continue
+        values = df[column]
+        if not pd.api.types.is_numeric_dtype(values):
+            values = values.astype(str).str.strip().str.replace(',', '.', regex=False)
+        numeric = pd.to_numeric(values, errors='coerce')
+        invalid = int((numeric.isna() & df[column].notna()).sum())
+        if invalid and log:
+            log(f"⚠ {invalid} стойности в колона '{column}' не са числа и се приемат за празни.")
+        df[column] = numeric.astype('float64')
+    return compact_frame(df, plan)
+
+
+def parse_excel_sheet(xls, sheet_name, skiprows=0, plan=None):
+    dtype = {column: str for column, kind in _dtype_plan(plan).items() if kind in ('str', 'category')}
+    return xls.parse(sheet_name, skiprows=skiprows, dtype=dtype or None)
+
+
+def estimate_sheet_memory(path):
+    if not zipfile.is_zipfile(path):
+        return os.path.getsize(path)
+    with zipfile.ZipFile(path) as archive:
+        return sum(
+            info.file_size
+            for info in archive.infolist()
+            if info.filename.startswith('xl/worksheets/') or info.filename == 'xl/sharedStrings.xml'
+        )
+
+
+def _convert_cell(value):
+    # Same as pandas' Excel readers: empty cells become missing values and
+    # whole floats become ints, so '18' is not read as '18.0'.
+    if value == '':
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _iter_sheet_rows(path, sheet_name, engine):
+    if engine == 'calamine':
+        from python_calamine import CalamineWorkbook
+
+        workbook = CalamineWorkbook.from_path(path)
+        yield from workbook.get_sheet_by_name(sheet_name).iter_rows()
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook[sheet_name].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_excel_sheet_chunks(path, candidates, log, config=CONFIG, chunk_rows=50000, skiprows=0, fallback=0, dtype_plan=None, streaming=False):
+    sheet_name = _resolve_sheet(list_sheet_names(path, config), candidates, fallback)
+    if sheet_name is None:
+        raise ValueError(f'Не е намерен sheet {list(candidates)} в {os.path.basename(path)}')
+
+    text_columns = {column for column, kind in _dtype_plan(dtype_plan).items() if kind in ('str', 'category')}
+    # calamine loads the whole sheet before iterating; only openpyxl in read-only mode streams rows from the zip.
+    # .xls files are at most 65 536 rows and openpyxl cannot read them.
+    engine = 'openpyxl' if streaming and not path.lower().endswith('.xls') else resolve_excel_engine(path, config) or 'openpyxl'
+    rows = _iter_sheet_rows(path, sheet_name, engine)
+    for _ in range(skiprows):
+        next(rows, None)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [str(value) if value not in (None, '') else f'Unnamed: {i}' for i, value in enumerate(header)]
+
+    def make_frame(batch):
+        df = pd.DataFrame(batch, columns=columns)
+        for column in text_columns.intersection(df.columns):
+            df[column] = df[column].map(lambda value: None if pd.isna(value) else str(value))
+        return apply_dtype_plan(df, dtype_plan, log)
+
+    batch = []
+    for row in rows:
+        values = [_convert_cell(value) for value in row[:len(columns)]]
+        if all(value is None for value in values):
+            continue
+        batch.append(values + [None] * (len(columns) - len(values)))
+        if len(batch) >= chunk_rows:
+            yield make_frame(batch)
+            batch = []
+    if batch:
+        yield make_frame(batch)
+
+
+def file_content_hash(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cached_content_hash(path, cache_dir):
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    index_path = os.path.join(cache_dir, 'index.json')
+    index = read_json(index_path, {})
+
+    entry = index.get(abs_path)
+    if entry and entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        return entry['sha256']
+
+    content_hash = file_content_hash(abs_path)
+    # A changed or deleted source leaves its old parse results behind; drop them once no indexed file has that content.
+    previous = {entry['sha256'] for entry in index.values()}
+    index[abs_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': content_hash}
+    index = {key: value for key, value in index.items() if key == abs_path or os.path.exists(key)}
+    write_json(index_path, index)
+    for stale_hash in previous - {entry['sha256'] for entry in index.values()}:
+        _remove_cached_hash(cache_dir, stale_hash)
+    return content_hash
+
+
+def _remove_cached_hash(cache_dir, content_hash):
+    for name in os.listdir(cache_dir):
+        if name == f'{content_hash}.json' or name.startswith(f'{content_hash}_'):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def _enforce_cache_size(cache_dir, max_mb):
+    # Least recently used parse results go first; a cache hit touches its file, see read_excel_sheet.
+    if max_mb <= 0:
+        return
+    entries = sorted(
+        (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+        for entry in os.scandir(cache_dir)
+        if entry.is_file() and entry.name.endswith('.pkl')
+    )
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _resolve_sheet(sheet_names, candidates, fallback):
+    for candidate in candidates:
+        if candidate in sheet_names:
+            return candidate
+    if fallback is None:
+        return None
+    if isinstance(fallback, int):
+        return sheet_names[fallback] if 0 <= fallback < len(sheet_names) else None
+    return fallback if fallback in sheet_names else None
+
+
+def _frame_cache_path(cache_dir, content_hash, sheet_name, skiprows, plan):
+    plan_key = sorted(_dtype_plan(plan).items())
+    key = hashlib.sha1(f'{sheet_name}|{skiprows}|{plan_key}|{CACHE_VERSION}'.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{content_hash}_{key}.pkl')
+
+
+def _cached_sheet_names(path, config):
+    cache_dir = config.get('cache_dir')
+    if not config.get('excel_cache', True) or not cache_dir:
+        return None, None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    content_hash = _cached_content_hash(path, cache_dir)
+    meta = read_json(os.path.join(cache_dir, f'{content_hash}.json'), {})
+    return content_hash, meta.get('sheets') if meta.get('version') == CACHE_VERSION else None
+
+
+def list_sheet_names(path, config=CONFIG):
+    content_hash, sheet_names = _cached_sheet_names(path, config)
+    if sheet_names is not None:
+        return sheet_names
+
+    with pd.ExcelFile(path, engine=resolve_excel_engine(path, config)) as xls:
+        sheet_names = list(xls.sheet_names)
+    if content_hash:
+        write_json(
+            os.path.join(config['cache_dir'], f'{content_hash}.json'),
+            {'version': CACHE_VERSION, 'sheets': sheet_names},
+        )
+    return sheet_names
+
+
+def read_excel_sheet(path, candidates, log, config=CONFIG, skiprows=0, fallback=0, dtype_plan=None):
+    cache_dir = config.get('cache_dir')
+    content_hash, sheet_names = _cached_sheet_names(path, config)
+
+    engine = resolve_excel_engine(path, config)
+    xls = None
+    try:
+        if sheet_names is None:
+            xls = pd.ExcelFile(path, engine=engine)
+            sheet_names = list(xls.sheet_names)
+            if content_hash:
+                write_json(
+                    os.path.join(cache_dir, f'{content_hash}.json'),
+                    {'version': CACHE_VERSION, 'sheets': sheet_names},
+                )
+
+        sheet_name = _resolve_sheet(sheet_names, candidates, fallback)
+        if sheet_name is None:
+            raise ValueError(f'Не е намерен sheet {list(candidates)} в {os.path.basename(path)}')
+
+        frame_path = _frame_cache_path(cache_dir, content_hash, sheet_name, skiprows, dtype_plan) if content_hash else None
+        if frame_path and os.path.exists(frame_path):
+            try:
+                df = pd.read_pickle(frame_path)
+                os.utime(frame_path)
+                log(f"ℹ Използван кеширан резултат за sheet '{sheet_name}'")
+                return df, sheet_name
+            except Exception:
+                pass
+
+        if xls is None:
+            xls = pd.ExcelFile(path, engine=engine)
+        df = apply_dtype_plan(parse_excel_sheet(xls, sheet_name, skiprows, dtype_plan), dtype_plan, log)
+
+        if frame_path:
+            tmp_path = f'{frame_path}.tmp'
+            try:
+                df.to_pickle(tmp_path)
+                os.replace(tmp_path, frame_path)
+                _enforce_cache_size(cache_dir, config.get('cache_max_mb', 0))
+            except Exception as e:
+                log(f'⚠ Неуспешен запис в кеша: {e}')
+        return df, sheet_name
+    finally:
+        if xls is not None:
+            xls.close()
+
+
+def is_manifest_file(path):
+    return str(path).lower().endswith(MANIFEST_SUFFIX)
+
+
+def read_import_sheet(path, candidates, log, config=CONFIG, skiprows=0, fallback=0, dtype_plan=None, kind=None):
+    if not is_manifest_file(path):
+        return read_excel_sheet(path, candidates, log, config, skiprows=skiprows, fallback=fallback, dtype_plan=dtype_plan)
+
+    manifest = read_json(path, None)
+    if not manifest or not manifest.get('shards'):
+        raise ValueError(f'Невалиден манифест: {os.path.basename(path)}')
+    if kind and manifest.get('kind') not in (None, kind):
+        raise ValueError(f"Манифестът е за '{manifest['kind']}', а не за '{kind}'")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    sheet_candidates = [manifest['sheet']] + list(candidates) if manifest.get('sheet') else list(candidates)
+    frames = []
+    for shard in manifest['shards']:
+        shard_path = os.path.join(base_dir, shard['file'])
+        if not os.path.exists(shard_path):
+            raise ValueError(f"Липсва част от експорта: {shard['file']}")
+        df, sheet_name = read_excel_sheet(shard_path, sheet_candidates, log, config, fallback=None, dtype_plan=dtype_plan)
+        if 'rows' in shard and len(df) != shard['rows']:
+            log(f"⚠ {shard['file']}: {len(df)} реда, очаквани {shard['rows']}")
+        frames.append(df)
+
+    log(f"✓ Заредени {len(frames)} части от {os.path.basename(path)}")
+    return compact_frame(pd.concat(frames, ignore_index=True), dtype_plan), sheet_name